@@ -0,0 +1,98 @@
+import logging
+
+import requests
+from gevent import Greenlet, Timeout
+from gevent.queue import Queue
+
+from common.cache import TTLCache
+from common.models import db, User
+from common.profiler import QueryProfiler
+
+
+class AvatarRefresher(Greenlet):
+    """Worker refreshing the Steam avatars of the users, grouping the requests in batches.
+
+    Steam IDs received within `BATCH_DELAY` are fetched with a single `GetPlayerSummaries` call over a pooled HTTP
+    session. Users refreshed recently are skipped.
+
+    Attributes:
+        app: Flask application used to access the database.
+        api_url: base URL of the Steam Web API.
+        api_key: key of the Steam Web API.
+        session: `requests.Session` keeping the HTTP connections alive.
+        pending: `Queue` of the Steam IDs to refresh.
+        refreshed: `TTLCache` of the avatar URLs indexed by Steam ID, during the freshness window.
+    """
+
+    # Maximum number of Steam IDs per GetPlayerSummaries call
+    BATCH_SIZE = 100
+
+    # Seconds to wait for more Steam IDs before calling the API
+    BATCH_DELAY = 2
+
+    def __init__(self, app):
+        """Create the refresher of an application.
+
+        Args:
+            app: Flask application the refresher is linked to.
+        """
+        Greenlet.__init__(self)
+        self.app = app
+        self.api_url = app.config['STEAM_API_URL']
+        self.api_key = app.config['STEAM_KEY']
+        self.session = requests.Session()
+        self.pending = Queue()
+        self.refreshed = TTLCache(app.config['AVATAR_FRESHNESS'], max_size=100000)
+
+    def add(self, steam_ids):
+        """Request the refresh of users.
+
+        Args:
+            steam_ids: `list` of Steam user ids (as 64 bits).
+        """
+        for steam_id in steam_ids:
+            self.pending.put(steam_id)
+
+    def _run(self):
+        """Main loop of the refresher, processing a batch as soon as it is full or its delay expired."""
+        while True:
+            batch = {self.pending.get()}
+            try:
+                with Timeout(self.BATCH_DELAY):
+                    while len(batch) < self.BATCH_SIZE:
+                        batch.add(self.pending.get())
+            except Timeout:
+                pass
+
+            batch = [steam_id for steam_id in batch if self.refreshed.get(steam_id) is None]
+            if len(batch) == 0:
+                continue
+            try:
+                self.refresh(batch)
+            except Exception:
+                logging.exception('Impossible to refresh %s avatars.', len(batch))
+
+    def refresh(self, steam_ids):
+        """Fetch the avatars of users and save them in the database.
+
+        Args:
+            steam_ids: `list` of at most `BATCH_SIZE` Steam user ids (as 64 bits).
+        """
+        response = self.session.get(self.api_url + '/ISteamUser/GetPlayerSummaries/v2/',
+                                    params={'key': self.api_key, 'steamids': ','.join(str(i) for i in steam_ids)},
+                                    timeout=10)
+        response.raise_for_status()
+
+        avatars = {}
+        for player in response.json()['response']['players']:
+            avatars[int(player['steamid'])] = (player['avatar'], player['avatarmedium'], player['avatarfull'])
+
+        with self.app.app_context():
+            QueryProfiler.name_unit('bot.avatars')
+            for user in User.query.filter(User.id.in_(list(avatars))).all():
+                user.avatar, user.avatar_medium, user.avatar_full = avatars[user.id]
+            db.session.commit()
+
+        for steam_id, avatar in avatars.items():
+            self.refreshed.set(steam_id, avatar)
+        logging.info('%s avatars refreshed.', len(avatars))
@@ -1,11 +1,27 @@
+from gevent import monkey
+monkey.patch_all()
+from psycogreen.gevent import patch_psycopg
+patch_psycopg()  # Database queries yield to the other bots instead of blocking the process
+
 import logging
-import pickle
 import random
-from gevent import Greenlet, sleep
+from time import time
+from gevent import Greenlet, spawn, spawn_later, sleep
+from gevent.pywsgi import WSGIServer
+from gevent.event import Event
+from gevent.queue import Queue
+
+from steam import SteamClient
+import dota2
 
 from bot.dota_bot import DotaBot
+from bot.avatar_refresher import AvatarRefresher
+from bot.fake_clients import FakeSteamClient, FakeDota2Client
 from web.web_application import create_app
-from common.job_queue import QueueAdapter
+from common.job_queue import make_job_queue, JobRefreshAvatars
+from common.models import pool_statistics, Setting
+from common.profiler import QueryProfiler, PROFILER_SETTING
+import common.metrics as metrics
 
 # Log
 logging.basicConfig(format='[%(asctime)s] %(levelname)s %(message)s', level=logging.INFO)
@@ -31,29 +47,52 @@ class Credential:
 
 
 class DazzarWorkerManager(Greenlet):
-    """Master class starting Dota bots to process jobs.
+    """Master class managing a pool of Dota bots to process jobs.
 
-    The manager contains a initial pool of Steam Credentials.
-    It is a thread listening to the job queue, starting new Dota bots when a new job is available.
-    After a job process, the Dota bot informs that the credentials are available again.
+    The manager starts one Dota bot per Steam Credential, each bot keeping its Steam session logged in between jobs.
+    It is a thread receiving the jobs pushed by the job queue, dispatching them to free bots when available.
+    The queue delivers at most one unacknowledged job per credential, a job being acknowledged once assigned.
+    After a job process, the Dota bot informs that it is free again. A bot stopped by an error is replaced.
 
     Attributes:
         app: The flask application the manager is linked to, containing configuration objects and database access.
+        credentials: `list` of all the Steam `Credential`, one bot is started for each.
+        bots: `dict` of all Dota bots, indexed by bot login.
+        free_bots: `list` of Dota bots waiting for a job.
         working_bots: A dictionary of all currently working Dota bots, indexed by bot login.
+        pending_jobs: `Queue` of the jobs received, waiting for a free bot.
+        bot_free: `Event` set while at least one bot is free.
+        avatar_refresher: `AvatarRefresher` processing the avatar refresh jobs.
+        profiler: `QueryProfiler` of the database queries of the bots.
     """
 
-    def __init__(self):
+    # Seconds before replacing a bot stopped by an error
+    BOT_RESTART_DELAY = 10
+
+    def __init__(self, job_queue=None):
         """Initialize the worker manager thread.
 
         Fetch credentials from config and connects to the job queue.
+
+        Args:
+            job_queue: `QueueAdapter` to receive the jobs from, the one of the configuration if None.
         """
         Greenlet.__init__(self)
 
         # Initialize
         self.app = create_app()
+        self.profiler = QueryProfiler(self.app, self.app.config['QUERY_PROFILER'],
+                                      self.app.config['SLOW_QUERY_THRESHOLD'])
+        self.bots = {}
+        self.free_bots = []
         self.working_bots = {}
         self.credentials = []
-        self.queue = QueueAdapter(self.app.config['RABBITMQ_LOGIN'], self.app.config['RABBITMQ_PASSWORD'])
+        self.pending_jobs = Queue()
+        self.bot_free = Event()
+        self.avatar_refresher = AvatarRefresher(self.app)
+        self.queue = job_queue if job_queue is not None else make_job_queue(self.app)
+        metrics.BOTS.function = self.bot_states
+        metrics.PENDING_JOBS.function = self.pending_jobs.qsize
 
         # Parse credentials from config
         for i in range(0, self.app.config['STEAM_CREDENTIAL_COUNT']):
@@ -61,31 +100,147 @@ class DazzarWorkerManager(Greenlet):
             password = self.app.config['STEAM_BOT{0}_PASSWORD'.format(i)]
             self.credentials.append(Credential(login, password))
 
+    def make_clients(self):
+        """Create the clients used by a Dota bot to talk to Steam.
+
+        Returns:
+            A tuple (steam_client, dota_client), fake clients if STEAM_FAKE_CLIENT is set in the configuration.
+        """
+        if self.app.config['STEAM_FAKE_CLIENT']:
+            steam_client = FakeSteamClient()
+            return steam_client, FakeDota2Client(steam_client)
+        steam_client = SteamClient()
+        return steam_client, dota2.Dota2Client(steam_client)
+
     def _run(self):
-        """Start the main loop of the thread, creating Dota bots to process available jobs."""
+        """Start the bot pool and the main loop of the thread, receiving jobs pushed by the job queue."""
+        for credential in self.credentials:
+            self.start_bot(credential)
+        self.avatar_refresher.start()
+
+        spawn(self.dispatch_jobs)
+        spawn(self.monitor)
+        if self.app.config['BOT_METRICS_PORT'] != 0:
+            WSGIServer((self.app.config['BOT_METRICS_HOST'], self.app.config['BOT_METRICS_PORT']),
+                       metrics.metrics_application, log=None).start()
+        self.queue.subscribe(self.job_received, prefetch=len(self.credentials))
         while True:
-            self.queue.refresh()  # Ensure that the queue connection is not closed.
+            self.queue.process_events(timeout=30)  # Also ensure that the queue connection is not closed.
 
-            if len(self.credentials) != 0:
-                job = self.queue.consume()
-                if job is not None:
-                    # Process the job with a new Dota bot
-                    credential = self.credentials.pop(random.randint(0, len(self.credentials) - 1))
-                    g = DotaBot(worker_manager=self, credential=credential, job=job)
-                    g.start()
-                    self.working_bots[credential.login] = g
+    def start_bot(self, credential):
+        """Start a Dota bot for a Steam account, free to process jobs.
 
-                    self.queue.ack_last()
-            sleep(1)
+        Args:
+            credential: `Credential` of the bot.
+        """
+        bot = DotaBot(worker_manager=self, credential=credential)
+        bot.link_exception(self.bot_died)
+        self.bots[credential.login] = bot
+        self.free_bots.append(bot)
+        self.bot_free.set()
+        bot.start()
 
-    def bot_end(self, credential):
-        """Signal that a bot has finished it work and the credential is free to use again.
+    def bot_died(self, bot):
+        """Callback of a Dota bot stopped by an error, replacing it after some time.
 
         Args:
-            credential: `Credential` of the bot.
+            bot: `DotaBot` stopped.
         """
-        self.working_bots.pop(credential.login)
-        self.credentials.append(credential)
+        login = bot.credential.login
+        logging.error('Bot %s stopped by %r, restarting it in %ss.', login, bot.exception, self.BOT_RESTART_DELAY)
+        if bot in self.free_bots:
+            self.free_bots.remove(bot)
+            if len(self.free_bots) == 0:
+                self.bot_free.clear()
+        if self.working_bots.get(login) is bot:
+            self.working_bots.pop(login)
+        if not bot.jobs.empty():
+            logging.error('Job %s of bot %s lost.', type(bot.jobs.peek()[0]).__name__, login)
+        spawn_later(self.BOT_RESTART_DELAY, self.start_bot, bot.credential)
+
+    def monitor(self):
+        """Loop logging the usage of the database pool, and following the query profiler state chosen by the admins."""
+        while True:
+            sleep(60)
+            try:
+                with self.app.app_context():
+                    self.profiler.name_unit('bot.monitor')
+                    logging.info('Database pool: %s', pool_statistics())
+                    setting = Setting.query.filter_by(name=PROFILER_SETTING).first()
+                    if setting is not None:
+                        self.profiler.enabled = setting.value == '1'
+            except Exception:
+                logging.exception('Monitoring failed, retrying in 60s.')
+
+    def job_received(self, job, delivery_tag):
+        """Callback of the job queue, keep the job until a bot is free.
+
+        Args:
+            job: `Job` received.
+            delivery_tag: tag to acknowledge the job in the queue.
+        """
+        self.pending_jobs.put((job, delivery_tag, time()))
+
+    def dispatch_jobs(self):
+        """Loop giving the received jobs to the free bots, acknowledging them once assigned."""
+        while True:
+            job, delivery_tag, received = self.pending_jobs.get()
+            if isinstance(job, JobRefreshAvatars):
+                # Web API calls, no Steam session needed
+                self.avatar_refresher.add(job.steam_ids)
+                self.queue.ack(delivery_tag)
+                continue
+            self.bot_free.wait()
+
+            # Process the job with a free Dota bot, logged in if possible
+            bot = self.pick_free_bot()
+            self.working_bots[bot.credential.login] = bot
+            bot.assign(job)
+            self.queue.ack(delivery_tag)
+
+            metrics.JOB_DISPATCH_SECONDS.observe(time() - received)
+            logging.info('Job dispatched to %s in %.3fs.', bot.credential.login, time() - received)
+
+    def pick_free_bot(self):
+        """Remove a bot from the free bots, favoring bots with a ready Dota session.
+
+        Returns:
+            The `DotaBot` chosen.
+        """
+        ready_bots = [bot for bot in self.free_bots if bot.dota_ready_event.is_set()]
+        if len(ready_bots) != 0:
+            bot = random.choice(ready_bots)
+        else:
+            bot = random.choice(self.free_bots)
+        self.free_bots.remove(bot)
+        if len(self.free_bots) == 0:
+            self.bot_free.clear()
+        return bot
+
+    def bot_states(self):
+        """Count the bots by state, for the metrics.
+
+        Returns:
+            `dict` of the number of bots indexed by tuple (state,), 'free', 'working' or 'ready'.
+        """
+        ready = len([bot for bot in self.bots.values() if bot.dota_ready_event.is_set()])
+        return {('free',): len(self.free_bots), ('working',): len(self.working_bots), ('ready',): ready}
+
+    def bot_end(self, bot, job, warm, duration):
+        """Signal that a bot has finished its job and is free to process a new one.
+
+        Args:
+            bot: `DotaBot` free again.
+            job: `Job` processed.
+            warm: `Boolean` True iff the bot session was ready when the job was assigned.
+            duration: duration of the job in seconds, from the assignment to the end.
+        """
+        self.working_bots.pop(bot.credential.login, None)
+        self.free_bots.append(bot)
+        self.bot_free.set()
+
+        metrics.JOB_SECONDS.observe(duration, job=type(job).__name__, session='warm' if warm else 'cold')
+        logging.info('Job done in %.1fs with a %s session.', duration, 'warm' if warm else 'cold')
 
 
 # Start a Manager if this file is the main script.
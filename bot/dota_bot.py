@@ -1,58 +1,62 @@
 import logging
-from gevent import Greenlet, sleep
+from contextlib import contextmanager
+from time import time
+from gevent import Greenlet, Timeout, getcurrent
+from gevent.event import Event, AsyncResult
+from gevent.pool import Pool
+from gevent.queue import Queue
 from datetime import datetime, timedelta
 
-from sqlalchemy.orm import joinedload_all
-from steam import SteamClient, SteamID
+from steam import SteamID
 import dota2
 from dota2.enums import DOTA_GC_TEAM, EMatchOutcome
 
 from web.web_application import create_app
-from common.models import db, User, Match, PlayerInMatch, Scoreboard
-from common.job_queue import Job, JobScan, JobCreateGame
+from common.models import db, load_profile, User, Match, PlayerInMatch, Scoreboard, ProfileScanInfo
+from common.scoring import apply_match_contributions
+from common.profiler import QueryProfiler
+from common.job_queue import Job, JobScan, JobScanBatch, JobCreateGame
 import common.constants as constants
+import common.metrics as metrics
 
 
 class DotaBot(Greenlet):
-    """A worker thread, connecting to steam to process a unique job.
+    """A worker thread, keeping a Steam session logged in to process jobs one after another.
 
     Attributes:
         worker_manager: `DazzarWorkerManager` this bot is linked to.
         credential: `Credential` used to connect to steam.
+        jobs: `Queue` of the jobs assigned to the bot, with their assignment time and session state.
+        dota_ready_event: `Event` set while the Dota application is ready to process jobs.
+        job_done: `Event` set when the current job is finished.
+        job_greenlet: `Greenlet` running the callbacks of the current game, stopped if the job is abandoned.
+        session_lost: `Boolean` True iff the Steam or Dota session was lost during the current job.
+        lobby_changed: `Event` set when a new lobby status is received.
+        phase_started: time of the start of the current phase of the bot, measured in the metrics.
     """
 
-    def __init__(self, worker_manager, credential, job):
-        """Initialize the Dota bot thread for a unique job process.
+    def __init__(self, worker_manager, credential):
+        """Initialize the Dota bot thread for a Steam account.
 
         Args:
             worker_manager: `DazzarWorkerManager` this bot is linked to.
             credential: `Credential` used to connect to steam.
-            job: `Job` to process by the bot.
         """
         Greenlet.__init__(self)
 
         self.credential = credential
         self.worker_manager = worker_manager
-        self.job = job
+        self.job = None
+        self.phase_started = time()
 
-        self.client = SteamClient()
-        self.dota = dota2.Dota2Client(self.client)
+        self.client, self.dota = self.worker_manager.make_clients()
         self.app = self.worker_manager.app
 
-        self.job_started = False
-        self.game_creation_call = False
-        self.job_finished = False
-
-        self.match = None
-        self.players = None
-
-        self.game_status = None
-        self.lobby_channel_id = None
-        self.invite_timer = None
-        self.missing_players = None
-        self.missing_players_count = None
-        self.wrong_team_players = None
-        self.wrong_team_players_count = None
+        self.jobs = Queue()
+        self.dota_ready_event = Event()
+        self.job_done = Event()
+        self.lobby_changed = Event()
+        self.reset_job_state()
 
         # Prepare all event handlers
         # - Steam client events
@@ -60,6 +64,7 @@ class DotaBot(Greenlet):
         # - Dazzar bot events
         self.client.on('connected', self.steam_connected)
         self.client.on('logged_on', self.steam_logged)
+        self.client.on('disconnected', self.steam_disconnected)
 
         self.dota.on('ready', self.dota_ready)
         self.dota.on('notready', self.closed_dota)
@@ -71,19 +76,104 @@ class DotaBot(Greenlet):
         self.dota.on(dota2.features.Chat.EVENT_CHANNEL_JOIN, self.channel_join)
         self.dota.on(dota2.features.Chat.EVENT_CHANNEL_MESSAGE, self.channel_message)
 
+    def reset_job_state(self):
+        """Forget all information about the previous job."""
+        self.game_creation_call = False
+        self.job_greenlet = None
+        self.session_lost = False
+        self.pending_scans = {}
+
+        self.match = None
+        self.players = None
+
+        self.game_status = None
+        self.lobby_members = None
+        self.lobby_channel_id = None
+        self.invite_timer = None
+        self.missing_players = None
+        self.missing_players_count = None
+        self.wrong_team_players = None
+        self.wrong_team_players_count = None
+
     def _run(self):
-        """Start the main loop of the thread, connecting to Steam, waiting for the job to finish to close the bot."""
+        """Start the main loop of the thread, connecting to Steam then processing the assigned jobs one by one."""
         self.print_info('Connecting to Steam...')
+        self.phase_started = time()
         self.client.connect(retry=None)  # Try connecting with infinite retries
 
-        while not self.job_finished:
-            sleep(10)
+        while True:
+            job, assigned, warm = self.jobs.get()
+            timeout = self.job_timeout(job)
+            deadline = time() + timeout
+            try:
+                if not self.dota_ready_event.wait(timeout):
+                    self.print_error('Dota not ready after %ss, job abandoned.' % timeout)
+                    self.abandon_job(job)
+                    continue
 
-        self.client.disconnect()
-        self.worker_manager.bot_end(self.credential)
+                self.reset_job_state()
+                self.job = job
+                self.job_done.clear()
+                self.compute_job()
+                if not self.job_done.wait(max(deadline - time(), 0)):
+                    self.print_error('Job not finished after %ss, abandoned.' % timeout)
+                    self.abandon_job(job)
+            except Exception:
+                logging.exception('%s: job %s failed.', self.credential.login, type(job).__name__)
+                self.abandon_job(job)
+            finally:
+                self.job = None
+                self.worker_manager.bot_end(self, job, warm, time() - assigned)
+
+    def job_timeout(self, job):
+        """Maximum duration of a job, after which it is abandoned.
+
+        Args:
+            job: `Job` to process.
+        Returns:
+            Number of seconds, from BOT_GAME_JOB_TIMEOUT for a game, BOT_JOB_TIMEOUT otherwise.
+        """
+        if type(job) is JobCreateGame:
+            return self.app.config['BOT_GAME_JOB_TIMEOUT']
+        return self.app.config['BOT_JOB_TIMEOUT']
+
+    def abandon_job(self, job):
+        """Stop a job which failed or did not end in time, cancelling its game if any. Errors are only logged.
+
+        Args:
+            job: `Job` abandoned.
+        """
+        try:
+            if self.job_greenlet is not None and self.job_greenlet is not getcurrent():
+                self.job_greenlet.kill()
+            self.job_greenlet = None
+            if type(job) is JobCreateGame:
+                self.dota.leave_practice_lobby()
+                self.cancel_game(job.match_id)
+        except Exception:
+            logging.exception('%s: impossible to abandon job %s.', self.credential.login, type(job).__name__)
+
+    def assign(self, job):
+        """Give a new job to process to the bot.
+
+        Args:
+            job: `Job` to process by the bot.
+        """
+        self.jobs.put((job, time(), self.dota_ready_event.is_set()))
 
     # Helpers
 
+    @contextmanager
+    def db_context(self, phase):
+        """Application context to access the database during a phase of a job, named after it in the query profile.
+
+        Args:
+            phase: `str` name of the phase.
+        """
+        with self.app.app_context():
+            QueryProfiler.name_unit('bot.' + phase)
+            yield
+
     def print_info(self, trace):
         """Wrapper of `logging.info` with bot name prefix.
 
@@ -100,36 +190,58 @@ class DotaBot(Greenlet):
         """
         logging.error("%s: %s", self.credential.login, trace)
 
+    def end_phase(self, phase):
+        """Record the duration of a phase of the bot in the metrics, the next phase starting now.
+
+        Args:
+            phase: `str` name of the phase ended.
+        """
+        now = time()
+        metrics.BOT_PHASE_SECONDS.observe(now - self.phase_started, phase=phase)
+        self.phase_started = now
+
     # Callback of Steam and Dota clients
 
     def steam_connected(self):
         """Callback fired when the bot is connected to Steam, login user."""
         self.print_info('Connected to Steam.')
+        self.end_phase('connect')
         self.client.login(self.credential.login, self.credential.password)
 
     def steam_logged(self):
         """Callback fired when the bot is logged into Steam, starting Dota."""
         self.print_info('Logged to Steam.')
+        self.end_phase('login')
         self.dota.launch()
 
+    def steam_disconnected(self):
+        """Callback fired when the bot loses its Steam connection, reconnecting."""
+        self.print_info('Disconnected from Steam, reconnecting...')
+        self.dota_ready_event.clear()
+        self.session_lost = True
+        self.lobby_changed.set()
+        self.phase_started = time()
+        self.client.reconnect(maxdelay=30)
+
     def dota_ready(self):
-        """Callback fired when the Dota application is ready, resume the job processing."""
+        """Callback fired when the Dota application is ready, jobs can be processed."""
         self.print_info('Dota application is ready.')
-        self.compute_job()
+        self.end_phase('gc_ready')
+        self.dota_ready_event.set()
 
     def closed_dota(self):
         """Callback fired when the Dota application is closed."""
         self.print_info('Dota application is closed.')
+        self.dota_ready_event.clear()
+        self.session_lost = True
+        self.lobby_changed.set()
+        self.phase_started = time()
 
     def compute_job(self):
         """Start the processing of the job with the appropriate handler."""
         self.print_info('Processing new job of type %s' % type(self.job))
-        if not self.job_started :
-            self.job_started = True
-        else:
-            return
 
-        if type(self.job) is JobScan:
+        if type(self.job) in [JobScan, JobScanBatch]:
             self.scan_profile()
         elif type(self.job) is JobCreateGame:
             self.vip_game()
@@ -137,10 +249,10 @@ class DotaBot(Greenlet):
             self.end_job_processing()
 
     def end_job_processing(self):
-        """Mark the job as finished, preparing the bot to close."""
+        """Mark the job as finished, the bot is ready for the next one."""
         self.print_info('Job ended.')
         self.job = None
-        self.job_finished = True
+        self.job_done.set()
 
     def channel_join(self, channel_info):
         if channel_info.channel_type != dota2.enums.DOTAChatChannelType_t.DOTAChannelType_Lobby:
@@ -158,26 +270,64 @@ class DotaBot(Greenlet):
     ############################
 
     def scan_profile(self):
-        """Start the process of the job as a profile scan, request the information from Steam."""
-        while not self.job.scan_finish:
-            self.print_info('Requesting profile for user %s' % self.job.steam_id)
-            user = SteamID(self.job.steam_id)
-            self.dota.request_profile_card(user.as_32)
+        """Start the process of the job as a profile scan, request the information from Steam.
 
-            # We give the task 30 sec to finish or retry
-            sleep(30)
+        A `JobScan` is processed as a batch of a single profile.
+        """
+        if type(self.job) is JobScan:
+            steam_ids = [self.job.steam_id]
+        else:
+            steam_ids = self.job.steam_ids
+
+        try:
+            self.pending_scans = {}
+            pool = Pool(self.app.config['SCAN_CONCURRENCY'])
+            results = pool.map(self.request_profile, steam_ids)
+            self.pending_scans = {}
 
-        if self.job.scan_finish:
+            self.save_profiles(results)
+        finally:
             self.end_job_processing()
 
+    def request_profile(self, steam_id):
+        """Request the profile card of a user, with retries if Steam does not answer in time.
+
+        Args:
+            steam_id: Steam user id (as 64 bits) to scan.
+        Returns:
+            A tuple (steam_id, solo_mmr) with the solo MMR of the profile (None if hidden),
+            or (steam_id, False) if Steam never answered.
+        """
+        account_id = SteamID(steam_id).as_32
+        for attempt in range(0, self.app.config['SCAN_RETRIES']):
+            self.print_info('Requesting profile for user %s' % steam_id)
+            result = AsyncResult()
+            self.pending_scans[account_id] = result
+            self.dota.request_profile_card(account_id)
+            try:
+                return steam_id, result.get(timeout=self.app.config['SCAN_TIMEOUT'])
+            except Timeout:
+                self.print_error('No profile received for user %s.' % steam_id)
+        return steam_id, False
+
     def scan_player_info(self, message):
+        """Callback fired when Steam answers with the player information instead of a profile card.
+
+        The scans of the players answered are ended without MMR, as a hidden profile.
+
+        Args:
+            message: player information as a protobuff message.
+        """
         self.print_info(message)
-        self.job.scan_finish = True
+        for player_info in message.player_infos:
+            result = self.pending_scans.get(player_info.account_id)
+            if result is not None and not result.ready():
+                result.set(None)
 
     def scan_profile_result(self, account_id, profile_card):
         """Process the profile information returned by Steam.
 
-        Extract the SoloMMR from the profile and insert the user in the good ladder.
+        Extract the SoloMMR from the profile and hand it to the pending request.
 
         Args:
             account_id: steam_id (as 32bits) of the profile result
@@ -192,22 +342,39 @@ class DotaBot(Greenlet):
                 continue
             solo_mmr = int(slot.stat.stat_score)
 
-        with self.app.app_context():
-            user = User.query.filter_by(id=self.job.steam_id).first()
-            user.profile_scan_info.last_scan = datetime.utcnow()
-            if solo_mmr is not None:
-                user.solo_mmr = solo_mmr
+        result = self.pending_scans.get(account_id)
+        if result is not None and not result.ready():
+            result.set(solo_mmr)
 
-            if user.solo_mmr is None:
-                user.section = None
-            else:
-                if user.solo_mmr > 4500:
-                    user.section = constants.LADDER_HIGH
+    def save_profiles(self, results):
+        """Update the scanned users in a single transaction, inserting them in the good ladder.
+
+        Args:
+            results: `list` of tuple (steam_id, solo_mmr) from `request_profile`.
+        """
+        scanned = {steam_id: solo_mmr for steam_id, solo_mmr in results if solo_mmr is not False}
+        if len(scanned) == 0:
+            return
+
+        with self.db_context('scan'):
+            for user in User.query.filter(User.id.in_(list(scanned.keys()))) \
+                    .options(*load_profile('user_with_scan_info')).all():
+                if user.profile_scan_info is None:
+                    user.profile_scan_info = ProfileScanInfo(user)
+                user.profile_scan_info.last_scan = datetime.utcnow()
+                if scanned[user.id] is not None:
+                    user.solo_mmr = scanned[user.id]
+
+                if user.solo_mmr is None:
+                    user.section = None
                 else:
-                    user.section = constants.LADDER_LOW
+                    if user.solo_mmr > 4500:
+                        user.section = constants.LADDER_HIGH
+                    else:
+                        user.section = constants.LADDER_LOW
 
             db.session.commit()
-        self.job.scan_finish = True
+        self.print_info('%s profiles updated.' % len(scanned))
 
     ########################
     # VIP game job section #
@@ -218,7 +385,7 @@ class DotaBot(Greenlet):
         self.print_info('Hosting game %s' % self.job.match_id)
 
         # Copy the match data from the database
-        with self.app.app_context():
+        with self.db_context('create_game'):
             self.match = Match.query.filter_by(id=self.job.match_id).first()
             if self.match is None or self.match.status != constants.MATCH_STATUS_CREATION:
                 self.dota.leave_practice_lobby()
@@ -226,7 +393,7 @@ class DotaBot(Greenlet):
             else:
                 self.players = {}
                 for player in PlayerInMatch.query.\
-                    options(joinedload_all('player')).\
+                    options(*load_profile('player_with_user')).\
                     filter(PlayerInMatch.match_id == self.job.match_id).\
                     all():
                     self.players[player.player_id] = player
@@ -249,9 +416,14 @@ class DotaBot(Greenlet):
 
         if self.job is None or not self.game_creation_call:
             self.dota.leave_practice_lobby()
-        else:
+            return
+
+        self.job_greenlet = getcurrent()
+        try:
+            self.phase_started = time()
             self.initialize_lobby()
             start = self.manage_player_waiting()
+            self.end_phase('lobby_wait')
 
             if not start:
                 self.dota.send_message(self.lobby_channel_id, 'Annulation de la partie.')
@@ -260,15 +432,24 @@ class DotaBot(Greenlet):
                 self.dota.send_message(self.lobby_channel_id, 'Tous les joueurs sont présents.')
                 self.start_game()
 
-                # Waiting PostGame = 3 or UI = 0 (means no loading)
-                while self.game_status.state != 0 and self.game_status.state != 3:
-                    sleep(5)
+                # Waiting PostGame = 3 or UI = 0 (means no loading), at most the duration of a game
+                over = self.wait_lobby(lambda status: self.session_lost or status.state == 0 or status.state == 3,
+                                       timeout=self.app.config['GAME_MAX_DURATION'])
+                self.end_phase('game')
 
-                if self.game_status.state == 0:
+                if not over or self.session_lost:
+                    # Result unknown, the lobby is lost or the game never ends
+                    self.print_error('Game %s not followed to the end.' % self.job.match_id)
+                    self.cancel_game(self.job.match_id)
+                elif self.game_status.state == 0:
                     self.process_game_dodge()
                 elif self.game_status.state == 3:
                     self.process_endgame_results()
-
+        except Exception:
+            logging.exception('%s: game %s failed.', self.credential.login, self.job.match_id)
+            self.cancel_game(self.job.match_id)
+        finally:
+            self.job_greenlet = None
             if self.lobby_channel_id is not None:
                 self.dota.leave_channel(self.lobby_channel_id)
                 self.lobby_channel_id = None
@@ -277,8 +458,28 @@ class DotaBot(Greenlet):
             self.end_job_processing()
 
     def game_update(self, message):
-        """Callback fired when the game lobby change, update local information."""
+        """Callback fired when the game lobby change, update local information and wake up the lobby waits."""
         self.game_status = message
+        self.lobby_changed.set()
+
+    def wait_lobby(self, condition, timeout=None):
+        """Wait for the lobby to reach a specific state.
+
+        Args:
+            condition: function taking the lobby status, returning True when the wait is over.
+            timeout: maximum number of seconds to wait, None to wait forever.
+        Returns:
+            `Boolean` True iff the condition is met, False if the timeout expired before.
+        """
+        end = None if timeout is None else time() + timeout
+        while True:
+            self.lobby_changed.clear()
+            if condition(self.game_status):
+                return True
+            remaining = None if end is None else end - time()
+            if remaining is not None and remaining <= 0:
+                return False
+            self.lobby_changed.wait(remaining)
 
     def initialize_lobby(self):
         """Setup the game lobby with the good options, and change status in database."""
@@ -304,7 +505,7 @@ class DotaBot(Greenlet):
             'pause_setting': 1
         }
         self.dota.config_practice_lobby(options=options)
-        with self.app.app_context():
+        with self.db_context('initialize_lobby'):
             match = Match.query.filter_by(id=self.job.match_id).first()
             match.status = constants.MATCH_STATUS_WAITING_FOR_PLAYERS
             db.session.commit()
@@ -322,10 +523,8 @@ class DotaBot(Greenlet):
         while self.invite_timer != timedelta(0):
             for player in self.missing_players:
                 self.dota.invite_to_lobby(player)
-            sleep(refresh_rate)
-            self.compute_player_status()
 
-            if len(self.missing_players) == 0 and len(self.wrong_team_players) == 0:
+            if self.wait_lobby(self.players_placed, timeout=refresh_rate):
                 return True
             else:
                 if self.invite_timer.seconds != 0 and self.invite_timer.seconds % 60 in [0, 30]:
@@ -337,13 +536,29 @@ class DotaBot(Greenlet):
                 self.invite_timer = self.invite_timer - timedelta(seconds=refresh_rate)
         return False
 
+    def players_placed(self, game_status):
+        """Check if all players are in the lobby in their slot.
+
+        Args:
+            game_status: lobby status to check.
+        Returns:
+            `Boolean` True iff the game can start.
+        """
+        self.compute_player_status()
+        return len(self.missing_players) == 0 and len(self.wrong_team_players) == 0
+
     def compute_player_status(self):
         """Helpers to manage player status from protobuff message.
 
         Invite all missing players to come to the lobby.
         Kick all players not supposed to be inside a lobby.
         Kick from slots all players not in the good slot.
+        The kicks are only sent when the lobby members or their slots changed since the last call.
         """
+        members = frozenset((member.id, member.team, member.slot) for member in self.game_status.members)
+        kick = members != self.lobby_members
+        self.lobby_members = members
+
         self.missing_players = []
         self.missing_players_count = 0
         self.wrong_team_players = []
@@ -367,9 +582,9 @@ class DotaBot(Greenlet):
                 if not (good_team and good_slot):
                     self.wrong_team_players.append(message_player.id)
                     self.wrong_team_players_count += 1
-                    if message_player.team != DOTA_GC_TEAM.PLAYER_POOL:
+                    if kick and message_player.team != DOTA_GC_TEAM.PLAYER_POOL:
                         self.dota.practice_lobby_kick_from_team(SteamID(message_player.id).as_32)
-            else:
+            elif kick:
                 # Say: Kick joueur non authorisé message_player.name
                 self.dota.practice_lobby_kick(SteamID(message_player.id).as_32)
 
@@ -378,12 +593,13 @@ class DotaBot(Greenlet):
         self.print_info('Game %s cancelled because of dodge.' % self.job.match_id)
 
         # Say: Partie annulée - punish
-        with self.app.app_context():
+        with self.db_context('dodge'):
             match = Match.query.filter_by(id=self.job.match_id).first()
+            Scoreboard.lock_ladders([match.section])
             match.status = constants.MATCH_STATUS_CANCELLED
             self.compute_player_status()
             for player in PlayerInMatch.query. \
-                    options(joinedload_all('player')). \
+                    options(*load_profile('player_with_user')). \
                     filter(PlayerInMatch.match_id == self.job.match_id). \
                     all():
                 if player.player.current_match == self.job.match_id:
@@ -391,13 +607,26 @@ class DotaBot(Greenlet):
 
                 # Update Scoreboard
                 if player.player_id in self.missing_players or player.player_id in self.wrong_team_players:
-                    score = Scoreboard.query.filter_by(ladder_name=match.section, user_id=player.player_id).first()
-                    if score is None:
-                        score = Scoreboard(user=player.player, ladder_name=match.section)
-                        db.session.add(score)
                     player.is_dodge = True
-                    score.points -= 2
-                    score.dodge += 1
+            apply_match_contributions(match).update_ranks()
+            db.session.commit()
+
+    def cancel_game(self, match_id):
+        """Cancel a game which could not be played to the end, releasing its players without punishment.
+
+        Args:
+            match_id: ID of the `Match` to cancel, ignored if already over.
+        """
+        self.print_info('Game %s cancelled after an error.' % match_id)
+
+        with self.db_context('cancel'):
+            match = Match.query.filter_by(id=match_id).first()
+            if match is None or match.status in [constants.MATCH_STATUS_CANCELLED, constants.MATCH_STATUS_ENDED]:
+                return
+            match.status = constants.MATCH_STATUS_CANCELLED
+            match.server = None
+            for user in User.query.filter_by(current_match=match_id).all():
+                user.current_match = None
             db.session.commit()
 
     def start_game(self):
@@ -405,8 +634,8 @@ class DotaBot(Greenlet):
         self.print_info('Launching game %s' % self.job.match_id)
 
         self.dota.launch_practice_lobby()
-        sleep(10)
-        with self.app.app_context():
+        self.wait_lobby(lambda status: status.state != 0 and (status.connect or status.server_id), timeout=20)
+        with self.db_context('start_game'):
             match = Match.query.filter_by(id=self.job.match_id).first()
             match.status = constants.MATCH_STATUS_IN_PROGRESS
             if self.game_status.connect is not None and self.game_status.connect[0:1] == '=[':
@@ -414,14 +643,14 @@ class DotaBot(Greenlet):
             elif self.game_status.server_id is not None:
                 match.server = self.game_status.server_id
             db.session.commit()
-        sleep(10)
 
     def process_endgame_results(self):
         """After a game, process lobby results into database."""
         self.print_info('Game %s over.' % self.job.match_id)
 
-        with self.app.app_context():
+        with self.db_context('endgame'):
             match = Match.query.filter_by(id=self.job.match_id).first()
+            Scoreboard.lock_ladders([match.section])
             match.status = constants.MATCH_STATUS_ENDED
             match.server = None
             if self.game_status.match_outcome == 2:
@@ -433,7 +662,7 @@ class DotaBot(Greenlet):
 
             self.players = {}
             for player in PlayerInMatch.query. \
-                    options(joinedload_all('player')). \
+                    options(*load_profile('player_with_user')). \
                     filter(PlayerInMatch.match_id == self.job.match_id). \
                     all():
                 if player.player.current_match == self.job.match_id:
@@ -441,28 +670,7 @@ class DotaBot(Greenlet):
                 self.players[player.player_id] = player
 
             # Process scoreboard updates
-            for player_id, player in self.players.items():
-                score = Scoreboard.query.filter_by(ladder_name=match.section, user_id=player_id).first()
-                if score is None:
-                    score = Scoreboard(user=player.player, ladder_name=match.section)
-                    db.session.add(score)
-                score.matches += 1
-            for player in self.game_status.members:
-                if player.id == self.dota.steam_id:
-                    continue
-                id = player.id
-                score = Scoreboard.query.filter_by(ladder_name=match.section, user_id=id).first()
-                if (self.players[id].is_radiant and self.game_status.match_outcome == 2) or \
-                        (not self.players[id].is_radiant and self.game_status.match_outcome == 3):
-                    score.points += 1
-                    score.win += 1
-                elif (self.players[id].is_radiant and self.game_status.match_outcome == 3) or \
-                        (not self.players[id].is_radiant and self.game_status.match_outcome == 2):
-                    score.loss += 1
             for player in self.game_status.left_members:
-                score = Scoreboard.query.filter_by(ladder_name=match.section, user_id=player.id).first()
                 self.players[player.id].is_leaver = True
-                score.points -= 3
-                score.leave += 1
-
+            apply_match_contributions(match).update_ranks()
             db.session.commit()
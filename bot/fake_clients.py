@@ -0,0 +1,197 @@
+import random
+from collections import defaultdict
+
+import gevent
+import dota2
+from dota2.enums import DOTA_GC_TEAM
+
+
+class FakeEventEmitter:
+    """Minimal event emitter with the interface of the Steam clients, callbacks run in their own greenlet."""
+
+    def __init__(self):
+        self._callbacks = defaultdict(list)
+
+    def on(self, event, callback):
+        """Register a callback for an event.
+
+        Args:
+            event: event name.
+            callback: function called with the event arguments.
+        """
+        self._callbacks[event].append(callback)
+
+    def emit(self, event, *args):
+        """Fire an event, calling all registered callbacks.
+
+        Args:
+            event: event name.
+            args: arguments given to the callbacks.
+        """
+        for callback in self._callbacks[event]:
+            gevent.spawn(callback, *args)
+
+    def emit_later(self, delay, event, *args):
+        """Fire an event after some time.
+
+        Args:
+            delay: seconds to wait before firing the event.
+            event: event name.
+            args: arguments given to the callbacks.
+        """
+        gevent.spawn_later(delay, self.emit, event, *args)
+
+
+class FakeSteamClient(FakeEventEmitter):
+    """Offline stand-in of `steam.SteamClient`, simulating the connection and login delays.
+
+    Attributes:
+        connect_delay: seconds to connect to Steam.
+        login_delay: seconds to login into Steam.
+        connected: `Boolean` True iff the client is connected.
+    """
+
+    def __init__(self, connect_delay=1.0, login_delay=1.0):
+        FakeEventEmitter.__init__(self)
+        self.connect_delay = connect_delay
+        self.login_delay = login_delay
+        self.connected = False
+        self.steam_id = 76561190000000000 + random.randint(0, 999999)
+
+    def connect(self, retry=None):
+        self.connected = True
+        self.emit_later(self.connect_delay, 'connected')
+        return True
+
+    def reconnect(self, maxdelay=30):
+        return self.connect()
+
+    def login(self, username, password):
+        self.emit_later(self.login_delay, 'logged_on')
+
+    def disconnect(self):
+        self.connected = False
+        self.emit('disconnected')
+
+
+class FakeStat:
+    """Stat of a profile card slot."""
+
+    def __init__(self, stat_id, stat_score):
+        self.stat_id = stat_id
+        self.stat_score = stat_score
+
+
+class FakeSlot:
+    """Slot of a profile card, holding an optional stat."""
+
+    def __init__(self, stat):
+        self.stat = stat
+
+    def HasField(self, name):
+        return name == 'stat' and self.stat is not None
+
+
+class FakeProfileCard:
+    """Profile card message with a random solo MMR."""
+
+    def __init__(self):
+        self.slots = [FakeSlot(None), FakeSlot(FakeStat(1, random.randint(1000, 7000)))]
+
+
+class FakeLobbyMember:
+    """Member of a lobby message."""
+
+    def __init__(self, steam_id, team, slot):
+        self.id = steam_id
+        self.team = team
+        self.slot = slot
+        self.name = str(steam_id)
+
+
+class FakeLobby:
+    """Lobby message of a practice lobby, players stay in the pool since the fake has no team knowledge."""
+
+    def __init__(self, bot_steam_id):
+        self.lobby_id = random.randint(1, 2 ** 32)
+        self.state = 0
+        self.match_outcome = 0
+        self.connect = None
+        self.server_id = None
+        self.members = [FakeLobbyMember(bot_steam_id, DOTA_GC_TEAM.PLAYER_POOL, 0)]
+        self.left_members = []
+
+
+class FakeDota2Client(FakeEventEmitter):
+    """Offline stand-in of `dota2.Dota2Client`, answering profile requests and hosting empty lobbies.
+
+    Attributes:
+        steam: `FakeSteamClient` the client is running on.
+        launch_delay: seconds for the Dota application to be ready.
+        request_delay: seconds to answer a profile request.
+        game_duration: seconds between the launch and the end of a game.
+        lobby: `FakeLobby` currently hosted, None if no lobby.
+    """
+
+    def __init__(self, steam_client, launch_delay=2.0, request_delay=0.2, game_duration=2.0):
+        FakeEventEmitter.__init__(self)
+        self.steam = steam_client
+        self.launch_delay = launch_delay
+        self.request_delay = request_delay
+        self.game_duration = game_duration
+        self.lobby = None
+
+    @property
+    def steam_id(self):
+        return self.steam.steam_id
+
+    def launch(self):
+        self.emit_later(self.launch_delay, 'ready')
+
+    def request_profile_card(self, account_id):
+        self.emit_later(self.request_delay, 'profile_card', account_id, FakeProfileCard())
+
+    def create_practice_lobby(self, password='', options=None):
+        self.lobby = FakeLobby(self.steam_id)
+        self.emit_later(self.request_delay, dota2.features.Lobby.EVENT_LOBBY_NEW, self.lobby)
+
+    def config_practice_lobby(self, options):
+        pass
+
+    def invite_to_lobby(self, steam_id):
+        if self.lobby is not None and steam_id not in [member.id for member in self.lobby.members]:
+            self.lobby.members.append(FakeLobbyMember(steam_id, DOTA_GC_TEAM.PLAYER_POOL, 0))
+            self.emit_later(self.request_delay, dota2.features.Lobby.EVENT_LOBBY_CHANGED, self.lobby)
+
+    def launch_practice_lobby(self):
+        if self.lobby is not None:
+            self.lobby.state = 2
+            self.lobby.server_id = random.randint(1, 2 ** 32)
+            self.emit_later(self.request_delay, dota2.features.Lobby.EVENT_LOBBY_CHANGED, self.lobby)
+            gevent.spawn_later(self.game_duration, self._end_game, self.lobby)
+
+    def _end_game(self, lobby):
+        lobby.state = 3
+        lobby.match_outcome = random.choice([2, 3])
+        self.emit(dota2.features.Lobby.EVENT_LOBBY_CHANGED, lobby)
+
+    def leave_practice_lobby(self):
+        self.lobby = None
+
+    def join_practice_lobby_team(self, slot=1, team=DOTA_GC_TEAM.PLAYER_POOL):
+        pass
+
+    def practice_lobby_kick(self, account_id):
+        pass
+
+    def practice_lobby_kick_from_team(self, account_id):
+        pass
+
+    def join_lobby_channel(self):
+        pass
+
+    def leave_channel(self, channel_id):
+        pass
+
+    def send_message(self, channel_id, message):
+        pass
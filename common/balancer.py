@@ -0,0 +1,75 @@
+from itertools import combinations
+
+import numpy as np
+
+# Balancing strategies
+BALANCE_DIFFERENCE = 'difference'
+BALANCE_VARIANCE = 'variance'
+
+TEAM_SIZE = 5
+
+# All splits of 10 players in 2 teams, with player 0 always Radiant to skip mirrored splits: C(10,5)/2 = 126 rows.
+_SPLITS = np.zeros((126, 2 * TEAM_SIZE), dtype=bool)
+_SPLITS[:, 0] = True
+for _row, _mates in enumerate(combinations(range(1, 2 * TEAM_SIZE), TEAM_SIZE - 1)):
+    _SPLITS[_row, list(_mates)] = True
+
+
+def split_scores(mmrs, strategy=BALANCE_DIFFERENCE):
+    """Evaluate every possible split of the players in 2 teams.
+
+    Args:
+        mmrs: array of the 10 player MMRs.
+        strategy: BALANCE_DIFFERENCE to minimize the MMR difference between the teams,
+            BALANCE_VARIANCE to minimize both the difference of mean and of standard deviation between the teams.
+    Returns:
+        `numpy` array of the 126 split scores, lower is better.
+    """
+    mmrs = np.asarray(mmrs, dtype=np.float64)
+    if mmrs.shape != (2 * TEAM_SIZE,):
+        raise ValueError('Expected {0} MMR values, got {1}.'.format(2 * TEAM_SIZE, mmrs.shape))
+
+    radiant = np.where(_SPLITS, mmrs, 0).sum(axis=1)
+    dire = mmrs.sum() - radiant
+    if strategy == BALANCE_DIFFERENCE:
+        return np.abs(radiant - dire)
+    elif strategy == BALANCE_VARIANCE:
+        grid = np.broadcast_to(mmrs, _SPLITS.shape)
+        teams = np.stack([grid[_SPLITS].reshape(-1, TEAM_SIZE), grid[~_SPLITS].reshape(-1, TEAM_SIZE)])
+        means = teams.mean(axis=2)
+        deviations = teams.std(axis=2)
+        return (means[0] - means[1]) ** 2 + (deviations[0] - deviations[1]) ** 2
+    raise ValueError('Unknown balancing strategy {0}.'.format(strategy))
+
+
+def balance_teams(mmrs, strategy=BALANCE_DIFFERENCE):
+    """Find the best split of the players in 2 teams, evaluating exhaustively all possibilities.
+
+    Args:
+        mmrs: array of the 10 player MMRs.
+        strategy: balancing strategy, cf. `split_scores`.
+    Returns:
+        `numpy` array of 10 `Boolean`, True iff the player at this index is Radiant.
+    """
+    return _SPLITS[np.argmin(split_scores(mmrs, strategy))].copy()
+
+
+def greedy_teams(mmrs):
+    """Legacy greedy split, adding players by decreasing MMR to the weakest team. Kept for comparisons.
+
+    Args:
+        mmrs: array of the 10 player MMRs.
+    Returns:
+        `numpy` array of 10 `Boolean`, True iff the player at this index is Radiant.
+    """
+    result = np.zeros(len(mmrs), dtype=bool)
+    is_radiant = True
+    sums = {True: 0, False: 0}
+    count = {True: 0, False: 0}
+    for index in np.argsort(-np.asarray(mmrs), kind='stable'):
+        if sums[is_radiant] > sums[not is_radiant] and count[not is_radiant] < TEAM_SIZE:
+            is_radiant = not is_radiant
+        sums[is_radiant] += mmrs[index]
+        count[is_radiant] += 1
+        result[index] = is_radiant
+    return result
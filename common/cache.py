@@ -0,0 +1,79 @@
+from collections import OrderedDict
+from threading import Lock
+from time import monotonic
+
+
+class TTLCache:
+    """Thread safe cache of values expiring after a fixed delay, evicting the oldest entries when full.
+
+    Attributes:
+        ttl: default seconds a value stays valid.
+        max_size: maximum number of values kept.
+        entries: `OrderedDict` of tuple (expiry, value) indexed by key, in insertion order.
+        lock: `Lock` protecting the entries.
+    """
+
+    def __init__(self, ttl, max_size=1024):
+        """Create an empty cache.
+
+        Args:
+            ttl: default seconds a value stays valid.
+            max_size: maximum number of values kept.
+        """
+        self.ttl = ttl
+        self.max_size = max_size
+        self.entries = OrderedDict()
+        self.lock = Lock()
+
+    def get(self, key):
+        """Read a value of the cache.
+
+        Args:
+            key: key of the value.
+        Returns:
+            The value if present and not expired, None otherwise.
+        """
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is None:
+                return None
+            if entry[0] <= monotonic():
+                del self.entries[key]
+                return None
+            return entry[1]
+
+    def set(self, key, value, ttl=None):
+        """Store a value in the cache.
+
+        Args:
+            key: key of the value.
+            value: value to store, None values are never returned by `get`.
+            ttl: seconds this value stays valid, the delay of the cache if None.
+        """
+        with self.lock:
+            self.entries.pop(key, None)
+            self.entries[key] = (monotonic() + (self.ttl if ttl is None else ttl), value)
+            while len(self.entries) > self.max_size:
+                self.entries.popitem(last=False)
+
+    def pop(self, key):
+        """Remove a value from the cache, if present.
+
+        Args:
+            key: key of the value.
+        """
+        with self.lock:
+            self.entries.pop(key, None)
+
+    def invalidate(self, predicate=None):
+        """Remove values from the cache.
+
+        Args:
+            predicate: function called with a key, returning True to remove the value. All values if None.
+        """
+        with self.lock:
+            if predicate is None:
+                self.entries.clear()
+                return
+            for key in [key for key in self.entries if predicate(key)]:
+                del self.entries[key]
@@ -11,33 +11,97 @@ class Config(object):
         TESTING: Flask testing option.
         SQLALCHEMY_TRACK_MODIFICATIONS: Flask SQLalchmey track modifications option.
         DATABASE_URI: Url to the database used in Flask.
+        DATABASE_POOL_SIZE: Number of connections kept open by each process.
+        DATABASE_POOL_MAX_OVERFLOW: Number of connections opened temporarily above the pool size.
+        DATABASE_POOL_TIMEOUT: Seconds to wait for a free connection before failing.
+        DATABASE_POOL_RECYCLE: Seconds after which a connection is replaced.
+        DATABASE_POOL_PRE_PING: Boolean to test the connections when taken from the pool.
+        DATABASE_STATEMENT_TIMEOUT: Milliseconds before Postgres cancels a statement, 0 to disable.
         RABBITMQ_LOGIN: Login used to connect to the rabbitmq.
         RABBITMQ_PASSWORD: Password used to connect to the rabbitmq.
+        RABBITMQ_HOST: Hostname of the rabbitmq.
+        JOB_QUEUE_BACKEND: 'rabbitmq', or 'database' to queue the jobs in a table.
+        JOB_QUEUE_CLAIM_TIMEOUT: Seconds after which a job of the 'database' backend delivered and not acknowledged is
+            delivered again. The bots acknowledge the jobs once assigned, so longer than a game job.
         STEAM_KEY: Steam Key to interact with Steam API.
+        STEAM_API_URL: Base URL of the Steam Web API.
+        AVATAR_FRESHNESS: Seconds during which a refreshed user avatar is not fetched again.
         STEAM_CREDENTIAL_COUNT: Number of steam accounts provided into the config.
         STEAM_BOTi_LOGIN: Login of the steam account i.
         STEAM_BOTi_PASSWORD: Password of the steam account i.
+        STEAM_FAKE_CLIENT: Boolean to run the bots with offline fake Steam/Dota clients.
+        SCAN_BATCH_SIZE: Number of users scanned in a single job by `scan_all_users`.
+        SCAN_CONCURRENCY: Maximum number of profile requests in flight for a bot.
+        SCAN_TIMEOUT: Seconds to wait for a profile before retrying.
+        SCAN_RETRIES: Number of profile requests before giving up on a user.
+        GAME_MAX_DURATION: Seconds after which a game still in progress is cancelled by its bot.
+        BOT_JOB_TIMEOUT: Seconds after which a bot abandons a job other than a game.
+        BOT_GAME_JOB_TIMEOUT: Seconds after which a bot abandons a game job, lobby wait and game included, the match
+            being cancelled.
         VIP_LADDER_OPEN: Boolean indicating if the ladder is open for queue.
+        USER_CACHE_TTL: Seconds a logged-in user is kept in the identity cache of the web application.
+        WEB_WORKERS: Number of web server processes, 0 for one per CPU. With several workers, the queues, the ladder
+            status and the push channel are synchronized through the database, the user cache is disabled.
+        MATCHMAKER: 'memory' to hold the ladder queues in memory, 'database' to read the queue table on every call.
+        MATCH_BALANCER: team balancing strategy of new matches, 'difference' or 'variance' (cf. balancer).
+        QUERY_PROFILER: Boolean to start the processes with the SQL query profiler enabled, then toggled by admins.
+        SLOW_QUERY_THRESHOLD: Milliseconds from which the profiler logs a statement as slow.
+        BOT_METRICS_HOST: Address the metrics endpoint of the bot process listens on, loopback by default, an internal
+            address for a scraper on another host.
+        BOT_METRICS_PORT: Port of the metrics endpoint of the bot process, 0 to disable it.
+        WEB_METRICS_HOST: Address the metrics endpoint of the web workers listens on, loopback by default, an internal
+            address for a scraper on another host.
+        WEB_METRICS_PORT: Port of the metrics endpoint of the web workers, not to be published, 0 to disable it.
     """
 
     DEBUG = True
     TESTING = True
     SQLALCHEMY_TRACK_MODIFICATIONS = False
     DATABASE_URI = 'sqlite://:memory:'
+    DATABASE_POOL_SIZE = 10
+    DATABASE_POOL_MAX_OVERFLOW = 10
+    DATABASE_POOL_TIMEOUT = 30
+    DATABASE_POOL_RECYCLE = 1800
+    DATABASE_POOL_PRE_PING = True
+    DATABASE_STATEMENT_TIMEOUT = 0
     RABBITMQ_LOGIN = 'dazzar'
     RABBITMQ_PASSWORD = 'guest'
+    RABBITMQ_HOST = 'dazzar_rabbitmq'
+    JOB_QUEUE_BACKEND = 'rabbitmq'
+    JOB_QUEUE_CLAIM_TIMEOUT = 18000
     STEAM_KEY = 'toto'
+    STEAM_API_URL = 'https://api.steampowered.com'
+    AVATAR_FRESHNESS = 3600
     STEAM_CREDENTIAL_COUNT = 1
     STEAM_BOT0_LOGIN = 'login'
     STEAM_BOT0_PASSWORD = 'password'
+    STEAM_FAKE_CLIENT = False
+    SCAN_BATCH_SIZE = 100
+    SCAN_CONCURRENCY = 5
+    SCAN_TIMEOUT = 10
+    SCAN_RETRIES = 3
+    GAME_MAX_DURATION = 10800
+    BOT_JOB_TIMEOUT = 600
+    BOT_GAME_JOB_TIMEOUT = 14400
     VIP_LADDER_OPEN = False
+    USER_CACHE_TTL = 10
+    WEB_WORKERS = 1
+    MATCHMAKER = 'memory'
+    MATCH_BALANCER = 'difference'
+    QUERY_PROFILER = False
+    SLOW_QUERY_THRESHOLD = 200
+    BOT_METRICS_HOST = '127.0.0.1'
+    BOT_METRICS_PORT = 9100
+    WEB_METRICS_HOST = '127.0.0.1'
+    WEB_METRICS_PORT = 9101
 
 
 def load_config(config):
     """Load a configuration for the Flask application from a specific file.
 
     Starts with `Config` object as a base.
-    Loads `settings.cfg` if exists and readable.
+    Loads `settings.cfg` if exists and readable, then the file named by the DAZZAR_SETTINGS environment variable if
+    set (used by the tests).
 
     Args:
         config: Application config object to load the config into.
@@ -48,3 +112,4 @@ def load_config(config):
             config.from_pyfile(os.path.join(os.path.dirname(__file__), 'settings.cfg'))
         except SyntaxError:
             logging.log(logging.ERROR, 'Impossible to interpret settings file, using default.')
+    config.from_envvar('DAZZAR_SETTINGS', silent=True)
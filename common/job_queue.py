@@ -1,35 +1,100 @@
 from abc import ABC, abstractmethod
-import pickle
+from datetime import datetime, timedelta
+from functools import partial
+from itertools import count
+from queue import Queue, Empty
+from threading import BoundedSemaphore
+from time import time, sleep
+import logging
+import socket
 
 import pika
+from sqlalchemy import select, or_, func
 
+from common.models import db, JobEntry
+from common.jobs import JOB_SCHEMA_VERSION, register_job, encode_job, decode_job, Job, JobScan, JobCreateGame, \
+    JobScanBatch, JobRefreshAvatars
+import common.metrics as metrics
 
-class QueueAdapter:
-    """Adapter to interact with the dazzar job queue.
+
+class QueueBackend(ABC):
+    """Interface of the transport carrying the encoded jobs from the producers to the bot manager."""
+
+    @abstractmethod
+    def publish(self, body):
+        """Add a message at the end of the queue.
+
+        Args:
+            body: `bytes` of the message.
+        """
+
+    @abstractmethod
+    def subscribe(self, callback, prefetch):
+        """Register the consumer of the queue, messages are delivered while processing events.
+
+        Args:
+            callback: function called with (body, delivery_tag) for each message received.
+            prefetch: maximum number of messages delivered and not yet acknowledged.
+        """
+
+    @abstractmethod
+    def process_events(self, timeout):
+        """Wait for messages and deliver them to the subscribed callback.
+
+        Args:
+            timeout: maximum number of seconds to wait.
+        """
+
+    @abstractmethod
+    def ack(self, delivery_tag):
+        """Acknowledge a delivered message, safe to call while another greenlet is processing events.
+
+        Args:
+            delivery_tag: tag of the message given to the subscribed callback.
+        """
+
+    def depth(self):
+        """Count the messages waiting in the queue.
+
+        Returns:
+            `int` number of messages not yet delivered, None if unknown.
+        """
+        return None
+
+    def refresh(self):
+        """Keep alive the connection to the queue, if any."""
+
+    def reset(self):
+        """Forget the connections inherited from a parent process, new ones being opened at the next use."""
+
+
+class RabbitMQBackend(QueueBackend):
+    """Queue stored in a RabbitMQ broker, the connection being opened at the first use.
 
     Attributes:
-        connection: pika connection to rabbitmq
-        channel: job queue to produce/consume
+        connection: pika connection to rabbitmq, None until connected.
+        channel: job queue channel to produce/consume.
     """
 
-    def __init__(self, username, password):
-        """Create an adapter to interact with the job queue.
+    def __init__(self, username, password, host):
+        """Create a backend for a broker.
 
         Args:
-            username: username of the queue
-            password: password of the queue
+            username: username of the queue.
+            password: password of the queue.
+            host: hostname of the broker.
         """
         self.username = username
         self.password = password
+        self.host = host
         self.connection = None
         self.channel = None
-        self.method = None
-
-        self._connect()
 
     def _connect(self):
-        """Initial connection to the queue manager."""
-        self.connection = pika.BlockingConnection(pika.ConnectionParameters(host='dazzar_rabbitmq',
+        """Connection to the queue manager, if not already done."""
+        if self.channel is not None:
+            return
+        self.connection = pika.BlockingConnection(pika.ConnectionParameters(host=self.host,
                                                                             credentials=pika.PlainCredentials(
                                                                                 self.username,
                                                                                 self.password)))
@@ -37,66 +102,285 @@ class QueueAdapter:
         self.channel.basic_qos(prefetch_count=1)
         self.channel.queue_declare(queue='dazzar_jobs', durable=True)
 
-    def produce(self, message):
-        """Publish a message to add inside the queue.
-
-        Args;
-            message: object to add inside the queue.
-        """
+    def publish(self, body):
+        self._connect()
         self.channel.basic_publish(exchange='',
                                    routing_key='dazzar_jobs',
-                                   body=pickle.dumps(message),
+                                   body=body,
                                    properties=pika.BasicProperties(
                                        delivery_mode=2,  # make message persistent
                                    ))
 
-    def consume(self):
-        """Non blocking consume of messages from the queue.
-
-        Returns:
-            A message non pickled from the queue if there is at least one, None otherwise.
-        """
-        method_frame, header_frame, body = self.channel.basic_get('dazzar_jobs')
-        result = None
+    def subscribe(self, callback, prefetch):
+        self._connect()
+        self.channel.basic_qos(prefetch_count=prefetch)
+        self.channel.basic_consume(queue='dazzar_jobs',
+                                   on_message_callback=lambda channel, method, properties, body:
+                                   callback(body, method.delivery_tag))
 
-        if method_frame:
-            self.method = method_frame
-            result = pickle.loads(body)
+    def process_events(self, timeout):
+        self._connect()
+        self.connection.process_data_events(time_limit=timeout)
 
-        return result
+    def ack(self, delivery_tag):
+        self.connection.add_callback_threadsafe(partial(self.channel.basic_ack, delivery_tag=delivery_tag))
 
-    def ack_last(self):
-        """Acknowledge the last message consumed by the queue."""
-        self.channel.basic_ack(delivery_tag=self.method.delivery_tag)
+    def depth(self):
+        self._connect()
+        return self.channel.queue_declare(queue='dazzar_jobs', durable=True, passive=True).method.message_count
 
     def refresh(self):
         """Ping the queue to ensure that the TCP connection is not closed prematurely."""
-        self.connection.process_data_events()
+        if self.connection is not None:
+            self.connection.process_data_events()
+
+    def reset(self):
+        self.connection = None
+        self.channel = None
 
 
-class Job(ABC):
-    """A abstract job class used to pass orders from the flask application to the Dota workers."""
+class MemoryBackend(QueueBackend):
+    """Queue held in the memory of the process, for tests and offline benchmarks running the web and bot sides together.
 
+    The web and bot processes being separate in deployments, it is never chosen by the configuration and must be
+    given explicitly, e.g. `DazzarWorkerManager(job_queue=QueueAdapter(MemoryBackend()))`.
 
-class JobScan(Job):
-    """A scan profile job where the bot requests the Dota profile and update the database with information.
+    The standard `queue` and `threading` primitives are cooperative once gevent patched the process.
 
     Attributes:
-        steam_id: Steam user id (as 64 bits) to scan.
-        scan_finish: Boolean indicating the end of the scan or not.
+        messages: `Queue` of the messages not yet delivered.
+        callback: subscribed callback, None if no consumer.
+        slots: `BoundedSemaphore` counting the deliveries allowed before an acknowledgment.
     """
 
-    def __init__(self, steam_id):
-        self.steam_id = steam_id
-        self.scan_finish = False
+    def __init__(self):
+        """Create an empty queue."""
+        self.messages = Queue()
+        self.callback = None
+        self.slots = None
+        self.tags = count(1)
+
+    def publish(self, body):
+        self.messages.put(body)
+
+    def subscribe(self, callback, prefetch):
+        self.callback = callback
+        self.slots = BoundedSemaphore(prefetch)
+
+    def process_events(self, timeout):
+        deadline = time() + timeout
+        while True:
+            if not self.slots.acquire(timeout=max(deadline - time(), 0)):
+                return
+            try:
+                body = self.messages.get(timeout=max(deadline - time(), 0))
+            except Empty:
+                self.slots.release()
+                return
+            self.callback(body, next(self.tags))
 
+    def ack(self, delivery_tag):
+        self.slots.release()
 
-class JobCreateGame(Job):
-    """A create game job where the bot creates a lobby for a game.
+    def depth(self):
+        return self.messages.qsize()
+
+
+class DatabaseBackend(QueueBackend):
+    """Queue stored in the `JobEntry` table, polled by the consumer.
+
+    Entries are claimed with SKIP LOCKED where supported, stamped with the claim time and the consumer name, and
+    deleted when acknowledged. The claims of the consumer not yet acknowledged count against its prefetch, the ones
+    left by a previous run of the consumer are released when it subscribes again. An entry claimed and never
+    acknowledged is delivered again after JOB_QUEUE_CLAIM_TIMEOUT.
 
     Attributes:
-        match_id: Id of the match to create from the database.
+        app: Flask application used to access the database.
+        owner: name of the consumer stamped on its claims.
+        claim_timeout: `timedelta` after which an entry claimed and not acknowledged is delivered again.
+        callback: subscribed callback, None if no consumer.
+        prefetch: maximum number of entries delivered and not yet acknowledged.
     """
 
-    def __init__(self, match_id):
-        self.match_id = match_id
+    # Seconds between two polls of an empty queue
+    POLL_INTERVAL = 1
+
+    def __init__(self, app, owner=None):
+        """Create a backend on the database of an application.
+
+        Args:
+            app: Flask application the backend is linked to.
+            owner: name of the consumer, the host name if None.
+        """
+        self.app = app
+        self.owner = owner if owner is not None else socket.gethostname()
+        self.claim_timeout = timedelta(seconds=app.config['JOB_QUEUE_CLAIM_TIMEOUT'])
+        self.callback = None
+        self.prefetch = 0
+
+    def publish(self, body):
+        with self.app.app_context():
+            with db.engine.begin() as connection:
+                connection.execute(JobEntry.__table__.insert().values(body=body, created=datetime.utcnow()))
+
+    def subscribe(self, callback, prefetch):
+        self.callback = callback
+        self.prefetch = prefetch
+
+        # Entries delivered to the previous run of the consumer, lost with it
+        table = JobEntry.__table__
+        with self.app.app_context():
+            with db.engine.begin() as connection:
+                connection.execute(table.update()
+                                   .where(table.c.taken_by == self.owner)
+                                   .values(taken=None, taken_by=None))
+
+    def process_events(self, timeout):
+        deadline = time() + timeout
+        while True:
+            for entry_id, body in self._take():
+                self.callback(body, entry_id)
+
+            remaining = deadline - time()
+            if remaining <= 0:
+                return
+            sleep(min(self.POLL_INTERVAL, remaining))
+
+    def _take(self):
+        """Claim the oldest entries available, as many as the prefetch allows.
+
+        Returns:
+            `list` of tuple (entry ID, body).
+        """
+        table = JobEntry.__table__
+        now = datetime.utcnow()
+        expired = now - self.claim_timeout
+        with self.app.app_context():
+            with db.engine.begin() as connection:
+                claimed = connection.execute(select([func.count()]).select_from(table)
+                                             .where(table.c.taken_by == self.owner)
+                                             .where(table.c.taken >= expired)).scalar()
+                if claimed >= self.prefetch:
+                    return []
+                query = select([table.c.id, table.c.body]) \
+                    .where(or_(table.c.taken.is_(None), table.c.taken < expired)) \
+                    .order_by(table.c.id) \
+                    .limit(self.prefetch - claimed) \
+                    .with_for_update(skip_locked=True)
+                entries = [(row.id, row.body) for row in connection.execute(query)]
+                if len(entries) != 0:
+                    connection.execute(table.update()
+                                       .where(table.c.id.in_([entry_id for entry_id, body in entries]))
+                                       .values(taken=now, taken_by=self.owner))
+        return entries
+
+    def ack(self, delivery_tag):
+        with self.app.app_context():
+            with db.engine.begin() as connection:
+                connection.execute(JobEntry.__table__.delete().where(JobEntry.__table__.c.id == delivery_tag))
+
+    def depth(self):
+        table = JobEntry.__table__
+        with self.app.app_context():
+            with db.engine.begin() as connection:
+                return connection.execute(select([func.count()]).select_from(table)
+                                          .where(table.c.taken.is_(None))).scalar()
+
+
+class QueueAdapter:
+    """Adapter to interact with the dazzar job queue, encoding the jobs over a backend.
+
+    Attributes:
+        backend: `QueueBackend` carrying the messages.
+    """
+
+    def __init__(self, backend):
+        """Create an adapter to interact with the job queue.
+
+        Args:
+            backend: `QueueBackend` carrying the messages.
+        """
+        self.backend = backend
+
+    def produce(self, message):
+        """Publish a message to add inside the queue.
+
+        Args;
+            message: object to add inside the queue.
+        """
+        self.backend.publish(encode_job(message))
+        metrics.JOBS_PRODUCED.inc(job=type(message).__name__)
+
+    def subscribe(self, callback, prefetch):
+        """Start a push consumption of the queue, messages are delivered while processing events.
+
+        Args:
+            callback: function called with (job, delivery_tag) for each message received.
+            prefetch: maximum number of messages delivered and not yet acknowledged.
+        """
+        def on_message(body, delivery_tag):
+            try:
+                job = decode_job(body)
+            except (ValueError, TypeError, KeyError) as e:
+                logging.error('Dropping job impossible to decode: %s', e)
+                metrics.JOBS_DROPPED.inc()
+                self.backend.ack(delivery_tag)
+                return
+            metrics.JOBS_RECEIVED.inc(job=type(job).__name__)
+            callback(job, delivery_tag)
+
+        self.backend.subscribe(on_message, prefetch)
+
+    def process_events(self, timeout):
+        """Wait for messages and deliver them to the subscription callback, keeping the connection alive.
+
+        Args:
+            timeout: maximum number of seconds to wait.
+        """
+        self.backend.process_events(timeout)
+
+    def ack(self, delivery_tag):
+        """Acknowledge a delivered message, safe to call while another greenlet is processing events.
+
+        Args:
+            delivery_tag: tag of the message given to the subscription callback.
+        """
+        self.backend.ack(delivery_tag)
+
+    def depth(self):
+        """Count the jobs waiting in the queue.
+
+        Returns:
+            `int` number of jobs not yet delivered to the bot manager, None if unknown.
+        """
+        return self.backend.depth()
+
+    def refresh(self):
+        """Ping the queue to ensure that the connection is not closed prematurely."""
+        self.backend.refresh()
+
+    def reset(self):
+        """Forget the connections inherited from a parent process, to call in a forked worker."""
+        self.backend.reset()
+
+
+def make_job_queue(app):
+    """Create the job queue adapter over the backend chosen in the application configuration.
+
+    Args:
+        app: Flask application the queue is linked to.
+    Returns:
+        A `QueueAdapter` over RabbitMQ if JOB_QUEUE_BACKEND is 'rabbitmq', over the job table if 'database'.
+    Raises:
+        ValueError: unknown backend, or 'memory' which would lose the jobs between the web and bot processes
+            (cf. `MemoryBackend`).
+    """
+    backend = app.config['JOB_QUEUE_BACKEND']
+    if backend == 'memory':
+        raise ValueError('The memory job queue is not shared between processes, give it explicitly to a single one.')
+    elif backend == 'database':
+        return QueueAdapter(DatabaseBackend(app))
+    elif backend == 'rabbitmq':
+        return QueueAdapter(RabbitMQBackend(app.config['RABBITMQ_LOGIN'], app.config['RABBITMQ_PASSWORD'],
+                                            app.config['RABBITMQ_HOST']))
+    raise ValueError('Unknown job queue backend {0}.'.format(backend))
@@ -0,0 +1,149 @@
+from abc import ABC
+import logging
+
+import msgpack
+
+# Version of the job encoding, increased on incompatible changes.
+JOB_SCHEMA_VERSION = 1
+
+# Job classes indexed by their type tag, filled by `register_job`.
+_job_types = {}
+
+
+def register_job(tag):
+    """Class decorator registering a job type in the encoding.
+
+    Args:
+        tag: unique `int` identifying the job type in the messages, never to be reused.
+    Returns:
+        The decorator.
+    """
+    def decorator(cls):
+        if tag in _job_types:
+            raise ValueError('Job tag {0} already used by {1}.'.format(tag, _job_types[tag].__name__))
+        cls.tag = tag
+        _job_types[tag] = cls
+        return cls
+    return decorator
+
+
+def encode_job(job):
+    """Encode a job as a message for the queue.
+
+    The message is a msgpack array [version, type tag, {field name: value}].
+
+    Args:
+        job: `Job` to encode.
+    Returns:
+        `bytes` of the message.
+    """
+    return msgpack.packb([JOB_SCHEMA_VERSION, job.tag, job.to_fields()], use_bin_type=True)
+
+
+def decode_job(body):
+    """Decode a message from the queue into a job.
+
+    Fields unknown to the job class are ignored, so producers can add fields before consumers know them.
+
+    Args:
+        body: `bytes` of the message.
+    Returns:
+        The `Job` decoded.
+    Raises:
+        ValueError: the message is not a job message or has an unknown type tag.
+    """
+    try:
+        message = msgpack.unpackb(body, raw=False)
+    except Exception as e:
+        raise ValueError('Invalid job message: {0}'.format(e))
+    if not isinstance(message, list) or len(message) < 3 or not isinstance(message[2], dict):
+        raise ValueError('Invalid job message layout.')
+
+    version, tag, fields = message[0:3]
+    if version > JOB_SCHEMA_VERSION:
+        logging.warning('Decoding job with schema version %s newer than %s.', version, JOB_SCHEMA_VERSION)
+    if tag not in _job_types:
+        raise ValueError('Unknown job type tag {0}.'.format(tag))
+    return _job_types[tag].from_fields(fields)
+
+
+class Job(ABC):
+    """A abstract job class used to pass orders from the flask application to the Dota workers.
+
+    Attributes:
+        tag: unique `int` identifying the job type in the messages (cf. `register_job`).
+        fields: names of the attributes sent in the messages, also the constructor arguments.
+    """
+    tag = None
+    fields = ()
+
+    def to_fields(self):
+        """Export the job attributes to encode.
+
+        Returns:
+            `dict` of the job attributes indexed by field name.
+        """
+        return {name: getattr(self, name) for name in self.fields}
+
+    @classmethod
+    def from_fields(cls, fields):
+        """Create a job from decoded attributes, ignoring the unknown ones.
+
+        Args:
+            fields: `dict` of the job attributes indexed by field name.
+        Returns:
+            The new `Job`.
+        """
+        return cls(**{name: value for name, value in fields.items() if name in cls.fields})
+
+
+@register_job(1)
+class JobScan(Job):
+    """A scan profile job where the bot requests the Dota profile and update the database with information.
+
+    Attributes:
+        steam_id: Steam user id (as 64 bits) to scan.
+    """
+    fields = ('steam_id',)
+
+    def __init__(self, steam_id):
+        self.steam_id = steam_id
+
+
+@register_job(2)
+class JobCreateGame(Job):
+    """A create game job where the bot creates a lobby for a game.
+
+    Attributes:
+        match_id: Id of the match to create from the database.
+    """
+    fields = ('match_id',)
+
+    def __init__(self, match_id):
+        self.match_id = match_id
+
+
+@register_job(3)
+class JobScanBatch(Job):
+    """A scan profile job for many users, processed by a single bot session.
+
+    Attributes:
+        steam_ids: `list` of Steam user ids (as 64 bits) to scan.
+    """
+    fields = ('steam_ids',)
+
+    def __init__(self, steam_ids):
+        self.steam_ids = steam_ids
+
+
+@register_job(4)
+class JobRefreshAvatars(Job):
+    """A refresh of the Steam avatars of users, processed by the avatar refresher of the bot application.
+
+    Attributes:
+        steam_ids: `list` of Steam user ids (as 64 bits) to refresh.
+    """
+    fields = ('steam_ids',)
+
+    def __init__(self, steam_ids):
+        self.steam_ids = steam_ids
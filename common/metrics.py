@@ -0,0 +1,268 @@
+from threading import Lock
+
+# Content type of the Prometheus text format rendered by `Registry.render`
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+# Default histogram buckets in seconds, from a fast request to a slow job
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 300)
+
+
+class Registry:
+    """Set of the metrics of a process, rendered in the Prometheus text format.
+
+    Attributes:
+        metrics: `list` of the registered `Metric`, in registration order.
+    """
+
+    def __init__(self):
+        """Create an empty registry."""
+        self.metrics = []
+
+    def register(self, metric):
+        """Add a metric to the registry.
+
+        Args:
+            metric: `Metric` to render with the others.
+        Returns:
+            The metric.
+        """
+        self.metrics.append(metric)
+        return metric
+
+    def render(self):
+        """Render all metrics.
+
+        Returns:
+            `str` in the Prometheus text format.
+        """
+        lines = []
+        for metric in self.metrics:
+            lines.append('# HELP {0} {1}'.format(metric.name, metric.documentation))
+            lines.append('# TYPE {0} {1}'.format(metric.name, metric.type))
+            lines.extend(metric.samples())
+        return '\n'.join(lines) + '\n'
+
+
+class Metric:
+    """Base of the metrics, holding a value per combination of label values.
+
+    Attributes:
+        name: name of the metric.
+        documentation: `str` describing the metric.
+        label_names: `tuple` of the label names, the values being given as keyword arguments.
+        values: `dict` of values indexed by the `tuple` of label values.
+        lock: `Lock` protecting the values.
+    """
+    type = 'untyped'
+
+    def __init__(self, name, documentation, label_names=(), registry=None):
+        """Create a metric and register it.
+
+        Args:
+            name: name of the metric.
+            documentation: `str` describing the metric.
+            label_names: `tuple` of the label names.
+            registry: `Registry` to add the metric to, the registry of the process if None.
+        """
+        self.name = name
+        self.documentation = documentation
+        self.label_names = tuple(label_names)
+        self.values = {}
+        self.lock = Lock()
+        (registry if registry is not None else REGISTRY).register(self)
+
+    def _key(self, labels):
+        return tuple(str(labels[name]) for name in self.label_names)
+
+    def _label_text(self, key, extra=()):
+        pairs = list(zip(self.label_names, key)) + list(extra)
+        if len(pairs) == 0:
+            return ''
+        return '{' + ','.join('{0}="{1}"'.format(name, _escape(value)) for name, value in pairs) + '}'
+
+    def samples(self):
+        """Render the values of the metric.
+
+        Returns:
+            `list` of `str` sample lines.
+        """
+        with self.lock:
+            values = list(self.values.items())
+        return ['{0}{1} {2}'.format(self.name, self._label_text(key), _number(value)) for key, value in values]
+
+
+class Counter(Metric):
+    """Metric only increasing, like a number of events."""
+    type = 'counter'
+
+    def inc(self, amount=1, **labels):
+        """Increase the counter.
+
+        Args:
+            amount: positive increment.
+            labels: value of each label.
+        """
+        key = self._key(labels)
+        with self.lock:
+            self.values[key] = self.values.get(key, 0) + amount
+
+
+class Gauge(Metric):
+    """Metric going up and down, set directly or read from a function when rendered.
+
+    Attributes:
+        function: function returning the value, or a `dict` of values indexed by the `tuple` of label values,
+            None to render the values set.
+    """
+    type = 'gauge'
+
+    def __init__(self, name, documentation, label_names=(), registry=None, function=None):
+        """Create a gauge and register it.
+
+        Args:
+            name: name of the metric.
+            documentation: `str` describing the metric.
+            label_names: `tuple` of the label names.
+            registry: `Registry` to add the metric to, the registry of the process if None.
+            function: function read when rendered (cf. attributes), None to render the values set.
+        """
+        Metric.__init__(self, name, documentation, label_names, registry)
+        self.function = function
+
+    def set(self, value, **labels):
+        """Change the value of the gauge.
+
+        Args:
+            value: new value.
+            labels: value of each label.
+        """
+        with self.lock:
+            self.values[self._key(labels)] = value
+
+    def inc(self, amount=1, **labels):
+        """Increase the gauge.
+
+        Args:
+            amount: increment, negative to decrease.
+            labels: value of each label.
+        """
+        key = self._key(labels)
+        with self.lock:
+            self.values[key] = self.values.get(key, 0) + amount
+
+    def samples(self):
+        if self.function is None:
+            return Metric.samples(self)
+        value = self.function()
+        if value is None:
+            return []
+        if not isinstance(value, dict):
+            value = {(): value}
+        return ['{0}{1} {2}'.format(self.name, self._label_text(tuple(str(label) for label in key)), _number(number))
+                for key, number in value.items()]
+
+
+class Histogram(Metric):
+    """Metric counting observations, like durations, in cumulative buckets.
+
+    Attributes:
+        buckets: sorted `tuple` of the bucket upper bounds, +Inf being implicit.
+    """
+    type = 'histogram'
+
+    def __init__(self, name, documentation, label_names=(), registry=None, buckets=DEFAULT_BUCKETS):
+        """Create a histogram and register it.
+
+        Args:
+            name: name of the metric.
+            documentation: `str` describing the metric.
+            label_names: `tuple` of the label names.
+            registry: `Registry` to add the metric to, the registry of the process if None.
+            buckets: `tuple` of the bucket upper bounds.
+        """
+        Metric.__init__(self, name, documentation, label_names, registry)
+        self.buckets = tuple(sorted(buckets))
+
+    def observe(self, value, **labels):
+        """Record an observation.
+
+        Args:
+            value: observed value.
+            labels: value of each label.
+        """
+        key = self._key(labels)
+        with self.lock:
+            counts = self.values.get(key)
+            if counts is None:
+                # Count per bucket, with +Inf last, then the sum of the observations
+                counts = self.values[key] = [0] * (len(self.buckets) + 1) + [0.0]
+            for index, bound in enumerate(self.buckets):
+                if value <= bound:
+                    counts[index] += 1
+                    break
+            else:
+                counts[len(self.buckets)] += 1
+            counts[-1] += value
+
+    def samples(self):
+        with self.lock:
+            values = [(key, list(counts)) for key, counts in self.values.items()]
+        lines = []
+        for key, counts in values:
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float('inf'),), counts):
+                cumulative += count
+                lines.append('{0}_bucket{1} {2}'.format(self.name, self._label_text(key, [('le', _number(bound))]),
+                                                         cumulative))
+            lines.append('{0}_sum{1} {2}'.format(self.name, self._label_text(key), _number(counts[-1])))
+            lines.append('{0}_count{1} {2}'.format(self.name, self._label_text(key), cumulative))
+        return lines
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+
+
+def _number(value):
+    if value == float('inf'):
+        return '+Inf'
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+def metrics_application(environ, start_response):
+    """WSGI application serving the metrics of the process on /metrics, on a port only reachable by the scraper."""
+    if environ.get('PATH_INFO') != '/metrics':
+        start_response('404 Not Found', [('Content-Type', 'text/plain')])
+        return [b'Not Found']
+    start_response('200 OK', [('Content-Type', CONTENT_TYPE)])
+    return [REGISTRY.render().encode('utf-8')]
+
+
+# Registry of the process, rendered by the /metrics endpoints
+REGISTRY = Registry()
+
+# Metrics of the application, the gauges without values are bound to a function by the process holding the data
+
+# Job queue
+JOB_QUEUE_DEPTH = Gauge('dazzar_job_queue_depth', 'Jobs waiting in the job queue, read every minute.')
+JOBS_PRODUCED = Counter('dazzar_jobs_produced_total', 'Jobs published to the job queue.', ['job'])
+JOBS_RECEIVED = Counter('dazzar_jobs_received_total', 'Jobs delivered by the job queue to the bot manager.', ['job'])
+JOBS_DROPPED = Counter('dazzar_jobs_dropped_total', 'Messages of the job queue dropped as impossible to decode.')
+
+# Bot manager and bots
+BOTS = Gauge('dazzar_bots', 'Dota bots by state: free, working, or ready with a Dota session.', ['state'])
+PENDING_JOBS = Gauge('dazzar_pending_jobs', 'Jobs received by the bot manager, waiting for a free bot.')
+JOB_DISPATCH_SECONDS = Histogram('dazzar_job_dispatch_seconds',
+                                 'Delay between the reception of a job and its assignment to a bot.')
+JOB_SECONDS = Histogram('dazzar_job_seconds', 'Duration of the jobs from their assignment to their end.',
+                        ['job', 'session'], buckets=(1, 5, 10, 30, 60, 300, 600, 1200, 1800, 3600, 5400))
+BOT_PHASE_SECONDS = Histogram('dazzar_bot_phase_seconds',
+                              'Duration of the phases of the bots: connect, login, gc_ready, lobby_wait and game.',
+                              ['phase'], buckets=(0.5, 1, 2.5, 5, 10, 30, 60, 120, 300, 600, 1800, 3600, 5400))
+
+# Web application
+HTTP_REQUESTS = Counter('dazzar_http_requests_total', 'HTTP requests answered by the web application.',
+                        ['endpoint', 'method', 'status'])
+HTTP_REQUEST_SECONDS = Histogram('dazzar_http_request_seconds', 'Duration of the HTTP requests.', ['endpoint'])
+LADDER_QUEUE_PLAYERS = Gauge('dazzar_ladder_queue_players', 'Players waiting in the ladder queues.', ['queue'])
+MATCHES_CREATED = Counter('dazzar_matches_created_total', 'Matches created from the ladder queues.', ['section'])
@@ -3,11 +3,57 @@ import string
 import random
 
 from flask_sqlalchemy import SQLAlchemy
+from sqlalchemy.orm import joinedload
 
 import common.constants as constants
+from common.balancer import balance_teams, BALANCE_DIFFERENCE
 
 db = SQLAlchemy()
 
+
+def engine_options(config):
+    """Build the SQLAlchemy engine options from the application configuration.
+
+    The pool settings only apply to server databases, SQLite using its own pools.
+
+    Args:
+        config: application configuration with the DATABASE_POOL_* and DATABASE_STATEMENT_TIMEOUT values.
+    Returns:
+        `dict` of keyword arguments for `create_engine`.
+    """
+    uri = config.get('SQLALCHEMY_DATABASE_URI') or ''
+    if uri.startswith('sqlite'):
+        return {}
+
+    options = {
+        'pool_size': config['DATABASE_POOL_SIZE'],
+        'max_overflow': config['DATABASE_POOL_MAX_OVERFLOW'],
+        'pool_timeout': config['DATABASE_POOL_TIMEOUT'],
+        'pool_recycle': config['DATABASE_POOL_RECYCLE'],
+        'pool_pre_ping': config['DATABASE_POOL_PRE_PING'],
+    }
+    if uri.startswith('postgresql') and config['DATABASE_STATEMENT_TIMEOUT'] > 0:
+        options['connect_args'] = {'options': '-c statement_timeout={0}'.format(config['DATABASE_STATEMENT_TIMEOUT'])}
+    return options
+
+
+def pool_statistics():
+    """Read the usage of the connection pool of the current application, requires an application context.
+
+    Returns:
+        `dict` with the pool 'size', the connections 'checked_in' and 'checked_out', and the 'overflow' in use.
+        Empty if the pool does not keep connections.
+    """
+    pool = db.engine.pool
+    if not hasattr(pool, 'checkedout'):
+        return {}
+    return {
+        'size': pool.size(),
+        'checked_in': pool.checkedin(),
+        'checked_out': pool.checkedout(),
+        'overflow': max(pool.overflow(), 0),
+    }
+
 # Association of users to permissions
 permissions = db.Table('permissions',
                        db.Column('permission_id', db.Integer(), db.ForeignKey('user_permission.id')),
@@ -38,6 +84,9 @@ class User(db.Model):
         matches: ORM relation to all the matches played by this user.
     """
     __tablename__ = 'user'
+    # Nickname search by substring (cf. search_users), trigram index on Postgres
+    __table_args__ = (db.Index('ix_user_nickname_trgm', 'nickname', postgresql_using='gin',
+                               postgresql_ops={'nickname': 'gin_trgm_ops'}),)
 
     id = db.Column(db.BigInteger(), primary_key=True)
     nickname = db.Column(db.String(20), nullable=True, index=True)
@@ -107,10 +156,38 @@ class User(db.Model):
         Returns:
             `Boolean` True iff the user has the target permission.
         """
-        for permission in self.user_permission:
-            if permission.name == name:
-                return True
-        return False
+        return name in self.permission_names
+
+    @property
+    def permission_names(self):
+        """Names of the permissions owned by the user, loaded in one query and kept for the instance lifetime.
+
+        Returns:
+            `frozenset` of the permission names.
+        """
+        names = getattr(self, '_permission_names', None)
+        if names is None:
+            User.load_permissions([self])
+            names = self._permission_names
+        return names
+
+    @staticmethod
+    def load_permissions(users):
+        """Load in one query the permissions of several users, cached on each instance.
+
+        Args:
+            users: iterable of `User` to load the permissions of.
+        """
+        users = {user.id: user for user in users}
+        if len(users) == 0:
+            return
+        names = {user_id: set() for user_id in users}
+        for user_id, name in db.session().query(permissions.c.user_id, UserPermission.name) \
+                .join(UserPermission, UserPermission.id == permissions.c.permission_id) \
+                .filter(permissions.c.user_id.in_(list(users))):
+            names[user_id].add(name)
+        for user_id, user in users.items():
+            user._permission_names = frozenset(names[user_id])
 
     def give_permission(self, name, give):
         """Give or remove a specific permission to this user.
@@ -128,6 +205,7 @@ class User(db.Model):
         elif not give and permission in self.user_permission:
             self.user_permission.remove(permission)
         db.session.commit()
+        self._permission_names = None
 
     @staticmethod
     def get_or_create(steam_id):
@@ -309,6 +387,9 @@ class PlayerInMatch(db.Model):
         player: ORM relationship to the `User` this player is linked to.
         match: ORM relationship to the `Match` played.
     """
+    # Match history of a player without reading the table, newest first with a backward scan
+    __table_args__ = (db.Index('ix_player_in_match_history', 'player_id', 'match_id', 'is_radiant', 'is_leaver',
+                               'is_dodge'),)
 
     player_id = db.Column(db.BigInteger(), db.ForeignKey('user.id'), primary_key=True)
     match_id = db.Column(db.Integer, db.ForeignKey('match.id'), primary_key=True)
@@ -355,6 +436,8 @@ class Match(db.Model):
         players: ORM relationship to the `PlayerInMatch` of this `Match`
     """
     __tablename__ = 'match'
+    # Latest matches of a ladder, with a backward scan
+    __table_args__ = (db.Index('ix_match_section_created', 'section', 'created', 'id'),)
 
     id = db.Column(db.Integer, primary_key=True)
     status = db.Column(db.Integer, index=True, nullable=False)
@@ -367,12 +450,14 @@ class Match(db.Model):
 
     players = db.relationship('PlayerInMatch', back_populates='match')
 
-    def __init__(self, players, section, votes):
+    def __init__(self, users, section, votes, strategy=BALANCE_DIFFERENCE):
         """Create a new match object.
 
         Args:
-            players: `array` of `User` playing in this `Match`.
+            users: `array` of the 10 `User` playing in this `Match`.
             section: ladder name this match is played on (cf. constants).
+            votes: `array` of the mode votes of the players.
+            strategy: team balancing strategy (cf. balancer).
         """
         self.section = section
         self.radiant_win = None
@@ -382,13 +467,12 @@ class Match(db.Model):
         self.server = None
         for i in range(0, 4):
             self.password += random.choice(string.ascii_lowercase + string.digits)
-        is_radiant = True
-        sums = {True: 0, False: 0}
+
+        users = sorted(users, key=lambda user: user.solo_mmr or 0, reverse=True)
+        teams = balance_teams([user.solo_mmr or 0 for user in users], strategy)
         count = {True: 0, False: 0}
-        for user in User.query.filter(User.id.in_(players)).order_by(User.solo_mmr.desc()).all():
-            if sums[is_radiant] > sums[not is_radiant] and count[not is_radiant] < 5:
-                is_radiant = not is_radiant
-            sums[is_radiant] += user.solo_mmr
+        for user, is_radiant in zip(users, teams):
+            is_radiant = bool(is_radiant)
             count[is_radiant] += 1
             player_in_match = PlayerInMatch(user, self, is_radiant, count[is_radiant])
             self.players.append(player_in_match)
@@ -423,9 +507,11 @@ class Scoreboard(db.Model):
         loss: `int` number of losses.
         dodge: `int` number of dodges before game start.
         leave: `int` number of leaves mid-game.
+        rank: `int` place of the user in the ladder starting at 1, None if not ranked (cf. `refresh_ranks`).
         user: ORM relationship to the `User` this scoreboard is about.
     """
     __tablename__ = 'scoreboard'
+    __table_args__ = (db.Index('ix_scoreboard_ladder_name_rank', 'ladder_name', 'rank'),)
 
     user_id = db.Column(db.BigInteger(), db.ForeignKey('user.id'), primary_key=True)
     ladder_name = db.Column(db.String, primary_key=True)
@@ -436,6 +522,7 @@ class Scoreboard(db.Model):
     loss = db.Column(db.Integer, nullable=False, default=0, server_default='0')
     dodge = db.Column(db.Integer, nullable=False, default=0, server_default='0')
     leave = db.Column(db.Integer, nullable=False, default=0, server_default='0')
+    rank = db.Column(db.Integer, nullable=True)
 
     user = db.relationship('User', back_populates='scoreboards')
 
@@ -455,3 +542,312 @@ class Scoreboard(db.Model):
         self.loss = 0
         self.dodge = 0
         self.leave = 0
+
+    @staticmethod
+    def lock_ladders(ladder_names):
+        """Serialize the transactions changing the scoreboards or the ranks of ladders, until the end of the current one.
+
+        To call before any change of the transaction, so that the ranks are updated from the state committed by the
+        previous one. The ladders are locked in a fixed order to avoid deadlocks. Only Postgres is locked, the other
+        databases being used by a single process.
+
+        Args:
+            ladder_names: iterable of `str` names of the ladders (cf. constants).
+        """
+        if db.engine.dialect.name != 'postgresql':
+            return
+        for ladder_name in sorted(set(ladder_names)):
+            db.session().execute(db.select([db.func.pg_advisory_xact_lock(db.func.hashtext('scoreboard_' +
+                                                                                          ladder_name))]))
+
+    @staticmethod
+    def refresh_ranks(ladder_name):
+        """Recompute all the ranks of a ladder in the current session, only rewriting the ranks which changed.
+
+        Users are ranked by points then solo MMR (cf. `_ranking`), users without nickname are not ranked.
+        The ladder must be locked (cf. `lock_ladders`). This reads the whole ladder, the scoreboard changes of the
+        matches use `update_ranks` instead.
+
+        Args:
+            ladder_name: `str` name of the ladder (cf. constants).
+        """
+        db.session().flush()
+        Scoreboard._write_ranks(ladder_name, Scoreboard._ranking(ladder_name).subquery())
+        table = Scoreboard.__table__
+        db.session().execute(table.update()
+                             .where(table.c.ladder_name == ladder_name)
+                             .where(table.c.rank.isnot(None))
+                             .where(table.c.user_id.in_(db.session().query(User.id).filter(User.nickname.is_(None))))
+                             .values(rank=None))
+
+    @staticmethod
+    def update_ranks(ladder_name, points_changes):
+        """Update the ranks of a ladder after changes of some scoreboards in the current transaction.
+
+        The other ranks being consistent, only the scoreboards passed over by a changed one move, by one place for
+        each one passing them. They are read between the points before and after each change, or down to the bottom
+        of the ladder for a user entering or leaving the ranking, then shifted by rank ranges in a single statement.
+        The ladder must be locked since the start of the transaction (cf. `lock_ladders`).
+
+        Args:
+            ladder_name: `str` name of the ladder (cf. constants).
+            points_changes: `dict` of the points variation of the changed scoreboards indexed by user ID, 0 for the
+                scoreboards of a user who got or lost a nickname.
+        """
+        if len(points_changes) == 0:
+            return
+        db.session().flush()
+        solo_mmr = db.func.coalesce(User.solo_mmr, 0)
+        changed = db.session().query(Scoreboard.user_id, Scoreboard.points, Scoreboard.rank, User.nickname, solo_mmr) \
+            .join(User, User.id == Scoreboard.user_id) \
+            .filter(Scoreboard.ladder_name == ladder_name) \
+            .filter(Scoreboard.user_id.in_(list(points_changes))) \
+            .all()
+
+        def after(key):
+            points, mmr, user_id = -key[0], -key[1], key[2]
+            return db.or_(Scoreboard.points < points,
+                          db.and_(Scoreboard.points == points,
+                                  db.or_(solo_mmr < mmr, db.and_(solo_mmr == mmr, Scoreboard.user_id > user_id))))
+
+        # Places in the ranking as sort keys, before and after the changes, and the places in between
+        old_keys, new_keys, old_ranks, ranges = {}, {}, {}, []
+        for user_id, points, rank, nickname, mmr in changed:
+            if rank is not None:
+                old_keys[user_id] = (points_changes[user_id] - points, -mmr, user_id)
+                old_ranks[user_id] = rank
+            if nickname is not None:
+                new_keys[user_id] = (-points, -mmr, user_id)
+            keys = sorted(keys[user_id] for keys in (old_keys, new_keys) if user_id in keys)
+            if len(keys) == 2:
+                ranges.append(db.and_(Scoreboard.points.between(-keys[1][0], -keys[0][0]),
+                                      after(keys[0]), db.not_(after(keys[1]))))
+            elif len(keys) == 1:
+                ranges.append(db.and_(Scoreboard.points <= -keys[0][0], after(keys[0])))
+        if len(ranges) == 0:
+            return
+
+        def count_before(keys, key):
+            return len([other for other in keys.values() if other < key])
+
+        # Other ranked scoreboards possibly passed over, with their shift
+        passed = []
+        for user_id, points, rank, mmr in db.session().query(Scoreboard.user_id, Scoreboard.points, Scoreboard.rank,
+                                                             solo_mmr) \
+                .join(User, User.id == Scoreboard.user_id) \
+                .filter(Scoreboard.ladder_name == ladder_name) \
+                .filter(Scoreboard.rank.isnot(None)) \
+                .filter(Scoreboard.user_id.notin_([row[0] for row in changed])) \
+                .filter(db.or_(*ranges)) \
+                .order_by(Scoreboard.rank):
+            key = (-points, -mmr, user_id)
+            passed.append((rank, count_before(new_keys, key) - count_before(old_keys, key), key))
+
+        # New places of the changed scoreboards, from the other scoreboards above them
+        others = (db.session().query(db.func.max(Scoreboard.rank))
+                  .filter(Scoreboard.ladder_name == ladder_name)
+                  .scalar() or 0) - len(old_keys)
+        new_ranks = {}
+        for user_id, key in new_keys.items():
+            if user_id in old_keys:
+                old_key = old_keys[user_id]
+                above = old_ranks[user_id] - 1 - count_before(old_keys, old_key)
+                above += len([other for _, _, other in passed if old_key < other < key])
+                above -= len([other for _, _, other in passed if key < other < old_key])
+            else:
+                above = others - len([other for _, _, other in passed if other > key])
+            new_ranks[user_id] = 1 + above + count_before(new_keys, key)
+
+        # Ranges of consecutive ranks with the same shift, the changed scoreboards being set apart
+        segments = []
+        for rank, shift, _ in passed:
+            if len(segments) != 0 and segments[-1][2] == shift and \
+                    all(gap in old_ranks.values() for gap in range(segments[-1][1] + 1, rank)):
+                segments[-1][1] = rank
+            else:
+                segments.append([rank, rank, shift])
+        segments = [(first, last, shift) for first, last, shift in segments if shift != 0]
+
+        table = Scoreboard.__table__
+        cases = [(table.c.user_id == row[0], new_ranks.get(row[0], db.null())) for row in changed]
+        cases += [(table.c.rank.between(first, last), table.c.rank + shift) for first, last, shift in segments]
+        db.session().execute(table.update()
+                             .where(table.c.ladder_name == ladder_name)
+                             .where(db.or_(table.c.user_id.in_([row[0] for row in changed]),
+                                           *[table.c.rank.between(first, last) for first, last, _ in segments]))
+                             .values(rank=db.case(cases, else_=table.c.rank)))
+
+    @staticmethod
+    def _ranking(ladder_name):
+        """Query the places of the users with a nickname in a ladder.
+
+        Users are ranked by points then solo MMR, an unknown MMR counting as 0, then by ID.
+
+        Args:
+            ladder_name: `str` name of the ladder (cf. constants).
+        Returns:
+            Query of the (user_id, place) rows.
+        """
+        place = db.func.row_number().over(order_by=(Scoreboard.points.desc(),
+                                                     db.func.coalesce(User.solo_mmr, 0).desc(),
+                                                     Scoreboard.user_id))
+        return db.session().query(Scoreboard.user_id.label('user_id'), place.label('place')) \
+            .join(User, User.id == Scoreboard.user_id) \
+            .filter(Scoreboard.ladder_name == ladder_name) \
+            .filter(User.nickname.isnot(None))
+
+    @staticmethod
+    def _write_ranks(ladder_name, ranked):
+        """Write the places of a ranking subquery as ranks, only rewriting the ranks which changed.
+
+        Args:
+            ladder_name: `str` name of the ladder (cf. constants).
+            ranked: subquery of (user_id, place) rows.
+        """
+        table = Scoreboard.__table__
+        if db.engine.dialect.name == 'postgresql':
+            db.session().execute(table.update()
+                                 .where(table.c.ladder_name == ladder_name)
+                                 .where(table.c.user_id == ranked.c.user_id)
+                                 .where(table.c.rank.is_distinct_from(ranked.c.place))
+                                 .values(rank=ranked.c.place))
+        else:
+            # Fallback for databases without UPDATE FROM, one statement with a row per changed rank
+            changes = db.session().query(ranked.c.user_id, ranked.c.place) \
+                .join(Scoreboard, db.and_(Scoreboard.user_id == ranked.c.user_id,
+                                          Scoreboard.ladder_name == ladder_name)) \
+                .filter(Scoreboard.rank.is_distinct_from(ranked.c.place)) \
+                .all()
+            if len(changes) != 0:
+                db.session().execute(table.update()
+                                     .where(table.c.ladder_name == ladder_name)
+                                     .where(table.c.user_id == db.bindparam('ranked_id'))
+                                     .values(rank=db.bindparam('place')),
+                                     [{'ranked_id': user_id, 'place': place} for user_id, place in changes])
+
+
+class ScoreContribution(db.Model):
+    """What the result of a player in a match brought to its scoreboard, to revise this match alone later.
+
+    Attributes:
+        match_id: `Match` ID of the contribution.
+        user_id: `User` ID of the player.
+        ladder_name: ladder name of the scoreboard modified (cf. constants).
+        points: `int` points brought.
+        matches: `int` matches brought.
+        win: `int` wins brought.
+        loss: `int` losses brought.
+        dodge: `int` dodges brought.
+        leave: `int` leaves brought.
+    """
+    __tablename__ = 'score_contribution'
+
+    match_id = db.Column(db.Integer, db.ForeignKey('match.id'), primary_key=True)
+    user_id = db.Column(db.BigInteger(), db.ForeignKey('user.id'), primary_key=True, index=True)
+    ladder_name = db.Column(db.String, nullable=False)
+
+    points = db.Column(db.Integer, nullable=False, default=0, server_default='0')
+    matches = db.Column(db.Integer, nullable=False, default=0, server_default='0')
+    win = db.Column(db.Integer, nullable=False, default=0, server_default='0')
+    loss = db.Column(db.Integer, nullable=False, default=0, server_default='0')
+    dodge = db.Column(db.Integer, nullable=False, default=0, server_default='0')
+    leave = db.Column(db.Integer, nullable=False, default=0, server_default='0')
+
+    def __init__(self, match_id, user_id, ladder_name):
+        """Create an empty contribution.
+
+        Args:
+            match_id: `Match` ID of the contribution.
+            user_id: `User` ID of the player.
+            ladder_name: `str` name of the ladder (cf. constants).
+        """
+        self.match_id = match_id
+        self.user_id = user_id
+        self.ladder_name = ladder_name
+
+
+class Checkpoint(db.Model):
+    """Progress marker of a maintenance script over the match history.
+
+    Attributes:
+        name: unique name of the script using this checkpoint.
+        match_id: ID of the last `Match` processed, all previous matches being finished.
+        updated: `datetime` of the last checkpoint update.
+    """
+    __tablename__ = 'checkpoint'
+
+    name = db.Column(db.String(40), primary_key=True)
+    match_id = db.Column(db.Integer, nullable=False)
+    updated = db.Column(db.DateTime, nullable=False)
+
+    def __init__(self, name, match_id):
+        """Create a new checkpoint.
+
+        Args:
+            name: unique name of the script.
+            match_id: ID of the last `Match` processed.
+        """
+        self.name = name
+        self.match_id = match_id
+        self.updated = datetime.utcnow()
+
+
+class Setting(db.Model):
+    """Application setting changed at runtime, shared by all the web workers.
+
+    Attributes:
+        name: unique name of the setting, the configuration key it overrides.
+        value: `str` value of the setting.
+    """
+    __tablename__ = 'setting'
+
+    name = db.Column(db.String(40), primary_key=True)
+    value = db.Column(db.String, nullable=False)
+
+    def __init__(self, name, value):
+        """Create a new setting.
+
+        Args:
+            name: unique name of the setting.
+            value: `str` value of the setting.
+        """
+        self.name = name
+        self.value = value
+
+
+class JobEntry(db.Model):
+    """Job waiting in the database queue backend (cf. job_queue).
+
+    Attributes:
+        id: entry ID, also the delivery order.
+        body: `bytes` of the encoded job.
+        created: `datetime` of the entry creation.
+        taken: `datetime` of the last delivery to a consumer, None if available.
+        taken_by: name of the consumer the entry was last delivered to, None if available.
+    """
+    __tablename__ = 'job_entry'
+
+    id = db.Column(db.Integer, primary_key=True)
+    body = db.Column(db.LargeBinary, nullable=False)
+    created = db.Column(db.DateTime, nullable=False)
+    taken = db.Column(db.DateTime, nullable=True, index=True)
+    taken_by = db.Column(db.String, nullable=True)
+
+
+# Loader options of the relationships walked by each use case, to load them with the queried entities
+LOADER_PROFILES = {
+    'match_with_players': (joinedload(Match.players).joinedload(PlayerInMatch.player),),
+    'player_with_user': (joinedload(PlayerInMatch.player),),
+    'user_with_scan_info': (joinedload(User.profile_scan_info),),
+}
+
+
+def load_profile(name):
+    """Loader options of a named profile (cf. LOADER_PROFILES), to pass to `Query.options`.
+
+    Args:
+        name: name of the profile.
+    Returns:
+        `tuple` of loader options.
+    """
+    return LOADER_PROFILES[name]
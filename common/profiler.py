@@ -0,0 +1,136 @@
+import heapq
+import json
+import logging
+from threading import Lock
+from time import perf_counter
+
+from flask import g, has_app_context, has_request_context, request
+from sqlalchemy import event
+
+from common.models import db
+
+# Name of the setting holding the profiler state shared by the processes
+PROFILER_SETTING = 'QUERY_PROFILER'
+
+
+class QueryProfiler:
+    """Profiler of the SQL queries of an application, grouped by unit of work.
+
+    A unit is an application context: a web request named after its endpoint, or a bot phase named with
+    `name_unit`. At the end of each unit, its query count and database time are added to the totals of its name
+    and logged as a JSON line. Statements slower than the threshold are logged and the slowest are kept.
+    When disabled, the cost is a flag check per query.
+
+    Attributes:
+        enabled: `Boolean` True to record the queries, can be changed at runtime.
+        slow_threshold: seconds from which a statement is logged as slow.
+        slowest_count: number of slowest statements kept.
+        totals: `dict` of `list` [units, queries, database seconds, max queries] indexed by unit name.
+        slowest: heap of tuple (seconds, statement, unit name) of the slowest statements.
+        lock: `Lock` protecting the totals and the slowest statements.
+    """
+
+    def __init__(self, app, enabled=False, slow_threshold=200, slowest_count=20):
+        """Hook the profiler on the database engine and the application contexts of an application.
+
+        Args:
+            app: Flask application to profile.
+            enabled: `Boolean` True to start recording immediately.
+            slow_threshold: milliseconds from which a statement is logged as slow.
+            slowest_count: number of slowest statements kept.
+        """
+        self.enabled = enabled
+        self.slow_threshold = slow_threshold / 1000
+        self.slowest_count = slowest_count
+        self.totals = {}
+        self.slowest = []
+        self.lock = Lock()
+
+        engine = db.get_engine(app)
+        event.listen(engine, 'before_cursor_execute', self._before_execute)
+        event.listen(engine, 'after_cursor_execute', self._after_execute)
+        app.teardown_appcontext(self._end_unit)
+
+    @staticmethod
+    def name_unit(name):
+        """Name the unit of the current application context, web requests being named after their endpoint.
+
+        Args:
+            name: `str` name of the unit.
+        """
+        g.query_profile_name = name
+
+    def report(self):
+        """Summarize the recorded queries.
+
+        Returns:
+            tuple (units, slowest) with the `list` of `dict` name/units/queries/max_queries/db_time of the unit
+            names sorted by database time, and the `list` of `dict` duration/statement/unit of the slowest
+            statements, slowest first.
+        """
+        with self.lock:
+            units = [{'name': name, 'units': units, 'queries': queries, 'max_queries': max_queries,
+                      'db_time': db_time}
+                     for name, (units, queries, db_time, max_queries) in self.totals.items()]
+            slowest = [{'duration': duration, 'statement': statement, 'unit': name}
+                       for duration, statement, name in sorted(self.slowest, reverse=True)]
+        units.sort(key=lambda unit: unit['db_time'], reverse=True)
+        return units, slowest
+
+    def reset(self):
+        """Forget all recorded queries."""
+        with self.lock:
+            self.totals = {}
+            self.slowest = []
+
+    def _before_execute(self, conn, cursor, statement, parameters, context, executemany):
+        if self.enabled:
+            conn.info.setdefault('query_profile_start', []).append(perf_counter())
+
+    def _after_execute(self, conn, cursor, statement, parameters, context, executemany):
+        starts = conn.info.get('query_profile_start')
+        if not starts:
+            return
+        duration = perf_counter() - starts.pop()
+        if not has_app_context():
+            name = 'other'
+        else:
+            profile = g.get('query_profile')
+            if profile is None:
+                # Named at the first query, the request context being gone when the unit ends
+                profile = g.query_profile = [self._unit_name(), 0, 0.0]
+            name = profile[0]
+            profile[1] += 1
+            profile[2] += duration
+
+        if duration >= self.slow_threshold:
+            logging.warning('slow_query %s', json.dumps({'unit': name, 'duration_ms': round(duration * 1000, 1),
+                                                         'statement': statement}))
+        if len(self.slowest) == self.slowest_count and duration <= self.slowest[0][0]:
+            return
+        with self.lock:
+            if len(self.slowest) < self.slowest_count:
+                heapq.heappush(self.slowest, (duration, statement, name))
+            elif duration > self.slowest[0][0]:
+                heapq.heapreplace(self.slowest, (duration, statement, name))
+
+    def _end_unit(self, exception):
+        profile = g.pop('query_profile', None)
+        if profile is None:
+            return
+        name, queries, db_time = profile
+        with self.lock:
+            totals = self.totals.setdefault(name, [0, 0, 0.0, 0])
+            totals[0] += 1
+            totals[1] += queries
+            totals[2] += db_time
+            totals[3] = max(totals[3], queries)
+        logging.info('query_profile %s', json.dumps({'unit': name, 'queries': queries,
+                                                     'db_time_ms': round(db_time * 1000, 1)}))
+
+    @staticmethod
+    def _unit_name():
+        name = g.get('query_profile_name')
+        if name is None and has_request_context():
+            name = request.endpoint
+        return name or 'other'
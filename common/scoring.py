@@ -0,0 +1,186 @@
+from sqlalchemy.dialects import postgresql
+
+from common.models import db, Scoreboard, ScoreContribution
+
+# Scoreboard counters derived from the match results
+SCORE_FIELDS = ('points', 'matches', 'win', 'loss', 'dodge', 'leave')
+
+
+def player_contribution(is_dodge, is_leaver, is_radiant, radiant_win):
+    """Compute what the result of a player in a match brings to its scoreboard.
+
+    Args:
+        is_dodge: `Boolean` True iff the player did not join the match.
+        is_leaver: `Boolean` True iff the player left the match in progress.
+        is_radiant: `Boolean` True iff the player is Radiant.
+        radiant_win: `Boolean` True/False iff Radiant/Dire wins, None otherwise.
+    Returns:
+        `dict` of the counter variations indexed by field name, None if the match does not count for the player.
+    """
+    if not is_dodge and not is_leaver and radiant_win is None:
+        return None
+
+    contribution = dict.fromkeys(SCORE_FIELDS, 0)
+    if is_dodge:
+        contribution['points'] -= 2
+        contribution['dodge'] += 1
+    elif is_leaver:
+        contribution['points'] -= 3
+        contribution['leave'] += 1
+        if radiant_win is not None:
+            contribution['matches'] += 1
+    else:
+        contribution['matches'] += 1
+        if radiant_win == is_radiant:
+            contribution['points'] += 1
+            contribution['win'] += 1
+        else:
+            contribution['loss'] += 1
+    return contribution
+
+
+class ScoreboardDeltas:
+    """Accumulator of scoreboard counters, indexed by user and ladder, written to the database in one statement.
+
+    Attributes:
+        deltas: `dict` of counters `dict`, indexed by (user_id, ladder_name).
+    """
+
+    def __init__(self):
+        """Create an empty accumulator."""
+        self.deltas = {}
+
+    def add(self, user_id, ladder_name, contribution):
+        """Add a contribution to the counters of a scoreboard.
+
+        Args:
+            user_id: `User` ID of the scoreboard.
+            ladder_name: ladder name of the scoreboard (cf. constants).
+            contribution: `dict` of the counter variations indexed by field name, ignored if None.
+        """
+        if contribution is None:
+            return
+        counters = self.deltas.setdefault((user_id, ladder_name), dict.fromkeys(SCORE_FIELDS, 0))
+        for field in SCORE_FIELDS:
+            counters[field] += contribution.get(field, 0)
+
+    def remove(self, user_id, ladder_name, contribution):
+        """Subtract a contribution from the counters of a scoreboard, to revise the result of a match.
+
+        Args:
+            user_id: `User` ID of the scoreboard.
+            ladder_name: ladder name of the scoreboard (cf. constants).
+            contribution: `dict` of the counter variations indexed by field name, ignored if None.
+        """
+        if contribution is None:
+            return
+        self.add(user_id, ladder_name, {field: -value for field, value in contribution.items()})
+
+    def __len__(self):
+        return len(self.deltas)
+
+    def rows(self):
+        """Export the counters as scoreboard rows.
+
+        Returns:
+            `list` of `dict` with the scoreboard columns.
+        """
+        rows = []
+        for (user_id, ladder_name), counters in self.deltas.items():
+            row = {'user_id': user_id, 'ladder_name': ladder_name}
+            row.update(counters)
+            rows.append(row)
+        return rows
+
+    def write(self, replace, chunk_size=5000):
+        """Upsert the counters in the scoreboard table, without committing.
+
+        Args:
+            replace: `Boolean` True to overwrite the existing counters, False to add to them.
+            chunk_size: maximum number of rows sent in one statement.
+        """
+        rows = self.rows()
+        if len(rows) == 0:
+            return
+
+        if db.engine.dialect.name != 'postgresql':
+            self._write_orm(rows, replace)
+            return
+
+        table = Scoreboard.__table__
+        for start in range(0, len(rows), chunk_size):
+            statement = postgresql.insert(table).values(rows[start:start + chunk_size])
+            if replace:
+                values = {field: statement.excluded[field] for field in SCORE_FIELDS}
+            else:
+                values = {field: table.c[field] + statement.excluded[field] for field in SCORE_FIELDS}
+            db.session.execute(statement.on_conflict_do_update(index_elements=[table.c.user_id, table.c.ladder_name],
+                                                               set_=values))
+
+    def update_ranks(self):
+        """Rewrite the ranks around the scoreboards written, in each ladder (cf. `Scoreboard.update_ranks`)."""
+        ladders = {}
+        for (user_id, ladder_name), counters in self.deltas.items():
+            ladders.setdefault(ladder_name, {})[user_id] = counters['points']
+        for ladder_name, points_changes in ladders.items():
+            Scoreboard.update_ranks(ladder_name, points_changes)
+
+    @staticmethod
+    def _write_orm(rows, replace):
+        """Fallback of `write` for databases without upsert support, one query per scoreboard."""
+        for row in rows:
+            scoreboard = Scoreboard.query.filter_by(user_id=row['user_id'], ladder_name=row['ladder_name']).first()
+            if scoreboard is None:
+                db.session.execute(Scoreboard.__table__.insert().values(**row))
+                continue
+            for field in SCORE_FIELDS:
+                if replace:
+                    setattr(scoreboard, field, row[field])
+                else:
+                    setattr(scoreboard, field, getattr(scoreboard, field) + row[field])
+
+
+def apply_match_contributions(match):
+    """Bring the scoreboards in line with the current result of a match, without committing nor updating ranks.
+
+    The contributions of the players are compared to the ones recorded the last time the match was applied,
+    only the differences are written to the scoreboards and the records replaced. Applying a match twice has no
+    effect, and changing its outcome afterwards only revises this match.
+    The ladder of the match must be locked since the start of the transaction (cf. `Scoreboard.lock_ladders`),
+    the ranks are then updated with the returned deltas.
+
+    Args:
+        match: `Match` to apply, with the current state of its players.
+    Returns:
+        `ScoreboardDeltas` written to the scoreboards.
+    """
+    recorded = {record.user_id: record for record in ScoreContribution.query.filter_by(match_id=match.id).all()}
+    scoreboards = ScoreboardDeltas()
+    for player in match.players:
+        contribution = player_contribution(player.is_dodge, player.is_leaver, player.is_radiant, match.radiant_win)
+        record = recorded.pop(player.player_id, None)
+        if record is not None:
+            scoreboards.remove(record.user_id, record.ladder_name,
+                               {field: getattr(record, field) for field in SCORE_FIELDS})
+        if contribution is None:
+            if record is not None:
+                db.session.delete(record)
+            continue
+
+        if record is None:
+            record = ScoreContribution(match.id, player.player_id, match.section)
+            db.session.add(record)
+        for field in SCORE_FIELDS:
+            setattr(record, field, contribution[field])
+        scoreboards.add(player.player_id, match.section, contribution)
+
+    # Players no longer in the match
+    for record in recorded.values():
+        scoreboards.remove(record.user_id, record.ladder_name, {field: getattr(record, field) for field in SCORE_FIELDS})
+        db.session.delete(record)
+
+    # Drop the scoreboards left unchanged
+    scoreboards.deltas = {key: counters for key, counters in scoreboards.deltas.items()
+                          if any(value != 0 for value in counters.values())}
+    scoreboards.write(replace=False)
+    return scoreboards
@@ -1,14 +1,27 @@
 from datetime import datetime
+from queue import Queue, Empty
+from threading import Thread
+from time import time
+import logging
 
+import requests
 from flask_script import Manager
+from sqlalchemy import func
 
-from web.web_application import app, db
-from common.job_queue import QueueAdapter, JobScan
-from common.models import User, Scoreboard, Match, ProfileScanInfo, QueuedPlayer, PlayerInMatch
+from web.web_application import app, db, job_queue
+from common.job_queue import JobScanBatch, JobRefreshAvatars
+from common.models import load_profile, User, Scoreboard, Match, ProfileScanInfo, QueuedPlayer, PlayerInMatch, \
+    Checkpoint, ScoreContribution
+from common.scoring import ScoreboardDeltas, player_contribution, SCORE_FIELDS
 import common.constants as constants
 
 manager = Manager(app)
 
+logging.basicConfig(format='[%(asctime)s] %(levelname)s %(message)s', level=logging.INFO)
+
+# Name of the checkpoint of the scoreboard computation
+SCOREBOARD_CHECKPOINT = 'scoreboards'
+
 
 ###########
 # Scripts #
@@ -30,58 +43,179 @@ def make_admin(steam_id):
         db.session().commit()
 
 
-@manager.command
-def recompute_scoreboards():
-    """Delete all current scoreboard aggregates and rebuild them from match data."""
+@manager.option('-s', '--since', dest='since', default=None)
+@manager.option('-c', '--checkpoint', dest='use_checkpoint', action='store_true', default=False)
+def recompute_scoreboards(since, use_checkpoint):
+    """Rebuild the scoreboard aggregates and the match contributions from match data.
+
+    Scoreboards are kept up to date match by match (cf. `apply_match_contributions`), this is for recovery.
+    Without option, all scoreboards are deleted and rebuilt.
+    In incremental mode, only the matches after a match ID are replayed: the contributions recorded for them are
+    subtracted from the scoreboards and the recomputed ones added, the earlier history is not read.
+
+    Args:
+        since: match ID, only later matches are replayed.
+        use_checkpoint: `Boolean` True to start from the match ID stored by the last run.
+    """
+    if use_checkpoint:
+        checkpoint = Checkpoint.query.filter_by(name=SCOREBOARD_CHECKPOINT).first()
+        since = None if checkpoint is None else checkpoint.match_id
+    elif since is not None:
+        since = int(since)
+
+    Scoreboard.lock_ladders([constants.LADDER_HIGH, constants.LADDER_LOW, constants.LADDER_MEDIUM])
+
+    # Rows needed to replay games, streamed with a server side cursor
+    query = db.session().query(PlayerInMatch.match_id, PlayerInMatch.player_id, PlayerInMatch.is_radiant, PlayerInMatch.is_leaver,
+                               PlayerInMatch.is_dodge, Match.section, Match.radiant_win) \
+        .join(Match, Match.id == PlayerInMatch.match_id) \
+        .order_by(Match.created, Match.id)
+
+    scoreboards = ScoreboardDeltas()
+    if since is None:
+        Scoreboard.query.delete(synchronize_session=False)
+        ScoreContribution.query.delete(synchronize_session=False)
+    else:
+        # Contributions of the replayed matches taken back, the replay adding them again as they are now
+        query = query.filter(PlayerInMatch.match_id > since)
+        recorded = db.session().query(ScoreContribution.user_id, ScoreContribution.ladder_name,
+                                      *[getattr(ScoreContribution, field) for field in SCORE_FIELDS]) \
+            .filter(ScoreContribution.match_id > since)
+        for row in recorded.execution_options(stream_results=True).yield_per(10000):
+            scoreboards.remove(row[0], row[1], dict(zip(SCORE_FIELDS, row[2:])))
+        ScoreContribution.query.filter(ScoreContribution.match_id > since).delete(synchronize_session=False)
+
+    # Replay games in memory
+    contributions = []
+    for match_id, player_id, is_radiant, is_leaver, is_dodge, section, radiant_win in \
+            query.execution_options(stream_results=True).yield_per(10000):
+        contribution = player_contribution(is_dodge, is_leaver, is_radiant, radiant_win)
+        if contribution is None:
+            continue
+        scoreboards.add(player_id, section, contribution)
+        contributions.append(dict(contribution, match_id=match_id, user_id=player_id, ladder_name=section))
+        if len(contributions) == 10000:
+            db.session.execute(ScoreContribution.__table__.insert(), contributions)
+            contributions = []
+    if len(contributions) != 0:
+        db.session.execute(ScoreContribution.__table__.insert(), contributions)
+
+    if since is None:
+        scoreboards.write(replace=True)
+    else:
+        # Drop the scoreboards left unchanged
+        scoreboards.deltas = {key: counters for key, counters in scoreboards.deltas.items()
+                              if any(value != 0 for value in counters.values())}
+        scoreboards.write(replace=False)
+    for ladder_name in [constants.LADDER_HIGH, constants.LADDER_LOW, constants.LADDER_MEDIUM]:
+        Scoreboard.refresh_ranks(ladder_name)
+
+    # Next run can start after the last match which can not change anymore
+    unfinished = db.session().query(func.min(Match.id)) \
+        .filter(Match.status.notin_([constants.MATCH_STATUS_CANCELLED, constants.MATCH_STATUS_ENDED])) \
+        .scalar()
+    if unfinished is None:
+        last_match = db.session().query(func.max(Match.id)).scalar() or 0
+    else:
+        last_match = unfinished - 1
+    checkpoint = Checkpoint.query.filter_by(name=SCOREBOARD_CHECKPOINT).first()
+    if checkpoint is None:
+        db.session.add(Checkpoint(SCOREBOARD_CHECKPOINT, last_match))
+    else:
+        checkpoint.match_id = last_match
+        checkpoint.updated = datetime.utcnow()
 
-    # Delete scoreboards
-    Scoreboard.query.delete()
     db.session.commit()
+    logging.info('%s scoreboards updated, checkpoint at match %s.', len(scoreboards), last_match)
+
 
-    # Replay all games
-    for match in Match.query.order_by(Match.created).all():
-        for player in match.players:
-            if not player.is_dodge and not player.is_leaver and match.radiant_win is None:
-                continue
-
-            scoreboard = player.player.scoreboards.filter_by(ladder_name=match.section).first()
-            if scoreboard is None:
-                scoreboard = Scoreboard(user=player.player, ladder_name=match.section)
-                db.session.add(scoreboard)
-
-            if player.is_dodge:
-                scoreboard.points -= 2
-                scoreboard.dodge += 1
-            elif player.is_leaver:
-                scoreboard.points -= 3
-                scoreboard.leave += 1
-                if match.radiant_win is not None:
-                    scoreboard.matches += 1
-            else:
-                if match.radiant_win is not None:
-                    scoreboard.matches += 1
-                    if (match.radiant_win and player.is_radiant) or (not match.radiant_win and not player.is_radiant):
-                        scoreboard.points += 1
-                        scoreboard.win += 1
-                    else:
-                        scoreboard.loss += 1
+@manager.command
+def refresh_ranks():
+    """Recompute the ranks of all ladders, for instance after MMR changes."""
+    Scoreboard.lock_ladders([constants.LADDER_HIGH, constants.LADDER_LOW, constants.LADDER_MEDIUM])
+    for ladder_name in [constants.LADDER_HIGH, constants.LADDER_LOW, constants.LADDER_MEDIUM]:
+        Scoreboard.refresh_ranks(ladder_name)
     db.session.commit()
 
 
 @manager.command
 def scan_all_users():
-    """Queue the refresh scan of all users."""
-    job_queue = QueueAdapter(app.config['RABBITMQ_LOGIN'], app.config['RABBITMQ_PASSWORD'])
-    for user in User.query.all():
+    """Queue the refresh scan of all users, by batches."""
+    batch = []
+    for user in User.query.options(*load_profile('user_with_scan_info')).all():
         if user.profile_scan_info is None:
             user.profile_scan_info = ProfileScanInfo(user)
 
         user.profile_scan_info.last_scan_request = datetime.utcnow()
-        job_queue.produce(JobScan(steam_id=user.id))
+        batch.append(user.id)
+        if len(batch) == app.config['SCAN_BATCH_SIZE']:
+            job_queue.produce(JobScanBatch(steam_ids=batch))
+            batch = []
+    if len(batch) != 0:
+        job_queue.produce(JobScanBatch(steam_ids=batch))
 
     db.session.commit()
 
 
+@manager.command
+def refresh_all_avatars():
+    """Queue the refresh of the Steam avatars of all users, by batches of a Steam API call."""
+    batch = []
+    for (user_id,) in db.session().query(User.id).yield_per(10000):
+        batch.append(user_id)
+        if len(batch) == 100:
+            job_queue.produce(JobRefreshAvatars(steam_ids=batch))
+            batch = []
+    if len(batch) != 0:
+        job_queue.produce(JobRefreshAvatars(steam_ids=batch))
+
+
+@manager.option('-u', '--url', dest='url', default='http://localhost:8000')
+@manager.option('-c', '--concurrency', dest='concurrency', default='16')
+@manager.option('-n', '--requests', dest='count', default='2000')
+def load_test(url, concurrency, count):
+    """Measure the throughput and latency of the queue and scoreboard endpoints of a running web server.
+
+    Run it against the server started with different WEB_WORKERS values to compare the serving modes.
+
+    Args:
+        url: base URL of the web server.
+        concurrency: number of concurrent clients.
+        count: number of requests per endpoint.
+    """
+    concurrency = int(concurrency)
+    count = int(count)
+    for endpoint in ['/api/ladder/queue/details', '/api/scoreboard/high?start=0&length=20']:
+        latencies = []
+        pending = Queue()
+        for i in range(0, count):
+            pending.put(i)
+
+        def client():
+            session = requests.Session()
+            while True:
+                try:
+                    pending.get_nowait()
+                except Empty:
+                    return
+                start = time()
+                session.get(url + endpoint).raise_for_status()
+                latencies.append(time() - start)
+
+        started = time()
+        threads = [Thread(target=client) for i in range(0, concurrency)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        duration = time() - started
+
+        latencies.sort()
+        logging.info('%s: %.0f requests/s, p50 %.1fms, p99 %.1fms', endpoint, len(latencies) / duration,
+                     latencies[len(latencies) // 2] * 1000,
+                     latencies[min(len(latencies) - 1, int(len(latencies) * 0.99))] * 1000)
+
+
 #######################
 # Setup Manage Script #
 #######################
@@ -0,0 +1,26 @@
+"""14/ Add trigram index of user nicknames.
+
+Revision ID: e4a7c2d90b18
+Revises: c81f4b6d2e35
+Create Date: 2026-10-17 17:41:15.302867
+
+"""
+
+# revision identifiers, used by Alembic.
+revision = 'e4a7c2d90b18'
+down_revision = 'c81f4b6d2e35'
+
+from alembic import op
+import sqlalchemy as sa
+
+
+def upgrade():
+    if op.get_bind().dialect.name == 'postgresql':
+        op.execute('CREATE EXTENSION IF NOT EXISTS pg_trgm')
+    op.create_index('ix_user_nickname_trgm', 'user', ['nickname'], unique=False,
+                    postgresql_using='gin', postgresql_ops={'nickname': 'gin_trgm_ops'})
+
+
+def downgrade():
+    # The pg_trgm extension is kept, it may be used by other objects of the database
+    op.drop_index('ix_user_nickname_trgm', table_name='user')
@@ -0,0 +1,98 @@
+import os
+from contextlib import contextmanager
+
+# Configuration of the tests, read when the application is created at the import of web.web_application
+os.environ.setdefault('DAZZAR_SETTINGS', os.path.join(os.path.dirname(__file__), 'settings.cfg'))
+
+import pytest
+from sqlalchemy import event
+
+from web.web_application import app as web_app, user_cache, render_cache
+from common.models import db, User
+
+
+def pytest_addoption(parser):
+    parser.addoption('--benchmark', action='store_true', help='run the benchmarks, skipped by default')
+
+
+def pytest_configure(config):
+    config.addinivalue_line('markers', 'benchmark: performance measurement, only run with --benchmark')
+
+
+def pytest_collection_modifyitems(config, items):
+    if config.getoption('--benchmark'):
+        return
+    skip = pytest.mark.skip(reason='benchmark, run with --benchmark')
+    for item in items:
+        if 'benchmark' in item.keywords:
+            item.add_marker(skip)
+
+
+@pytest.fixture
+def app():
+    """Application with an empty database, inside an application context."""
+    with web_app.app_context():
+        db.create_all()
+        yield web_app
+        db.session.remove()
+        db.drop_all()
+    # The IDs of the next test database are the same, nothing cached must survive
+    user_cache.users.invalidate()
+    render_cache.pages.invalidate()
+
+
+@pytest.fixture
+def make_users(app):
+    """Factory of users with a nickname and a solo MMR, committed in the database.
+
+    Returns:
+        function taking the number of users and the first Steam ID, returning the `list` of `User` created.
+    """
+    def make(count, first_id=76561197960265728):
+        users = []
+        for i in range(0, count):
+            user = User(first_id + i)
+            user.nickname = 'player{0}'.format(i)
+            user.solo_mmr = 3000 + i
+            users.append(user)
+        db.session.add_all(users)
+        db.session.commit()
+        return users
+    return make
+
+
+@pytest.fixture
+def record_queries(app):
+    """Recorder of the SQL statements sent to the database.
+
+    Returns:
+        context manager yielding the `list` of the statements executed inside it.
+    """
+    @contextmanager
+    def record():
+        statements = []
+
+        def before_execute(conn, cursor, statement, parameters, context, executemany):
+            statements.append(statement)
+
+        engine = db.get_engine(app)
+        event.listen(engine, 'before_cursor_execute', before_execute)
+        try:
+            yield statements
+        finally:
+            event.remove(engine, 'before_cursor_execute', before_execute)
+    return record
+
+
+@pytest.fixture
+def login():
+    """Log a user in a test client, through its session cookie.
+
+    Returns:
+        function taking the test client and the `User` to log in.
+    """
+    def log(client, user):
+        with client.session_transaction() as session:
+            session['_user_id'] = str(user.id)
+            session['_fresh'] = True
+    return log
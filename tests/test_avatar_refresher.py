@@ -0,0 +1,101 @@
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from threading import Thread
+from urllib.parse import urlparse, parse_qs
+import json
+
+import gevent
+import pytest
+
+from bot.avatar_refresher import AvatarRefresher
+from common.models import db, User
+
+
+class SteamApiStub(BaseHTTPRequestHandler):
+    """Handler answering GetPlayerSummaries with an avatar for each Steam ID, recording the calls."""
+    protocol_version = 'HTTP/1.1'
+
+    def do_GET(self):
+        url = urlparse(self.path)
+        steam_ids = parse_qs(url.query)['steamids'][0].split(',')
+        self.server.calls.append((url.path, self.client_address, steam_ids))
+        players = [{'steamid': steam_id, 'avatar': 'small/' + steam_id, 'avatarmedium': 'medium/' + steam_id,
+                    'avatarfull': 'full/' + steam_id} for steam_id in steam_ids]
+        body = json.dumps({'response': {'players': players}}).encode()
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+@pytest.fixture
+def steam_api(app, monkeypatch):
+    """Local stand-in of the Steam Web API, the application pointing at it.
+
+    Returns:
+        `list` of the calls received as tuple (path, client address, Steam IDs).
+    """
+    server = ThreadingHTTPServer(('127.0.0.1', 0), SteamApiStub)
+    server.calls = []
+    Thread(target=server.serve_forever, daemon=True).start()
+    monkeypatch.setitem(app.config, 'STEAM_API_URL', 'http://127.0.0.1:{0}'.format(server.server_address[1]))
+    yield server.calls
+    server.shutdown()
+    server.server_close()
+
+
+def wait_calls(calls, count, timeout=5):
+    """Let the refresher run until the API received a number of calls."""
+    with gevent.Timeout(timeout, False):
+        while len(calls) < count:
+            gevent.sleep(0.01)
+
+
+def test_avatars_are_refreshed_by_batch(app, make_users, steam_api):
+    steam_ids = [user.id for user in make_users(250)]
+    refresher = AvatarRefresher(app)
+    refresher.BATCH_DELAY = 0.1
+    refresher.start()
+
+    refresher.add(steam_ids)
+    wait_calls(steam_api, 3)
+    gevent.sleep(0.2)
+
+    assert sorted(len(ids) for path, address, ids in steam_api) == [50, 100, 100]
+    assert sorted(int(steam_id) for path, address, ids in steam_api for steam_id in ids) == steam_ids
+    assert {path for path, address, ids in steam_api} == {'/ISteamUser/GetPlayerSummaries/v2/'}
+    # One kept alive connection for all the calls
+    assert len({address for path, address, ids in steam_api}) == 1
+
+    db.session.expire_all()
+    user = User.query.get(steam_ids[0])
+    assert (user.avatar, user.avatar_medium, user.avatar_full) == \
+        ('small/{0}'.format(user.id), 'medium/{0}'.format(user.id), 'full/{0}'.format(user.id))
+    refresher.kill()
+
+
+def test_fresh_avatars_are_skipped(app, make_users, steam_api):
+    users = make_users(3)
+    refresher = AvatarRefresher(app)
+    refresher.BATCH_DELAY = 0.1
+    refresher.start()
+
+    refresher.add([user.id for user in users[0:2]])
+    wait_calls(steam_api, 1)
+    gevent.sleep(0.2)
+
+    # Only the user not refreshed within the freshness window is fetched
+    refresher.add([user.id for user in users])
+    wait_calls(steam_api, 2)
+    gevent.sleep(0.2)
+    assert [sorted(ids) for path, address, ids in steam_api] == [sorted(str(user.id) for user in users[0:2]),
+                                                                 [str(users[2].id)]]
+
+    # All fresh, no call
+    refresher.add([user.id for user in users])
+    gevent.sleep(0.3)
+    assert len(steam_api) == 2
+    refresher.kill()
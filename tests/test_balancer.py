@@ -0,0 +1,54 @@
+from itertools import combinations
+from time import perf_counter
+
+import numpy as np
+import pytest
+
+from common.balancer import balance_teams, greedy_teams, split_scores, BALANCE_DIFFERENCE, BALANCE_VARIANCE
+
+
+def difference(mmrs, teams):
+    """Absolute MMR difference between the Radiant and Dire teams."""
+    mmrs = np.asarray(mmrs)
+    return abs(mmrs[teams].sum() - mmrs[~teams].sum())
+
+
+def random_mmrs(seed):
+    return np.random.RandomState(seed).randint(1000, 7000, size=10)
+
+
+@pytest.mark.parametrize('seed', range(0, 50))
+def test_balance_matches_or_beats_greedy(seed):
+    mmrs = random_mmrs(seed)
+    teams = balance_teams(mmrs)
+
+    assert teams.sum() == 5
+    assert difference(mmrs, teams) <= difference(mmrs, greedy_teams(mmrs))
+    best = min(abs(2 * sum(mmrs[list(radiant)]) - mmrs.sum()) for radiant in combinations(range(0, 10), 5))
+    assert difference(mmrs, teams) == best
+
+
+def test_variance_strategy_splits_five_against_five():
+    teams = balance_teams(random_mmrs(0), BALANCE_VARIANCE)
+    assert teams.sum() == 5
+
+
+def test_balance_requires_ten_players():
+    with pytest.raises(ValueError):
+        balance_teams([3000] * 9)
+    with pytest.raises(ValueError):
+        split_scores([3000] * 10, 'unknown')
+
+
+@pytest.mark.benchmark
+def test_benchmark_balancers():
+    samples = [random_mmrs(seed) for seed in range(0, 1000)]
+    results = {}
+    for name, balance in [('exhaustive', lambda mmrs: balance_teams(mmrs, BALANCE_DIFFERENCE)),
+                          ('greedy', greedy_teams)]:
+        started = perf_counter()
+        differences = [difference(mmrs, balance(mmrs)) for mmrs in samples]
+        results[name] = np.mean(differences)
+        print('{0}: {1:.1f} us per match, mean MMR difference {2:.1f}'.format(
+            name, (perf_counter() - started) / len(samples) * 1e6, results[name]))
+    assert results['exhaustive'] <= results['greedy']
@@ -0,0 +1,179 @@
+from types import SimpleNamespace
+
+import gevent
+
+from bot.dota_bot import DotaBot
+from bot.fake_clients import FakeSteamClient, FakeDota2Client
+from common.job_queue import JobScan, JobCreateGame
+from common.models import db, Match, User
+import common.constants as constants
+
+
+def make_bot(app):
+    """Create a Dota bot over fake clients answering immediately, its manager recording the jobs ended.
+
+    Returns:
+        A tuple (bot, ended) with the `DotaBot` and the `list` of the `Job` given back to the manager.
+    """
+    def make_clients():
+        steam_client = FakeSteamClient(connect_delay=0, login_delay=0)
+        return steam_client, FakeDota2Client(steam_client, launch_delay=0, request_delay=0.01)
+
+    ended = []
+    manager = SimpleNamespace(app=app, make_clients=make_clients,
+                              bot_end=lambda bot, job, warm, duration: ended.append(job))
+    return DotaBot(manager, SimpleNamespace(login='test', password='test')), ended
+
+
+def wait_until(condition, timeout=5):
+    """Let the greenlets run until a condition is met, or the timeout expires."""
+    with gevent.Timeout(timeout, False):
+        while not condition():
+            gevent.sleep(0.01)
+
+
+def make_game(users):
+    """Create a match waiting for its lobby, its players being in it."""
+    match = Match(users, constants.LADDER_HIGH, [1] * len(users))
+    db.session.add(match)
+    db.session.commit()
+    for user in users:
+        user.current_match = match.id
+    db.session.commit()
+    return match.id
+
+
+def test_bot_survives_a_failing_job(app, make_users):
+    user = make_users(1)[0]
+    bot, ended = make_bot(app)
+    compute_job = bot.compute_job
+    jobs = [JobScan(user.id), JobScan(user.id)]
+
+    def fail_once():
+        if bot.job is jobs[0]:
+            raise RuntimeError('Steam error')
+        compute_job()
+    bot.compute_job = fail_once
+
+    bot.start()
+    for job in jobs:
+        bot.assign(job)
+    wait_until(lambda: len(ended) == 2)
+
+    assert ended == jobs
+    assert not bot.dead
+    bot.kill()
+
+
+def test_bot_abandons_a_job_not_finished_in_time(app, monkeypatch):
+    monkeypatch.setitem(app.config, 'BOT_JOB_TIMEOUT', 0.2)
+    bot, ended = make_bot(app)
+    bot.compute_job = lambda: None
+    job = JobScan(76561197960265728)
+
+    bot.start()
+    bot.assign(job)
+    wait_until(lambda: len(ended) == 1)
+
+    assert ended == [job]
+    assert bot.job is None
+    bot.kill()
+
+
+def test_failing_game_is_cancelled(app, make_users):
+    match_id = make_game(make_users(10))
+    bot, ended = make_bot(app)
+
+    def fail():
+        raise RuntimeError('Lobby error')
+    bot.initialize_lobby = fail
+
+    bot.start()
+    bot.assign(JobCreateGame(match_id))
+    wait_until(lambda: len(ended) == 1)
+
+    db.session.expire_all()
+    assert Match.query.get(match_id).status == constants.MATCH_STATUS_CANCELLED
+    assert User.query.filter(User.current_match.isnot(None)).count() == 0
+    assert bot.dota.lobby is None
+    bot.kill()
+
+
+def test_stuck_game_is_abandoned(app, make_users, monkeypatch):
+    monkeypatch.setitem(app.config, 'BOT_GAME_JOB_TIMEOUT', 0.5)
+    match_id = make_game(make_users(10))
+    bot, ended = make_bot(app)
+    waits = []
+
+    def wait_forever():
+        waits.append(gevent.getcurrent())
+        gevent.sleep(3600)
+    bot.manage_player_waiting = wait_forever
+
+    bot.start()
+    bot.assign(JobCreateGame(match_id))
+    wait_until(lambda: len(ended) == 1)
+
+    assert len(waits) == 1 and waits[0].dead
+    db.session.expire_all()
+    assert Match.query.get(match_id).status == constants.MATCH_STATUS_CANCELLED
+    assert User.query.filter(User.current_match.isnot(None)).count() == 0
+    bot.kill()
+
+
+def start_game_bot(app, game_duration):
+    """Create a bot hosting a game whose players are all placed, the game lasting some time."""
+    bot, ended = make_bot(app)
+    bot.dota.game_duration = game_duration
+    bot.manage_player_waiting = lambda: True
+    return bot, ended
+
+
+def test_game_wait_is_bounded(app, make_users, monkeypatch):
+    monkeypatch.setitem(app.config, 'GAME_MAX_DURATION', 0.3)
+    match_id = make_game(make_users(10))
+    bot, ended = start_game_bot(app, 3600)
+
+    bot.start()
+    bot.assign(JobCreateGame(match_id))
+    wait_until(lambda: len(ended) == 1)
+
+    db.session.expire_all()
+    assert Match.query.get(match_id).status == constants.MATCH_STATUS_CANCELLED
+    assert User.query.filter(User.current_match.isnot(None)).count() == 0
+    bot.kill()
+
+
+def test_game_wait_ends_with_the_session(app, make_users):
+    match_id = make_game(make_users(10))
+    bot, ended = start_game_bot(app, 3600)
+
+    def in_progress():
+        db.session.expire_all()
+        return Match.query.get(match_id).status == constants.MATCH_STATUS_IN_PROGRESS
+
+    bot.start()
+    bot.assign(JobCreateGame(match_id))
+    wait_until(in_progress)
+    bot.client.disconnect()
+    wait_until(lambda: len(ended) == 1)
+
+    assert len(ended) == 1
+    db.session.expire_all()
+    assert Match.query.get(match_id).status == constants.MATCH_STATUS_CANCELLED
+    bot.kill()
+
+
+def test_game_played_to_the_end(app, make_users):
+    match_id = make_game(make_users(10))
+    bot, ended = start_game_bot(app, 0.1)
+
+    bot.start()
+    bot.assign(JobCreateGame(match_id))
+    wait_until(lambda: len(ended) == 1)
+
+    db.session.expire_all()
+    match = Match.query.get(match_id)
+    assert match.status == constants.MATCH_STATUS_ENDED
+    assert match.radiant_win is not None
+    bot.kill()
@@ -0,0 +1,161 @@
+from time import perf_counter
+from types import SimpleNamespace
+import json
+import os
+import subprocess
+import sys
+
+from flask import Flask
+from sqlalchemy import event
+from sqlalchemy.pool import QueuePool
+import gevent
+import pytest
+
+from bot.dota_bot import DotaBot
+from bot.fake_clients import FakeSteamClient, FakeDota2Client
+from common.job_queue import JobScanBatch
+from common.models import db, engine_options, pool_statistics, User
+from web.web_application import app as web_app
+
+POOL_CONFIG = {'DATABASE_POOL_SIZE': 10, 'DATABASE_POOL_MAX_OVERFLOW': 10, 'DATABASE_POOL_TIMEOUT': 1,
+               'DATABASE_POOL_RECYCLE': 1800, 'DATABASE_POOL_PRE_PING': True, 'DATABASE_STATEMENT_TIMEOUT': 0}
+
+
+def test_engine_options_of_server_databases():
+    config = dict(POOL_CONFIG, SQLALCHEMY_DATABASE_URI='postgresql://dazzar@localhost/dazzar')
+
+    assert engine_options(config) == {'pool_size': 10, 'max_overflow': 10, 'pool_timeout': 1,
+                                      'pool_recycle': 1800, 'pool_pre_ping': True}
+    config['DATABASE_STATEMENT_TIMEOUT'] = 5000
+    assert engine_options(config)['connect_args'] == {'options': '-c statement_timeout=5000'}
+    # Only Postgres understands the statement timeout option
+    config['SQLALCHEMY_DATABASE_URI'] = 'mysql://dazzar@localhost/dazzar'
+    assert 'connect_args' not in engine_options(config)
+
+
+def test_engine_options_of_sqlite():
+    assert engine_options(dict(POOL_CONFIG, SQLALCHEMY_DATABASE_URI='sqlite://')) == {}
+
+
+def test_pool_statistics_without_pool(app):
+    # The tests share a single in memory connection, there is no pool to report
+    assert pool_statistics() == {}
+
+
+def make_pooled_app(database):
+    """Create an application on a file database behind a connection pool sized by `POOL_CONFIG`."""
+    app = Flask(__name__)
+    app.config.from_mapping(web_app.config)
+    app.config.update(POOL_CONFIG)
+    app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///{0}'.format(database)
+    # SQLite gets no pool options, the ones of a server database are given with an explicit pool
+    options = engine_options(dict(app.config, SQLALCHEMY_DATABASE_URI='postgresql://'))
+    app.config['SQLALCHEMY_ENGINE_OPTIONS'] = dict(options, poolclass=QueuePool)
+    db.init_app(app)
+    with app.app_context():
+        db.create_all()
+    return app
+
+
+@pytest.fixture
+def pooled_app(tmp_path):
+    """Application on a file database behind a connection pool, the tables created."""
+    app = make_pooled_app(tmp_path / 'dazzar.db')
+    yield app
+    with app.app_context():
+        db.get_engine(app).dispose()
+
+
+def test_pool_statistics(pooled_app):
+    with pooled_app.app_context():
+        connections = [db.engine.connect() for i in range(0, 12)]
+        assert pool_statistics() == {'size': 10, 'checked_in': 0, 'checked_out': 12, 'overflow': 2}
+        for connection in connections:
+            connection.close()
+        assert pool_statistics() == {'size': 10, 'checked_in': 10, 'checked_out': 0, 'overflow': 0}
+
+
+def make_bot(app, ended, index):
+    """Create a Dota bot over fake clients, its manager recording the jobs ended."""
+    def make_clients():
+        steam_client = FakeSteamClient(connect_delay=0, login_delay=0)
+        return steam_client, FakeDota2Client(steam_client, launch_delay=0, request_delay=0.01)
+
+    manager = SimpleNamespace(app=app, make_clients=make_clients,
+                              bot_end=lambda bot, job, warm, duration: ended.append(job))
+    return DotaBot(manager, SimpleNamespace(login='bot{0}'.format(index), password='test'))
+
+
+def run_bots(database, bot_count, batch_size):
+    """Scan users with bots sharing the connection pool, a batch each, to run in a process patched like the bot one.
+
+    Args:
+        database: path of the SQLite database to create.
+        bot_count: number of bots.
+        batch_size: number of users scanned by each bot.
+    Returns:
+        `dict` with the number of 'jobs' ended, the 'elapsed' time, the 'unscanned' users,
+        the 'peak' of connections checked out and the 'statistics' of the pool at the end.
+    """
+    app = make_pooled_app(database)
+    engine = db.get_engine(app)
+    checked_out = []
+
+    # With the cooperative driver a query lets the other bots run while it holds its connection
+    def cooperative_query(conn, cursor, statement, parameters, context, executemany):
+        if statement.startswith('SELECT'):
+            gevent.sleep(0.005)
+
+    def checkout(dbapi_connection, connection_record, connection_proxy):
+        checked_out.append(engine.pool.checkedout())
+
+    with app.app_context():
+        users = [User(76561197960265728 + i) for i in range(0, bot_count * batch_size)]
+        db.session.add_all(users)
+        db.session.commit()
+        steam_ids = [user.id for user in users]
+        db.session.remove()
+    event.listen(engine, 'before_cursor_execute', cooperative_query)
+    event.listen(engine.pool, 'checkout', checkout)
+
+    ended = []
+    bots = [make_bot(app, ended, i) for i in range(0, bot_count)]
+    start = perf_counter()
+    for i, bot in enumerate(bots):
+        bot.start()
+        bot.assign(JobScanBatch(steam_ids[i * batch_size:(i + 1) * batch_size]))
+    with gevent.Timeout(30, False):
+        while len(ended) < bot_count:
+            gevent.sleep(0.01)
+    elapsed = perf_counter() - start
+    event.remove(engine, 'before_cursor_execute', cooperative_query)
+    for bot in bots:
+        bot.kill()
+
+    with app.app_context():
+        unscanned = User.query.filter(User.solo_mmr.is_(None)).count()
+        db.session.remove()
+        return {'jobs': len(ended), 'elapsed': elapsed, 'unscanned': unscanned,
+                'peak': max(checked_out, default=0), 'statistics': pool_statistics()}
+
+
+def test_50_bots_share_the_pool(tmp_path):
+    # Waiting for a connection only lets the other bots run in a process patched by gevent, like the bot one
+    script = ('from gevent import monkey; monkey.patch_all()\n'
+              'import json, sys\n'
+              'from tests.test_database_pool import run_bots\n'
+              'print(json.dumps([run_bots(sys.argv[1], 1, 20), run_bots(sys.argv[2], 50, 20)]))')
+    root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    output = subprocess.run([sys.executable, '-c', script, str(tmp_path / 'single.db'), str(tmp_path / 'stress.db')],
+                            cwd=root, stdout=subprocess.PIPE, check=True, timeout=120).stdout
+    single, stress = json.loads(output.decode().splitlines()[-1])
+
+    # Every job saved its scans, none waited for a connection until the pool timeout
+    assert stress['jobs'] == 50
+    assert stress['unscanned'] == 0
+    assert 0 < stress['peak'] <= 20
+    assert stress['statistics']['checked_out'] == 0
+    # The bots ran side by side instead of queueing behind each other
+    assert stress['elapsed'] < 50 * single['elapsed'] / 3
+    print('\nA bot alone in {0:.3f}s, 50 bots in {1:.3f}s, up to {2} connections'.format(
+        single['elapsed'], stress['elapsed'], stress['peak']))
@@ -0,0 +1,107 @@
+from datetime import datetime, timedelta
+
+import pytest
+from sqlalchemy import event
+
+from common.models import db, Match
+import common.constants as constants
+
+LADDER = constants.LADDER_HIGH
+
+
+def make_matches(users, count):
+    """Create matches of the ladder, by groups of 3 created at the same time.
+
+    Returns:
+        `list` of the match IDs, newest first.
+    """
+    start = datetime(2026, 1, 1)
+    matches = []
+    for i in range(0, count):
+        match = Match(users, LADDER, [1] * len(users))
+        match.created = start + timedelta(minutes=i // 3)
+        matches.append(match)
+    db.session.add_all(matches)
+    db.session.commit()
+    matches.sort(key=lambda match: (match.created, match.id), reverse=True)
+    return [match.id for match in matches]
+
+
+def fetch_pages(client, url, arguments, total, length):
+    """Browse a listing page after page, then request a page beyond its end.
+
+    Returns:
+        `list` of the pages, each a `list` of match IDs.
+    """
+    pages = []
+    for start in range(0, total + length, length):
+        answer = client.get(url, query_string=dict(arguments, start=start, length=length)).get_json()
+        assert answer['recordsTotal'] == total
+        pages.append([row[0] for row in answer['data']])
+    return pages
+
+
+def explain(statement, parameters):
+    """SQLite query plan of a statement, as a single string."""
+    rows = db.engine.execute('EXPLAIN QUERY PLAN ' + statement, parameters).fetchall()
+    return ' | '.join(row[-1] for row in rows)
+
+
+@pytest.fixture
+def record_plans(app):
+    """Statements and parameters sent to the database, to explain their query plan, skipping the test if not SQLite."""
+    if db.engine.dialect.name != 'sqlite':
+        pytest.skip('query plans checked on SQLite')
+    statements = []
+
+    def before_execute(conn, cursor, statement, parameters, context, executemany):
+        statements.append((statement, parameters))
+
+    event.listen(db.engine, 'before_cursor_execute', before_execute)
+    yield statements
+    event.remove(db.engine, 'before_cursor_execute', before_execute)
+
+
+def test_ladder_matches_pages_are_stable_on_equal_dates(app, make_users):
+    expected = make_matches(make_users(10), 20)
+
+    pages = fetch_pages(app.test_client(), '/api/ladder/matches', {'section': LADDER}, 20, 6)
+    assert [len(page) for page in pages] == [6, 6, 6, 2, 0]
+    assert sum(pages, []) == expected
+
+    # Offset fallback when no cursor is known for the start requested
+    answer = app.test_client().get('/api/ladder/matches', query_string={'section': LADDER, 'start': 5, 'length': 4})
+    assert [row[0] for row in answer.get_json()['data']] == expected[5:9]
+
+
+def test_user_history_pages(app, make_users):
+    users = make_users(11)
+    expected = make_matches(users[:10], 7)
+    make_matches(users[1:], 3)
+
+    pages = fetch_pages(app.test_client(), '/api/user/{0}/matches'.format(users[0].id), {}, 7, 3)
+    assert [len(page) for page in pages] == [3, 3, 1, 0]
+    assert sum(pages, []) == sorted(expected, reverse=True)
+
+
+def test_listings_read_the_history_indexes(app, make_users, record_plans):
+    # The plans are only checked on SQLite, the database of the tests. The indexes are meant for Postgres, where the
+    # planner also weighs the table statistics: this only shows that the queries can be served by them.
+    users = make_users(10)
+    make_matches(users, 6)
+    client = app.test_client()
+    client.get('/api/ladder/matches', query_string={'section': LADDER, 'length': 3})
+    client.get('/api/ladder/matches', query_string={'section': LADDER, 'start': 3, 'length': 3})
+    client.get('/api/user/{0}/matches'.format(users[0].id), query_string={'length': 3})
+    client.get('/api/user/{0}/matches'.format(users[0].id), query_string={'start': 3, 'length': 3})
+
+    pages = [(statement, parameters) for statement, parameters in record_plans
+             if 'ORDER BY' in statement and 'LIMIT' in statement]
+    assert len(pages) == 4
+    for statement, parameters in pages:
+        plan = explain(statement, parameters)
+        assert 'TEMP B-TREE' not in plan
+        if 'FROM "match"' in statement:
+            assert 'ix_match_section_created' in plan
+        else:
+            assert 'COVERING INDEX ix_player_in_match_history' in plan
@@ -0,0 +1,152 @@
+from datetime import datetime, timedelta
+from threading import Thread
+from time import perf_counter, sleep
+
+import pytest
+
+from common.job_queue import QueueAdapter, MemoryBackend, DatabaseBackend, JobScan
+from common.models import db, JobEntry
+import common.metrics as metrics
+
+
+def subscribe(job_queue, prefetch):
+    """Subscribe to a queue, recording the jobs delivered.
+
+    Returns:
+        `list` of tuple (job, delivery_tag) delivered.
+    """
+    delivered = []
+    job_queue.subscribe(lambda job, delivery_tag: delivered.append((job, delivery_tag)), prefetch=prefetch)
+    return delivered
+
+
+def test_memory_queue_delivers_up_to_the_prefetch():
+    job_queue = QueueAdapter(MemoryBackend())
+    delivered = subscribe(job_queue, prefetch=2)
+    for steam_id in range(0, 5):
+        job_queue.produce(JobScan(steam_id))
+
+    job_queue.process_events(timeout=0.05)
+    assert [job.steam_id for job, delivery_tag in delivered] == [0, 1]
+    assert job_queue.depth() == 3
+
+    # Each acknowledgment frees a slot for the next job
+    job_queue.ack(delivered[0][1])
+    job_queue.process_events(timeout=0.05)
+    assert [job.steam_id for job, delivery_tag in delivered] == [0, 1, 2]
+
+    for job, delivery_tag in delivered[1:]:
+        job_queue.ack(delivery_tag)
+    job_queue.process_events(timeout=0.05)
+    assert [job.steam_id for job, delivery_tag in delivered] == [0, 1, 2, 3, 4]
+    assert job_queue.depth() == 0
+
+
+def test_undecodable_messages_are_dropped():
+    job_queue = QueueAdapter(MemoryBackend())
+    delivered = subscribe(job_queue, prefetch=1)
+    dropped = metrics.JOBS_DROPPED.values.get((), 0)
+    job_queue.backend.publish(b'\xc1')
+    job_queue.produce(JobScan(1))
+
+    # The dropped message is acknowledged, not holding the only slot
+    job_queue.process_events(timeout=0.05)
+    assert [job.steam_id for job, delivery_tag in delivered] == [1]
+    assert metrics.JOBS_DROPPED.values[()] == dropped + 1
+
+
+def test_waiting_consumer_is_woken_by_a_job():
+    job_queue = QueueAdapter(MemoryBackend())
+    delivered = subscribe(job_queue, prefetch=1)
+    consumer = Thread(target=job_queue.process_events, kwargs={'timeout': 1})
+    consumer.start()
+
+    sleep(0.05)
+    start = perf_counter()
+    job_queue.produce(JobScan(1))
+    while len(delivered) == 0 and perf_counter() - start < 1:
+        sleep(0.001)
+
+    # Pushed on arrival, far from the poll interval of a pulling consumer
+    assert perf_counter() - start < 0.5
+    job_queue.ack(delivered[0][1])
+    consumer.join()
+
+
+def test_database_queue_claims_and_acks(app):
+    job_queue = QueueAdapter(DatabaseBackend(app, owner='bot1'))
+    delivered = subscribe(job_queue, prefetch=2)
+    for steam_id in range(0, 3):
+        job_queue.produce(JobScan(steam_id))
+
+    job_queue.process_events(timeout=0)
+    assert [job.steam_id for job, delivery_tag in delivered] == [0, 1]
+    claims = JobEntry.query.filter(JobEntry.taken.isnot(None)).all()
+    assert [entry.taken_by for entry in claims] == ['bot1', 'bot1']
+    assert job_queue.depth() == 1
+
+    # Claims stored in the table count against the prefetch
+    job_queue.process_events(timeout=0)
+    assert len(delivered) == 2
+    job_queue.ack(delivered[0][1])
+    job_queue.process_events(timeout=0)
+    assert [job.steam_id for job, delivery_tag in delivered] == [0, 1, 2]
+    assert JobEntry.query.count() == 2
+
+
+def test_database_queue_redelivers_expired_claims(app, monkeypatch):
+    monkeypatch.setitem(app.config, 'JOB_QUEUE_CLAIM_TIMEOUT', 600)
+    first = QueueAdapter(DatabaseBackend(app, owner='bot1'))
+    first_delivered = subscribe(first, prefetch=1)
+    first.produce(JobScan(1))
+    first.process_events(timeout=0)
+    assert len(first_delivered) == 1
+
+    # Another consumer only gets the entry once the claim expired
+    second = QueueAdapter(DatabaseBackend(app, owner='bot2'))
+    second_delivered = subscribe(second, prefetch=1)
+    second.process_events(timeout=0)
+    assert len(second_delivered) == 0
+    JobEntry.query.update({'taken': datetime.utcnow() - timedelta(seconds=601)})
+    db.session.commit()
+    second.process_events(timeout=0)
+    assert [job.steam_id for job, delivery_tag in second_delivered] == [1]
+    assert JobEntry.query.one().taken_by == 'bot2'
+
+
+def test_database_queue_releases_the_claims_of_a_restarted_consumer(app):
+    job_queue = QueueAdapter(DatabaseBackend(app, owner='bot1'))
+    subscribe(job_queue, prefetch=1)
+    job_queue.produce(JobScan(1))
+    job_queue.process_events(timeout=0)
+
+    # Same consumer name after a restart, the job lost with the previous run is delivered again at once
+    restarted = QueueAdapter(DatabaseBackend(app, owner='bot1'))
+    delivered = subscribe(restarted, prefetch=1)
+    restarted.process_events(timeout=0)
+    assert [job.steam_id for job, delivery_tag in delivered] == [1]
+
+
+@pytest.mark.benchmark
+def test_benchmark_dispatch_latency():
+    job_queue = QueueAdapter(MemoryBackend())
+    latencies = []
+
+    def received(job, delivery_tag):
+        latencies.append(perf_counter() - job.steam_id)
+        job_queue.ack(delivery_tag)
+    job_queue.subscribe(received, prefetch=4)
+    consumer = Thread(target=job_queue.process_events, kwargs={'timeout': 3})
+    consumer.start()
+
+    # Publication time sent as the job field
+    for i in range(0, 1000):
+        job_queue.produce(JobScan(perf_counter()))
+        sleep(0.001)
+    consumer.join()
+
+    latencies.sort()
+    print('\n{0} jobs pushed: dispatch p50 {1:.3f}ms, p99 {2:.3f}ms, max {3:.3f}ms'.format(
+        len(latencies), latencies[len(latencies) // 2] * 1000, latencies[int(len(latencies) * 0.99)] * 1000,
+        latencies[-1] * 1000))
+    assert len(latencies) == 1000
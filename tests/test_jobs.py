@@ -0,0 +1,74 @@
+from time import perf_counter
+import pickle
+
+import msgpack
+import pytest
+
+from common.jobs import JOB_SCHEMA_VERSION, register_job, encode_job, decode_job, Job, JobScan, JobCreateGame, \
+    JobScanBatch, JobRefreshAvatars
+import common.job_queue as job_queue
+
+STEAM_IDS = [76561197960265728 + i for i in range(0, 100)]
+
+
+@pytest.mark.parametrize('job', [JobScan(STEAM_IDS[0]), JobCreateGame(42), JobScanBatch(STEAM_IDS),
+                                 JobRefreshAvatars(STEAM_IDS)], ids=lambda job: type(job).__name__)
+def test_jobs_round_trip(job):
+    decoded = decode_job(encode_job(job))
+
+    assert type(decoded) is type(job)
+    assert decoded.to_fields() == job.to_fields()
+
+
+def test_job_queue_reexports_the_codec():
+    assert job_queue.JobScan is JobScan
+    assert job_queue.decode_job is decode_job
+
+
+def test_unknown_fields_are_ignored():
+    body = msgpack.packb([JOB_SCHEMA_VERSION, JobCreateGame.tag, {'match_id': 42, 'priority': 1}], use_bin_type=True)
+
+    job = JobCreateGame.from_fields({'match_id': 42, 'priority': 1})
+    assert job.match_id == 42 and not hasattr(job, 'priority')
+    assert decode_job(body).to_fields() == {'match_id': 42}
+
+
+def test_newer_schema_version_is_decoded():
+    body = msgpack.packb([JOB_SCHEMA_VERSION + 1, JobScan.tag, {'steam_id': STEAM_IDS[0]}, 'extra'],
+                         use_bin_type=True)
+
+    assert decode_job(body).steam_id == STEAM_IDS[0]
+
+
+@pytest.mark.parametrize('body', [
+    msgpack.packb([JOB_SCHEMA_VERSION, 999, {}], use_bin_type=True),
+    msgpack.packb({'tag': JobScan.tag}, use_bin_type=True),
+    msgpack.packb([JOB_SCHEMA_VERSION, JobScan.tag], use_bin_type=True),
+    b'\xc1',
+], ids=['unknown tag', 'not an array', 'missing fields', 'not msgpack'])
+def test_invalid_messages_are_rejected(body):
+    with pytest.raises(ValueError):
+        decode_job(body)
+
+
+def test_tags_are_unique():
+    with pytest.raises(ValueError):
+        @register_job(JobScan.tag)
+        class JobDuplicate(Job):
+            pass
+
+
+@pytest.mark.benchmark
+def test_benchmark_job_encoding():
+    jobs = [JobScan(STEAM_IDS[0]), JobScanBatch(STEAM_IDS)]
+    rounds = 20000
+    for job in jobs:
+        measures = {}
+        for name, encode, decode in [('msgpack', encode_job, decode_job), ('pickle', pickle.dumps, pickle.loads)]:
+            body = encode(job)
+            start = perf_counter()
+            for i in range(0, rounds):
+                decode(encode(job))
+            measures[name] = (len(body), (perf_counter() - start) / rounds * 1e6)
+        print('\n{0}: {1}'.format(type(job).__name__, ', '.join(
+            '{0} {1} bytes {2:.1f}us'.format(name, size, duration) for name, (size, duration) in measures.items())))
@@ -0,0 +1,18 @@
+from types import SimpleNamespace
+
+from flask_login import current_user
+
+import web.web_application as web_application
+
+
+def test_login_survives_a_job_queue_failure(app, monkeypatch):
+    def produce(message):
+        raise ConnectionError('broker down')
+    monkeypatch.setattr(web_application.job_queue, 'produce', produce)
+
+    steam_id = 76561197960265728
+    with app.test_request_context('/'):
+        response = web_application.oid.after_login_func(
+            SimpleNamespace(identity_url='https://steamcommunity.com/openid/id/{0}'.format(steam_id)))
+        assert response.status_code == 302
+        assert current_user.id == steam_id
@@ -0,0 +1,105 @@
+from time import perf_counter
+
+import pytest
+
+from common.models import db, QueuedPlayer
+from web.matchmaking import DatabaseMatchmaker, MemoryMatchmaker
+import common.constants as constants
+
+
+def test_database_join_twice_keeps_one_entry(app, make_users, monkeypatch):
+    user_id = make_users(1)[0].id
+    matchmaker = DatabaseMatchmaker()
+    # Both requests of a double click pass the check before either is committed
+    monkeypatch.setattr(matchmaker, 'is_queued', lambda user_id: False)
+
+    assert matchmaker.join(user_id, constants.LADDER_HIGH, {'ap': True}) is None
+    db.session.remove()
+    assert matchmaker.join(user_id, constants.LADDER_HIGH, {'ap': True}) is None
+
+    assert QueuedPlayer.query.filter_by(id=user_id).count() == 1
+
+
+def join_all(matchmaker, user_ids, queue_name=constants.LADDER_HIGH):
+    """Queue players in order, returning the groups popped."""
+    groups = []
+    for user_id in user_ids:
+        entries = matchmaker.join(user_id, queue_name, {'ap': True})
+        if entries is not None:
+            groups.append([entry.user_id for entry in entries])
+    return groups
+
+
+def test_memory_pops_groups_in_arrival_order(app):
+    matchmaker = MemoryMatchmaker(app)
+    user_ids = list(range(1, 13))
+
+    assert join_all(matchmaker, user_ids) == [user_ids[:10]]
+    assert matchmaker.join(11, constants.LADDER_HIGH, {}) is None
+    assert matchmaker.counts()[constants.LADDER_HIGH] == 2
+
+    matchmaker.leave(11)
+    assert not matchmaker.is_queued(11)
+    assert matchmaker.is_queued(12)
+    assert matchmaker.counts()[constants.LADDER_HIGH] == 1
+
+
+def test_memory_requeue_puts_players_back_at_the_head(app):
+    matchmaker = MemoryMatchmaker(app)
+    group = [entry for entry in [matchmaker.join(user_id, constants.LADDER_HIGH, {}) for user_id in range(1, 11)]
+             if entry is not None][0]
+    matchmaker.join(11, constants.LADDER_HIGH, {})
+
+    matchmaker.requeue(group[1:])
+    assert join_all(matchmaker, [12]) == [[entry.user_id for entry in group[1:]] + [11]]
+
+
+def test_memory_queues_are_recovered_after_a_restart(app, make_users):
+    users = make_users(5)
+    db.session.commit()
+    matchmaker = MemoryMatchmaker(app)
+    join_all(matchmaker, [user.id for user in users])
+    matchmaker.leave(users[2].id)
+    matchmaker.flush()
+
+    restarted = MemoryMatchmaker(app)
+    assert restarted.counts()[constants.LADDER_HIGH] == 4
+    expected = [user.id for user in users if user is not users[2]]
+    assert list(restarted.queues[constants.LADDER_HIGH]) == expected
+    assert all(entry.mode_vote == 1 for entry in restarted.queues[constants.LADDER_HIGH].values())
+
+
+def test_memory_retries_the_operations_not_persisted(app, make_users, monkeypatch):
+    users = make_users(2)
+    monkeypatch.setattr(MemoryMatchmaker, 'RETRY_DELAY', 0)
+    apply = MemoryMatchmaker._apply
+    failures = []
+
+    def failing_apply(operations):
+        if len(failures) == 0:
+            failures.append(operations)
+            raise OSError('database down')
+        apply(operations)
+
+    matchmaker = MemoryMatchmaker(app)
+    monkeypatch.setattr(matchmaker, '_apply', failing_apply)
+    join_all(matchmaker, [user.id for user in users])
+    matchmaker.flush()
+
+    assert len(failures) == 1
+    assert [player.id for player in QueuedPlayer.query.order_by(QueuedPlayer.added)] == [user.id for user in users]
+
+
+@pytest.mark.benchmark
+@pytest.mark.parametrize('kind', ['memory', 'database'])
+def test_benchmark_joins(app, make_users, kind):
+    user_ids = [user.id for user in make_users(1000)]
+    matchmaker = MemoryMatchmaker(app) if kind == 'memory' else DatabaseMatchmaker()
+    started = perf_counter()
+    groups = join_all(matchmaker, user_ids)
+    elapsed = perf_counter() - started
+    if kind == 'memory':
+        matchmaker.flush()
+
+    assert len(groups) == 100
+    print('{0} matchmaker: {1:.0f} joins/s'.format(kind, len(user_ids) / elapsed))
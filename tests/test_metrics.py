@@ -0,0 +1,34 @@
+from types import SimpleNamespace
+
+from werkzeug.test import Client
+from werkzeug.wrappers import Response
+
+import common.metrics as metrics
+import web.web_application as web_application
+
+
+def test_metrics_are_not_served_on_the_site(app):
+    assert app.test_client().get('/metrics').status_code == 404
+
+
+def test_metrics_application():
+    client = Client(metrics.metrics_application, Response)
+    response = client.get('/metrics')
+    assert response.status_code == 200
+    assert 'dazzar_jobs_produced_total' in response.get_data(as_text=True)
+    assert client.get('/').status_code == 404
+
+
+def test_queue_depth_is_read_with_the_refresh(app, monkeypatch):
+    monkeypatch.setattr(web_application.job_queue, 'depth', lambda: 7)
+    scheduled = []
+    io_loop = SimpleNamespace(call_later=lambda delay, callback, *args: scheduled.append(delay))
+
+    web_application.refresh_rabbitmq(io_loop)
+    assert 'dazzar_job_queue_depth 7' in metrics.REGISTRY.render()
+    assert scheduled == [60]
+
+
+def test_metrics_endpoints_listen_on_loopback_by_default(app):
+    assert app.config['BOT_METRICS_HOST'] == '127.0.0.1'
+    assert app.config['WEB_METRICS_HOST'] == '127.0.0.1'
@@ -0,0 +1,100 @@
+from importlib.util import spec_from_file_location, module_from_spec
+import os
+
+from alembic.migration import MigrationContext
+from alembic.operations import Operations
+from sqlalchemy import inspect
+
+from common.models import db, Match, Scoreboard, ScoreContribution
+from common.scoring import player_contribution, SCORE_FIELDS
+import common.constants as constants
+
+VERSIONS = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'migrations', 'versions')
+
+
+def run_migration(revision, step):
+    """Run the upgrade or downgrade of a migration on the database of the tests, then commit.
+
+    Args:
+        revision: `str` revision ID of the migration.
+        step: `str` 'upgrade' or 'downgrade'.
+    """
+    spec = spec_from_file_location('migration_' + revision, os.path.join(VERSIONS, revision + '_.py'))
+    migration = module_from_spec(spec)
+    spec.loader.exec_module(migration)
+    with Operations.context(MigrationContext.configure(db.session.connection())):
+        getattr(migration, step)()
+    db.session.commit()
+    db.session.expire_all()
+
+
+def scoreboards():
+    """Counters and rank of every scoreboard, indexed by (user ID, ladder name)."""
+    return {(score.user_id, score.ladder_name): tuple(getattr(score, field) for field in SCORE_FIELDS) + (score.rank,)
+            for score in Scoreboard.query}
+
+
+def test_contributions_backfill(app, make_users):
+    users = make_users(13)
+    results = [(constants.LADDER_HIGH, True), (constants.LADDER_HIGH, False), (constants.LADDER_HIGH, None),
+               (constants.LADDER_LOW, False)]
+    for i, (ladder, radiant_win) in enumerate(results):
+        match = Match(users[i:i + 10], ladder, [1] * 10)
+        match.radiant_win = radiant_win
+        db.session.add(match)
+        db.session.flush()
+        for j, player in enumerate(match.players):
+            player.is_dodge = j % 4 == 1
+            player.is_leaver = j % 3 == 2
+    db.session.commit()
+    expected = {}
+    for match in Match.query:
+        for player in match.players:
+            contribution = player_contribution(player.is_dodge, player.is_leaver, player.is_radiant,
+                                               match.radiant_win)
+            if contribution is not None:
+                expected[(match.id, player.player_id)] = tuple(contribution[field] for field in SCORE_FIELDS)
+
+    # Counters written by the previous live code, one of them for a ladder without any match
+    for user in users[0:4]:
+        db.session.add(Scoreboard(user, constants.LADDER_HIGH))
+    db.session.add(Scoreboard(users[11], constants.LADDER_MEDIUM))
+    db.session.commit()
+    Scoreboard.query.update({'points': 50, 'matches': 7})
+    db.session.commit()
+    previous = scoreboards()
+    ScoreContribution.__table__.drop(db.session.connection())
+    db.session.commit()
+
+    run_migration('b3d9f0a6c471', 'upgrade')
+
+    assert {(record.match_id, record.user_id): tuple(getattr(record, field) for field in SCORE_FIELDS)
+            for record in ScoreContribution.query} == expected
+    counters = scoreboards()
+    assert counters[(users[11].id, constants.LADDER_MEDIUM)] == (0, 0, 0, 0, 0, 0, 1)
+    for (user_id, ladder), values in counters.items():
+        records = [ScoreContribution.query.get((match.id, user_id)) for match in Match.query
+                   if match.section == ladder]
+        assert values[:6] == tuple(sum(getattr(record, field) for record in records if record is not None)
+                                   for field in SCORE_FIELDS)
+    # Same ranks as the application computes
+    for ladder in (constants.LADDER_HIGH, constants.LADDER_MEDIUM, constants.LADDER_LOW):
+        Scoreboard.refresh_ranks(ladder)
+    db.session.commit()
+    assert scoreboards() == counters
+
+    # A match played after the upgrade is kept by the downgrade
+    Scoreboard.query.filter_by(user_id=users[0].id, ladder_name=constants.LADDER_HIGH).update(
+        {'points': Scoreboard.points + 1})
+    db.session.commit()
+
+    run_migration('b3d9f0a6c471', 'downgrade')
+
+    assert 'score_contribution' not in inspect(db.session.connection()).get_table_names()
+    restored = scoreboards()
+    assert restored[(users[0].id, constants.LADDER_HIGH)][:6] == (51, 7, 0, 0, 0, 0)
+    for key, values in previous.items():
+        if key[0] != users[0].id:
+            assert restored[key][:6] == values[:6]
+    added = set(restored) - set(previous)
+    assert len(added) != 0 and all(restored[key][:6] == (0, 0, 0, 0, 0, 0) for key in added)
@@ -0,0 +1,103 @@
+from datetime import datetime, timedelta
+from time import perf_counter
+
+import pytest
+
+from common.models import db, UserMixDetail
+import web.blueprints.mix.mix as mix_blueprint
+
+
+def freeze_time(monkeypatch, now):
+    """Make the mix listing run at a fixed time."""
+    class FrozenDatetime(datetime):
+        @classmethod
+        def utcnow(cls):
+            return now
+    monkeypatch.setattr(mix_blueprint, 'datetime', FrozenDatetime)
+
+
+def make_mixes(users, now):
+    """Enable an ad for each user, refreshed one day apart before a time, the first user being the latest."""
+    mixes = []
+    for i, user in enumerate(users):
+        mix = UserMixDetail()
+        mix.id = user.id
+        mix.update('title', 'goal', 'level', 'description')
+        mix.toggle(True)
+        mix.refresh_date = now - timedelta(days=i, hours=1)
+        mixes.append(mix)
+    db.session.add_all(mixes)
+    db.session.commit()
+
+
+def get_mixs(client, start, length):
+    """Request a page of the mix listing, returning the answer as (total, user IDs)."""
+    answer = client.get('/api/mixs?start={0}&length={1}'.format(start, length)).get_json()
+    return answer['recordsTotal'], [int(row[0]) for row in answer['data']]
+
+
+def test_pages_follow_each_other(app, make_users, monkeypatch):
+    now = datetime(2031, 1, 1, 12, 0, 30)
+    freeze_time(monkeypatch, now)
+    users = make_users(7)
+    make_mixes(users, now)
+    client = app.test_client()
+
+    # Second and third pages seek after the cursors left by the previous ones
+    pages = [get_mixs(client, start, 3) for start in (0, 3, 6)]
+    assert [total for total, ids in pages] == [7, 7, 7]
+    assert [user_id for total, ids in pages for user_id in ids] == [user.id for user in users]
+
+
+def test_listing_window_is_part_of_the_cache_key(app, make_users, monkeypatch):
+    now = datetime(2031, 2, 1, 12, 0, 30)
+    freeze_time(monkeypatch, now)
+    users = make_users(5)
+    make_mixes(users, now)
+    client = app.test_client()
+    assert get_mixs(client, 0, 2) == (5, [users[0].id, users[1].id])
+
+    # Same minute, same cached count
+    freeze_time(monkeypatch, now + timedelta(seconds=20))
+    UserMixDetail.query.filter_by(id=users[0].id).update({'enabled': False})
+    db.session.commit()
+    assert get_mixs(client, 0, 2)[0] == 5
+
+    # Four days later the oldest ads left the window, the count and cursors of the old window are not used
+    freeze_time(monkeypatch, now + timedelta(days=4))
+    assert get_mixs(client, 0, 2) == (2, [users[1].id, users[2].id])
+    assert get_mixs(client, 2, 2) == (2, [])
+
+
+@pytest.mark.benchmark
+def test_benchmark_deep_pages(app, make_users, monkeypatch):
+    now = datetime(2031, 3, 1, 12, 0, 30)
+    freeze_time(monkeypatch, now)
+    users = make_users(20000)
+    mixes = []
+    for i, user in enumerate(users):
+        mixes.append({'id': user.id, 'enabled': True, 'title': 'title', 'goal': 'goal', 'level': 'level',
+                      'refresh_date': now - timedelta(seconds=i + 1)})
+    db.session.execute(UserMixDetail.__table__.insert(), mixes)
+    db.session.commit()
+    client = app.test_client()
+
+    # Browsing page after page, each one seeking after the cursor of the previous one
+    seek = {}
+    for page in range(1, 1001):
+        start = perf_counter()
+        total, ids = get_mixs(client, (page - 1) * 20, 20)
+        seek[page] = perf_counter() - start
+    assert ids[-1] == users[-1].id
+
+    # Jumps in a new window without cursors, served with offsets
+    offset = {}
+    for page in (1, 10, 100, 1000):
+        freeze_time(monkeypatch, now + timedelta(minutes=page))
+        start = perf_counter()
+        get_mixs(client, (page - 1) * 20, 20)
+        offset[page] = perf_counter() - start
+
+    print('\nPage latency on 20000 ads, seek / offset: {0}'.format(', '.join(
+        'page {0} {1:.1f}ms / {2:.1f}ms'.format(page, seek[page] * 1000, offset[page] * 1000)
+        for page in (1, 10, 100, 1000))))
@@ -0,0 +1,32 @@
+from common.models import db, UserPermission
+import common.constants as constants
+
+
+def fetch_users(app, search, length):
+    """Request a page of the user list and return its rows."""
+    response = app.test_client().get('/api/users', query_string={'search[value]': search, 'length': length})
+    assert response.status_code == 200
+    return response.get_json()['data']
+
+
+def test_user_list_loads_permissions_in_one_query(app, make_users, record_queries):
+    users = make_users(30)
+    db.session.add(UserPermission(constants.PERMISSION_ADMIN))
+    db.session.commit()
+    for user in users[:3]:
+        user.give_permission(constants.PERMISSION_ADMIN, True)
+    db.session.commit()
+
+    # Distinct searches, not to reuse the cached counts and cursors
+    with record_queries() as few_queries:
+        few = fetch_users(app, 'player2', 5)
+    with record_queries() as many_queries:
+        many = fetch_users(app, 'player', 25)
+
+    assert len(few) == 5
+    assert len(many) == 25
+    assert len(many_queries) == len(few_queries)
+    assert sum('user_permission' in statement for statement in many_queries) == 1
+
+    admins = {row[3] for row in many if row[1][constants.PERMISSION_ADMIN]}
+    assert admins == {str(user.id) for user in users[:3]}
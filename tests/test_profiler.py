@@ -0,0 +1,100 @@
+from statistics import median
+from time import perf_counter
+import os
+
+import pytest
+
+from common.models import db, Setting, UserPermission
+from common.profiler import PROFILER_SETTING
+import web.web_application as web_application
+import common.constants as constants
+
+
+@pytest.fixture
+def profiler(app, monkeypatch):
+    """Query profiler of the web application, disabled and empty, restored after the test."""
+    monkeypatch.setattr(web_application.profiler, 'enabled', False)
+    web_application.profiler.reset()
+    yield web_application.profiler
+    web_application.profiler.reset()
+
+
+@pytest.fixture
+def admin_client(app, make_users, login):
+    """Test client logged in as an administrator."""
+    user = make_users(1)[0]
+    db.session.add(UserPermission(constants.PERMISSION_ADMIN))
+    db.session.commit()
+    user.give_permission(constants.PERMISSION_ADMIN, True)
+    db.session.commit()
+    client = app.test_client()
+    login(client, user)
+    return client
+
+
+def get(app, client, url, **kwargs):
+    """Request a page in its own application context, which ends its profiled unit like a served request."""
+    with app.app_context():
+        return client.get(url, **kwargs)
+
+
+def test_requests_are_profiled_by_endpoint(app, make_users, profiler):
+    make_users(5)
+    client = app.test_client()
+    # Searches of no other test, the counts of the listing being cached
+    get(app, client, '/api/users', query_string={'search[value]': 'play'})
+    assert profiler.report() == ([], [])
+
+    profiler.enabled = True
+    for i in range(0, 3):
+        get(app, client, '/api/users', query_string={'search[value]': 'player{0}'.format(i)})
+    units, slowest = profiler.report()
+    assert [(unit['name'], unit['units']) for unit in units] == [('user_blueprint.api_users', 3)]
+    assert units[0]['queries'] >= 3 and units[0]['db_time'] > 0
+    assert len(slowest) == units[0]['queries']
+    assert all(query['unit'] == 'user_blueprint.api_users' for query in slowest)
+
+
+def test_admin_actions_are_posted(app, admin_client, profiler):
+    assert admin_client.get('/admin/perf/toggle').status_code == 405
+    assert admin_client.get('/admin/perf/reset').status_code == 405
+
+    assert admin_client.post('/admin/perf/toggle').status_code == 302
+    assert profiler.enabled
+    assert Setting.query.get(PROFILER_SETTING).value == '1'
+    get(app, admin_client, '/api/users', query_string={'search[value]': 'player'})
+    assert len(profiler.report()[0]) != 0
+
+    admin_client.post('/admin/perf/reset')
+    assert profiler.report() == ([], [])
+    page = admin_client.get('/admin/perf').get_data(as_text=True)
+    assert 'formaction="/admin/perf/toggle"' in page and 'formaction="/admin/perf/reset"' in page
+
+
+def test_admin_actions_need_the_permission(app, make_users, login, profiler):
+    client = app.test_client()
+    login(client, make_users(1)[0])
+
+    client.post('/admin/perf/toggle')
+    assert not profiler.enabled
+    assert client.get('/admin/perf').status_code == 403
+
+
+@pytest.mark.benchmark
+def test_benchmark_profiler_overhead(app, make_users, profiler):
+    make_users(200)
+    client = app.test_client()
+    count = int(os.environ.get('DAZZAR_BENCHMARK_REQUESTS', 3000))
+    url = '/api/users?start=0&length=50&search[value]=layer'
+
+    # Requests alternately profiled or not, the medians compared against the drift of the machine
+    timings = {False: [], True: []}
+    for i in range(0, count * 2):
+        profiler.enabled = i % 2 == 1
+        start = perf_counter()
+        get(app, client, url)
+        timings[profiler.enabled].append(perf_counter() - start)
+    units = profiler.report()[0]
+    off, on = median(timings[False]), median(timings[True])
+    print('\n{0:.0f} queries per request: {1:.3f}ms without profiler, {2:.3f}ms with, {3:+.2f}% overhead'.format(
+        units[0]['queries'] / units[0]['units'], off * 1000, on * 1000, (on / off - 1) * 100))
@@ -0,0 +1,57 @@
+import pytest
+
+from common.models import db, Match, UserMixDetail
+import web.web_application as web_application
+import common.constants as constants
+
+
+@pytest.fixture
+def client(app):
+    """Test client with an empty page cache, the IDs of the database being reused by each test."""
+    web_application.render_cache.pages.invalidate(lambda key: True)
+    yield app.test_client()
+    web_application.render_cache.pages.invalidate(lambda key: True)
+
+
+def count_queries(client, record_queries, url):
+    """Number of SQL statements run to serve a page, starting from an empty session like a new request."""
+    db.session.remove()
+    with record_queries() as queries:
+        response = client.get(url)
+    assert response.status_code == 200
+    return len(queries)
+
+
+def test_match_page_budget(client, make_users, record_queries):
+    match = Match(make_users(10), constants.LADDER_HIGH, [1] * 10)
+    db.session.add(match)
+    db.session.commit()
+    url = '/ladder/match/{0}'.format(match.id)
+
+    # Match, players and users in one joined query, whatever the number of players
+    assert count_queries(client, record_queries, url) == 1
+    assert count_queries(client, record_queries, url) == 0
+
+
+def test_user_page_budget(client, make_users, record_queries):
+    user = make_users(1)[0]
+    url = '/user/{0}'.format(user.id)
+
+    # User with its scan information, then its permissions
+    assert count_queries(client, record_queries, url) == 2
+    assert count_queries(client, record_queries, url) == 0
+
+
+def test_mix_page_budget(client, make_users, record_queries):
+    user = make_users(1)[0]
+    mix = UserMixDetail()
+    mix.id = user.id
+    mix.update('title', 'goal', 'level', 'description')
+    mix.toggle(True)
+    db.session.add(mix)
+    db.session.commit()
+    url = '/mix/{0}'.format(user.id)
+
+    # Ad, then the nickname of its user
+    assert count_queries(client, record_queries, url) == 2
+    assert count_queries(client, record_queries, url) == 0
@@ -0,0 +1,86 @@
+import json
+from types import SimpleNamespace
+
+import pytest
+
+from common.models import db
+import web.web_application as web_application
+import common.constants as constants
+
+
+class FakeSocket:
+    """Socket of a browser, keeping the messages pushed to it."""
+
+    def __init__(self, user_id=None):
+        self.user_id = user_id
+        self.messages = []
+
+    def send(self, message):
+        self.messages.append(json.loads(message))
+
+
+@pytest.fixture
+def notifier(app, monkeypatch):
+    """Push channel of the application, the callbacks being run immediately, without socket."""
+    notifier = web_application.queue_notifier
+    monkeypatch.setattr(notifier, 'io_loop', SimpleNamespace(add_callback=lambda callback, *args: callback(*args)))
+    monkeypatch.setattr(notifier, 'sockets', set())
+    monkeypatch.setattr(notifier, 'sockets_by_user', {})
+    monkeypatch.setattr(notifier, 'last_status', None)
+    monkeypatch.setitem(app.config, 'VIP_LADDER_OPEN', True)
+    yield notifier
+    web_application.matchmaker.clear()
+
+
+def connect(notifier, count, first_id=None):
+    """Register sockets of viewers, anonymous unless a first user ID is given."""
+    sockets = [FakeSocket(None if first_id is None else first_id + i) for i in range(0, count)]
+    for socket in sockets:
+        notifier.register(socket)
+    return sockets
+
+
+def test_status_is_pushed_only_when_it_changes(notifier):
+    viewer = connect(notifier, 1)[0]
+    queues = {constants.LADDER_HIGH: 1, constants.LADDER_LOW: 0, constants.LADDER_MEDIUM: 0}
+
+    notifier.publish_queue_status(True, queues)
+    notifier.publish_queue_status(True, dict(queues))
+    assert viewer.messages == [{'type': 'queue', 'is_open': True, 'queues': queues}]
+
+    # A new viewer receives the last status on connection
+    assert connect(notifier, 1)[0].messages == viewer.messages
+
+
+def test_match_ready_is_sent_to_its_players_only(notifier):
+    players = connect(notifier, 2, first_id=10)
+    viewer = connect(notifier, 1)[0]
+
+    notifier.publish_match_ready(42, [10])
+    assert players[0].messages == [{'type': 'match', 'game': 42}]
+    assert players[1].messages == []
+    assert viewer.messages == []
+
+
+def test_database_load_does_not_grow_with_viewers(notifier, make_users, login, record_queries):
+    users = make_users(4)
+    for user in users:
+        user.section = constants.LADDER_HIGH
+    db.session.commit()
+
+    # Load test: the viewers only cost a push per change, the queries are the ones of the player joining
+    query_counts = []
+    for viewers, user in zip([1, 10, 100, 1000], users):
+        sockets = connect(notifier, viewers)
+        client = web_application.app.test_client()
+        login(client, user)
+        with record_queries() as queries:
+            response = client.post('/api/ladder/queue/in_out', json={'in': '1', 'modes': {'ap': True}})
+        assert response.status_code == 200
+        query_counts.append(len(queries))
+        assert all(socket.messages[-1]['queues'][constants.LADDER_HIGH] == users.index(user) + 1
+                   for socket in sockets)
+        for socket in notifier.sockets.copy():
+            notifier.unregister(socket)
+
+    assert len(set(query_counts)) == 1
@@ -0,0 +1,89 @@
+import random
+
+from common.models import db, User, Scoreboard
+from common.scoring import ScoreboardDeltas
+import common.constants as constants
+
+LADDER = constants.LADDER_HIGH
+
+
+def expected_ranks():
+    """Ranks of the ladder computed from scratch, indexed by user ID."""
+    rows = db.session().query(Scoreboard.user_id, Scoreboard.points, User.solo_mmr) \
+        .join(User, User.id == Scoreboard.user_id) \
+        .filter(Scoreboard.ladder_name == LADDER) \
+        .filter(User.nickname.isnot(None)) \
+        .all()
+    rows.sort(key=lambda row: (-row.points, -(row.solo_mmr or 0), row.user_id))
+    return {row.user_id: place for place, row in enumerate(rows, 1)}
+
+
+def stored_ranks():
+    """Ranks stored in the ladder, indexed by user ID."""
+    return dict(db.session().query(Scoreboard.user_id, Scoreboard.rank)
+                .filter(Scoreboard.ladder_name == LADDER)
+                .filter(Scoreboard.rank.isnot(None)))
+
+
+def fill_ladder(users):
+    """Give a scoreboard with random points to each user, ranked from scratch."""
+    scoreboards = ScoreboardDeltas()
+    for user in users:
+        scoreboards.add(user.id, LADDER, {'points': random.randint(-5, 20)})
+    scoreboards.write(replace=True)
+    Scoreboard.refresh_ranks(LADDER)
+    db.session.commit()
+
+
+def test_update_ranks_matches_full_ranking(app, make_users):
+    random.seed(4)
+    users = make_users(200)
+    for user in users[::20]:
+        user.solo_mmr = None
+    fill_ladder(users)
+    assert stored_ranks() == expected_ranks()
+
+    for step in range(0, 100):
+        scoreboards = ScoreboardDeltas()
+        for user in random.sample(users, 10):
+            scoreboards.add(user.id, LADDER, {'points': random.choice([-3, -2, 0, 1])})
+        scoreboards.write(replace=False)
+        scoreboards.update_ranks()
+        db.session.commit()
+        assert stored_ranks() == expected_ranks()
+
+
+def test_update_ranks_ranks_new_scoreboards(app, make_users):
+    random.seed(5)
+    users = make_users(50)
+    fill_ladder(users[:40])
+
+    # First match of players without scoreboard
+    scoreboards = ScoreboardDeltas()
+    for user in users[40:]:
+        scoreboards.add(user.id, LADDER, {'points': 1, 'matches': 1, 'win': 1})
+    scoreboards.write(replace=False)
+    scoreboards.update_ranks()
+    db.session.commit()
+
+    ranks = stored_ranks()
+    assert ranks == expected_ranks()
+    assert sorted(ranks.values()) == list(range(1, 51))
+
+
+def test_update_ranks_follows_nickname_changes(app, make_users):
+    random.seed(6)
+    users = make_users(30)
+    fill_ladder(users)
+
+    users[7].nickname = None
+    Scoreboard.update_ranks(LADDER, {users[7].id: 0})
+    db.session.commit()
+    assert stored_ranks() == expected_ranks()
+    assert users[7].id not in stored_ranks()
+
+    users[7].nickname = 'back'
+    Scoreboard.update_ranks(LADDER, {users[7].id: 0})
+    db.session.commit()
+    assert stored_ranks() == expected_ranks()
+    assert sorted(stored_ranks().values()) == list(range(1, 31))
@@ -0,0 +1,51 @@
+from common.models import db, User, ProfileScanInfo
+import web.web_application as web_application
+
+
+def get_page(client, record_queries, url, etag=None):
+    """Request a page like a new request, conditionally if an ETag is given.
+
+    Returns:
+        A tuple (response, number of SQL statements run).
+    """
+    db.session.remove()
+    headers = {} if etag is None else {'If-None-Match': etag}
+    with record_queries() as queries:
+        response = client.get(url, headers=headers)
+    return response, len(queries)
+
+
+def test_conditional_request_on_a_miss_renders_the_page(app, make_users, record_queries):
+    user = make_users(1)[0]
+    url = '/user/{0}'.format(user.id)
+    client = app.test_client()
+    etag = get_page(client, record_queries, url)[0].get_etag()[0]
+
+    # Out of the cache the page is rendered to compare its ETag, the browser copy is still valid
+    web_application.render_cache.pages.invalidate()
+    response, queries = get_page(client, record_queries, url, etag)
+    assert response.status_code == 304 and queries > 0
+
+    response, queries = get_page(client, record_queries, url, etag)
+    assert response.status_code == 304 and queries == 0
+
+
+def test_changed_user_page_is_rendered_again(app, make_users, record_queries):
+    user = make_users(1)[0]
+    url = '/user/{0}'.format(user.id)
+    client = app.test_client()
+    etag = get_page(client, record_queries, url)[0].get_etag()[0]
+
+    User.query.get(user.id).nickname = 'renamed'
+    db.session.commit()
+    assert not any(key[0] == ('user', user.id) for key in web_application.render_cache.pages.entries)
+    response, queries = get_page(client, record_queries, url, etag)
+    assert response.status_code == 200 and queries > 0
+    assert 'renamed' in response.get_data(as_text=True)
+
+    # The scan information is shown on the page as well, rendered again even if it looks the same
+    assert get_page(client, record_queries, url)[1] == 0
+    scanned = User.query.get(user.id)
+    scanned.profile_scan_info = ProfileScanInfo(scanned)
+    db.session.commit()
+    assert get_page(client, record_queries, url)[1] > 0
@@ -0,0 +1,88 @@
+from types import SimpleNamespace
+
+import gevent
+
+from bot.dota_bot import DotaBot
+from bot.fake_clients import FakeSteamClient, FakeDota2Client
+from common.job_queue import QueueAdapter, MemoryBackend, JobScanBatch, decode_job
+from common.models import db, User
+import common.scripts as scripts
+
+
+class PlayerInfoDota2Client(FakeDota2Client):
+    """Fake Dota client answering the player information instead of the profile card, like Steam sometimes does."""
+
+    def request_profile_card(self, account_id):
+        message = SimpleNamespace(player_infos=[SimpleNamespace(account_id=account_id)])
+        self.emit_later(self.request_delay, 'player_info', message)
+
+
+def make_bot(app, dota_class=FakeDota2Client):
+    """Create a Dota bot over fake clients answering immediately."""
+    def make_clients():
+        steam_client = FakeSteamClient(connect_delay=0, login_delay=0)
+        return steam_client, dota_class(steam_client, launch_delay=0, request_delay=0.01)
+
+    manager = SimpleNamespace(app=app, make_clients=make_clients)
+    return DotaBot(manager, SimpleNamespace(login='test', password='test'))
+
+
+def test_scan_all_users_queues_batches(app, make_users, monkeypatch):
+    users = make_users(25)
+    job_queue = QueueAdapter(MemoryBackend())
+    monkeypatch.setattr(scripts, 'job_queue', job_queue)
+    monkeypatch.setitem(app.config, 'SCAN_BATCH_SIZE', 25)
+
+    scripts.scan_all_users()
+
+    jobs = [decode_job(body) for body in list(job_queue.backend.messages.queue)]
+    assert len(jobs) == 1
+    assert type(jobs[0]) is JobScanBatch
+    assert sorted(jobs[0].steam_ids) == sorted(user.id for user in users)
+    assert all(user.profile_scan_info.last_scan_request is not None for user in User.query.all())
+
+
+def test_scan_all_users_splits_batches(app, make_users, monkeypatch):
+    make_users(25)
+    job_queue = QueueAdapter(MemoryBackend())
+    monkeypatch.setattr(scripts, 'job_queue', job_queue)
+    monkeypatch.setitem(app.config, 'SCAN_BATCH_SIZE', 10)
+
+    scripts.scan_all_users()
+
+    jobs = [decode_job(body) for body in list(job_queue.backend.messages.queue)]
+    assert [len(job.steam_ids) for job in jobs] == [10, 10, 5]
+
+
+def test_bot_resolves_each_profile_of_a_batch(app, make_users):
+    users = make_users(20)
+    for user in users:
+        user.solo_mmr = None
+    db.session.commit()
+    bot = make_bot(app)
+    bot.job = JobScanBatch(steam_ids=[user.id for user in users])
+
+    gevent.spawn(bot.scan_profile).join(timeout=5)
+
+    assert bot.job_done.is_set()
+    db.session.expire_all()
+    for user in User.query.all():
+        assert user.solo_mmr is not None
+        assert user.section is not None
+        assert user.profile_scan_info.last_scan is not None
+
+
+def test_bot_ends_scans_answered_by_player_info(app, make_users, monkeypatch):
+    users = make_users(5)
+    monkeypatch.setitem(app.config, 'SCAN_TIMEOUT', 10)
+    bot = make_bot(app, PlayerInfoDota2Client)
+    bot.job = JobScanBatch(steam_ids=[user.id for user in users])
+
+    # Far below the scan timeout, the answers end the scans instead of the retries
+    gevent.spawn(bot.scan_profile).join(timeout=2)
+
+    assert bot.job_done.is_set()
+    db.session.expire_all()
+    for user in User.query.all():
+        assert user.solo_mmr is not None
+        assert user.profile_scan_info.last_scan is not None
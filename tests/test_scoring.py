@@ -0,0 +1,92 @@
+from sqlalchemy.dialects import postgresql
+
+from common.models import db, Match, Scoreboard
+from common.scoring import ScoreboardDeltas, apply_match_contributions
+import common.constants as constants
+
+LADDER = constants.LADDER_HIGH
+
+
+def make_match(users, radiant_win):
+    """Create a match of 10 users with an outcome, committed in the database."""
+    match = Match(users, LADDER, [1] * len(users))
+    match.radiant_win = radiant_win
+    db.session.add(match)
+    db.session.commit()
+    return match
+
+
+def scoreboards():
+    """Counters (points, matches, win, loss, leave) of the ladder, indexed by user ID."""
+    return {score.user_id: (score.points, score.matches, score.win, score.loss, score.leave)
+            for score in Scoreboard.query.filter_by(ladder_name=LADDER)}
+
+
+def fake_postgres(monkeypatch):
+    """Send the scoreboard writes down the Postgres path, recording the statements instead of executing them.
+
+    Returns:
+        `list` of the statements sent through the session.
+    """
+    statements = []
+    monkeypatch.setattr(db.engine.dialect, 'name', 'postgresql')
+    monkeypatch.setattr(db.session, 'execute', lambda statement, *args, **kwargs: statements.append(statement))
+    return statements
+
+
+def test_match_contributions_are_applied_once(app, make_users):
+    match = make_match(make_users(10), True)
+    leaver = match.players[0]
+    leaver.is_leaver = True
+    radiant = {player.player_id for player in match.players if player.is_radiant}
+
+    apply_match_contributions(match)
+    db.session.commit()
+    counters = scoreboards()
+    for player in match.players:
+        if player is leaver:
+            assert counters[player.player_id] == (-3, 1, 0, 0, 1)
+        elif player.player_id in radiant:
+            assert counters[player.player_id] == (1, 1, 1, 0, 0)
+        else:
+            assert counters[player.player_id] == (0, 1, 0, 1, 0)
+
+    assert len(apply_match_contributions(match)) == 0
+    db.session.commit()
+    assert scoreboards() == counters
+
+    # Outcome revised by an admin, only the difference is written
+    match.radiant_win = False
+    assert len(apply_match_contributions(match)) == 9
+    db.session.commit()
+    for player in match.players:
+        if player is not leaver:
+            win = player.player_id not in radiant
+            assert scoreboards()[player.player_id] == (int(win), 1, int(win), int(not win), 0)
+
+
+def test_endgame_writes_the_scoreboards_in_one_upsert(app, make_users, record_queries, monkeypatch):
+    match = make_match(make_users(10), True)
+    # Loaded by the bot before the result is applied
+    assert len(match.players) == 10
+    upserts = fake_postgres(monkeypatch)
+
+    with record_queries() as queries:
+        apply_match_contributions(match)
+        db.session.flush()
+
+    assert len(upserts) == 1
+    sql = str(upserts[0].compile(dialect=postgresql.dialect()))
+    assert 'ON CONFLICT (user_id, ladder_name) DO UPDATE' in sql
+    # Recorded contributions read, then inserted in one batch
+    assert len(queries) == 2
+
+
+def test_upsert_is_chunked(app, monkeypatch):
+    statements = fake_postgres(monkeypatch)
+    deltas = ScoreboardDeltas()
+    for user_id in range(0, 12):
+        deltas.add(user_id, LADDER, {'points': 1, 'matches': 1})
+
+    deltas.write(replace=False, chunk_size=5)
+    assert len(statements) == 3
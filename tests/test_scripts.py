@@ -0,0 +1,131 @@
+from datetime import datetime, timedelta
+from time import perf_counter
+import os
+import random
+
+import pytest
+
+from common.models import db, Match, PlayerInMatch, Scoreboard, ScoreContribution, Checkpoint
+from common.scripts import recompute_scoreboards, SCOREBOARD_CHECKPOINT
+import common.constants as constants
+
+LADDER = constants.LADDER_HIGH
+
+
+def make_match(users, radiant_win, status=constants.MATCH_STATUS_ENDED):
+    """Create a match of 10 users with an outcome and a status, committed in the database."""
+    match = Match(users, LADDER, [1] * len(users))
+    match.radiant_win = radiant_win
+    match.status = status
+    db.session.add(match)
+    db.session.commit()
+    return match
+
+
+def scoreboards():
+    """Counters and rank of every scoreboard, indexed by (user ID, ladder name)."""
+    return {(score.user_id, score.ladder_name): (score.points, score.matches, score.win, score.loss, score.dodge,
+                                                 score.leave, score.rank)
+            for score in Scoreboard.query}
+
+
+def contributions():
+    """Recorded contributions as (points, matches, win, loss, dodge, leave), indexed by (match ID, user ID)."""
+    return {(record.match_id, record.user_id): (record.points, record.matches, record.win, record.loss,
+                                                record.dodge, record.leave)
+            for record in ScoreContribution.query}
+
+
+def test_full_rebuild_replays_every_match(app, make_users):
+    users = make_users(12)
+    first = make_match(users[:10], True)
+    second = make_match(users[2:], False)
+    second.players[0].is_leaver = True
+    db.session.commit()
+    radiant = {player.player_id for player in first.players if player.is_radiant}
+
+    # Stale aggregates replaced, not added to
+    db.session.add(Scoreboard(users[0], LADDER))
+    Scoreboard.query.update({'points': 50})
+    db.session.commit()
+
+    recompute_scoreboards(None, False)
+
+    counters = scoreboards()
+    for user in users[:2]:
+        win = user.id in radiant
+        assert counters[(user.id, LADDER)][:6] == (int(win), 1, int(win), int(not win), 0, 0)
+    assert counters[(second.players[0].player_id, LADDER)][5] == 1
+    assert len(contributions()) == 20
+    assert sorted(rank for _, _, _, _, _, _, rank in counters.values()) == list(range(1, 13))
+    assert Checkpoint.query.filter_by(name=SCOREBOARD_CHECKPOINT).one().match_id == second.id
+
+
+def test_incremental_run_matches_a_full_rebuild(app, make_users):
+    users = make_users(15)
+    make_match(users[:10], True)
+    ongoing = make_match(users[5:], None, constants.MATCH_STATUS_IN_PROGRESS)
+    recompute_scoreboards(None, False)
+    # Checkpoint before the first match which can still change
+    assert Checkpoint.query.filter_by(name=SCOREBOARD_CHECKPOINT).one().match_id == ongoing.id - 1
+
+    # The ongoing match ends with a leaver and a new one is played
+    ongoing.status = constants.MATCH_STATUS_ENDED
+    ongoing.radiant_win = False
+    ongoing.players[3].is_leaver = True
+    make_match(users[:5] + users[10:], True)
+    db.session.commit()
+
+    recompute_scoreboards(None, True)
+    incremental = scoreboards(), contributions()
+    recompute_scoreboards(None, False)
+    assert (scoreboards(), contributions()) == incremental
+
+
+def test_incremental_run_does_not_read_the_history(app, make_users):
+    users = make_users(10)
+    old = make_match(users, True)
+    recompute_scoreboards(None, False)
+    expected = scoreboards()
+
+    # Only the matches after the checkpoint are replayed, earlier ones are taken as recorded
+    PlayerInMatch.query.filter_by(match_id=old.id).update({'is_dodge': True})
+    db.session.commit()
+    recompute_scoreboards(str(old.id), False)
+    assert scoreboards() == expected
+
+
+@pytest.mark.benchmark
+def test_benchmark_recompute_scoreboards(app, make_users):
+    match_count = int(os.environ.get('DAZZAR_BENCHMARK_MATCHES', 100000))
+    users = [user.id for user in make_users(1000)]
+    rng = random.Random(0)
+    start = datetime(2020, 1, 1)
+
+    def insert_matches(first_id, count):
+        matches, players = [], []
+        for match_id in range(first_id, first_id + count):
+            matches.append({'id': match_id, 'status': constants.MATCH_STATUS_ENDED, 'password': 'dz_test',
+                            'created': start + timedelta(minutes=match_id), 'section': LADDER,
+                            'radiant_win': rng.random() < 0.5, 'mode': ''})
+            for slot, player_id in enumerate(rng.sample(users, 10)):
+                players.append({'match_id': match_id, 'player_id': player_id, 'mmr': 3000, 'team_slot': slot,
+                                'is_radiant': slot < 5, 'is_leaver': rng.random() < 0.02,
+                                'is_dodge': rng.random() < 0.01})
+        db.session.execute(Match.__table__.insert(), matches)
+        db.session.execute(PlayerInMatch.__table__.insert(), players)
+        db.session.commit()
+
+    insert_matches(1, match_count)
+    begin = perf_counter()
+    recompute_scoreboards(None, False)
+    full = perf_counter() - begin
+
+    insert_matches(match_count + 1, 1000)
+    begin = perf_counter()
+    recompute_scoreboards(None, True)
+    incremental = perf_counter() - begin
+
+    print('\n{0} matches: full rebuild {1:.1f}s, incremental run after 1000 matches {2:.2f}s'.format(
+        match_count, full, incremental))
+    assert ScoreContribution.query.count() == (match_count + 1000) * 10
@@ -0,0 +1,86 @@
+from time import perf_counter
+import os
+
+import pytest
+
+from common.models import db, User
+
+
+def make_nicknames(make_users, nicknames, first_id=76561197960265728):
+    """Create a user for each nickname, in order."""
+    users = make_users(len(nicknames), first_id)
+    for user, nickname in zip(users, nicknames):
+        user.nickname = nickname
+    db.session.commit()
+    return users
+
+
+def search(client, text, start=0, length=20):
+    """Request a page of the user listing filtered by a search, returning the answer as (total, nicknames)."""
+    answer = client.get('/api/users', query_string={'search[value]': text, 'start': start, 'length': length}).get_json()
+    return answer['recordsTotal'], [row[2] for row in answer['data']]
+
+
+def test_prefix_matches_come_first(app, make_users):
+    make_nicknames(make_users, ['Zorro', 'bazar', 'Zazie', 'zen', 'Ozone', 'other'])
+    client = app.test_client()
+
+    assert search(client, 'z') == (5, ['Zazie', 'Zorro', 'zen', 'Ozone', 'bazar'])
+    assert search(client, 'ZO') == (2, ['Zorro', 'Ozone'])
+    assert search(client, '') == (6, ['Ozone', 'Zazie', 'Zorro', 'bazar', 'other', 'zen'])
+
+
+def test_wildcards_are_searched_literally(app, make_users):
+    make_nicknames(make_users, ['a_b', 'axb', '100%', '1000', 'back\\slash', 'backslash'])
+    client = app.test_client()
+
+    assert search(client, '_') == (1, ['a_b'])
+    assert search(client, '0%') == (1, ['100%'])
+    assert search(client, 'k\\s') == (1, ['back\\slash'])
+
+
+def test_pages_follow_each_other_across_ranks(app, make_users):
+    # Non ASCII letters are folded differently by Python and SQLite, the ranks come from the database
+    nicknames = ['Éva', 'Élise', 'aÉb', 'dÉf', 'Émile', 'xÉy', 'cÉ', 'Éole']
+    make_nicknames(make_users, nicknames, first_id=76561197960365728)
+    client = app.test_client()
+    total, expected = search(client, 'É', 0, 20)
+    assert total == 8
+
+    pages = [search(client, 'É', start, 3)[1] for start in (0, 3, 6)]
+    assert [nickname for page in pages for nickname in page] == expected
+    assert set(expected[0:4]) == {'Éva', 'Élise', 'Émile', 'Éole'}
+
+
+def test_search_box_is_debounced(app):
+    page = app.test_client().get('/users').get_data(as_text=True)
+
+    assert '"searchDelay": 300' in page
+
+
+@pytest.mark.benchmark
+def test_benchmark_search(app):
+    count = int(os.environ.get('DAZZAR_BENCHMARK_USERS', 1000000))
+    syllables = ['ka', 'zo', 'mi', 'ru', 'te', 'no', 'shi', 'va', 'lo', 'de']
+    rows = []
+    for i in range(0, count):
+        nickname = ''.join(syllables[(i // 10 ** power) % 10] for power in range(0, 4)) + str(i)
+        rows.append({'id': 76561197960265728 + i, 'nickname': nickname, 'verified': False})
+        if len(rows) == 50000:
+            db.session.execute(User.__table__.insert(), rows)
+            rows = []
+    if len(rows) != 0:
+        db.session.execute(User.__table__.insert(), rows)
+    db.session.commit()
+    client = app.test_client()
+
+    measures = []
+    for text in ['kazo', 'shiva', 'lode9']:
+        timings = []
+        for start in (0, 20, 0):
+            begin = perf_counter()
+            search(client, text, start)
+            timings.append((perf_counter() - begin) * 1000)
+        measures.append('{0}: first page {1:.0f}ms, next page {2:.0f}ms, first page again {3:.0f}ms'.format(
+            text, *timings))
+    print('\n{0} users, SQLite scan\n{1}'.format(count, '\n'.join(measures)))
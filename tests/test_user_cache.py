@@ -0,0 +1,75 @@
+import pytest
+
+from common.models import db, User, ProfileScanInfo, UserPermission
+from web.user_cache import UserCache
+import web.web_application as web_application
+import common.constants as constants
+
+PAGES = ['/', '/ladder/play', '/ladder/matches', '/ladder/scoreboard/high', '/users', '/mix/users', '/user/profile']
+
+
+@pytest.mark.parametrize('url', PAGES)
+def test_pages_do_not_load_the_logged_in_user_again(app, make_users, record_queries, login, url):
+    user_id = make_users(1)[0].id
+    client = app.test_client()
+    login(client, User.query.get(user_id))
+
+    def count_queries():
+        db.session.remove()
+        with record_queries() as queries:
+            assert client.get(url).status_code == 200
+        return len(queries)
+
+    # User with its scan info in one query, then its permissions, the templates needing no lazy load
+    web_application.user_cache.forget(user_id)
+    uncached = count_queries()
+    assert uncached - count_queries() == 2
+
+
+def test_cached_user_is_complete(app, make_users, record_queries):
+    user = make_users(1)[0]
+    user.profile_scan_info = ProfileScanInfo(user)
+    db.session.commit()
+    cache = UserCache(10)
+    cache.get(user.id)
+    db.session.remove()
+
+    with record_queries() as queries:
+        cached = cache.get(user.id)
+        assert cached.nickname == 'player0'
+        assert cached.ban_date is None
+        assert cached.profile_scan_info.last_scan is None
+        assert not cached.has_permission(constants.PERMISSION_ADMIN)
+    assert len(queries) == 0
+
+
+def test_user_changes_drop_the_cached_user(app, make_users):
+    user_id = make_users(1)[0].id
+    cache = UserCache(10)
+
+    cache.get(user_id).nickname = 'renamed'
+    db.session.commit()
+    assert user_id not in cache.users.entries
+    assert cache.get(user_id).nickname == 'renamed'
+
+    user = cache.get(user_id)
+    user.profile_scan_info = ProfileScanInfo(user)
+    db.session.commit()
+    assert user_id not in cache.users.entries
+
+    db.session.add(UserPermission(constants.PERMISSION_ADMIN))
+    db.session.commit()
+    cache.get(user_id).give_permission(constants.PERMISSION_ADMIN, True)
+    assert user_id not in cache.users.entries
+    assert cache.get(user_id).has_permission(constants.PERMISSION_ADMIN)
+
+
+def test_disabled_cache_loads_every_time(app, make_users, record_queries):
+    user_id = make_users(1)[0].id
+    cache = UserCache(0)
+
+    for i in range(0, 2):
+        db.session.remove()
+        with record_queries() as queries:
+            cache.get(user_id)
+        assert len(queries) == 2
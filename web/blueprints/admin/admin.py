@@ -0,0 +1,60 @@
+from flask import Blueprint, url_for, abort, redirect, render_template
+from flask_login import current_user, login_required
+
+from common.models import db, Setting
+from common.profiler import PROFILER_SETTING
+import common.constants as constants
+
+
+def make_blueprint(profiler):
+    """Factory to create the Blueprint responsible for the administration tools.
+
+    Args:
+        profiler: `QueryProfiler` of the web application.
+    Returns:
+        `Blueprint` handling administration tools.
+    """
+    admin_blueprint = Blueprint('admin_blueprint', __name__, template_folder='templates')
+
+    @admin_blueprint.route('/admin/perf')
+    @login_required
+    def perf():
+        """Page with the SQL query profile of this web worker, the bot profiles being in the bot logs.
+
+        Returns:
+            Page with the queries of each endpoint and the slowest statements.
+        """
+        if not current_user.has_permission(constants.PERMISSION_ADMIN):
+            abort(403)
+        units, slowest = profiler.report()
+        return render_template('admin_perf.html', enabled=profiler.enabled, units=units, slowest=slowest)
+
+    @admin_blueprint.route('/admin/perf/toggle', methods=['POST'])
+    @login_required
+    def perf_toggle():
+        """Admin tool to enable or disable the query profiler, in all processes.
+
+        The other processes follow the setting within their synchronization delay.
+
+        Returns:
+            Redirection to the profile page.
+        """
+        if current_user.has_permission(constants.PERMISSION_ADMIN):
+            profiler.enabled = not profiler.enabled
+            db.session().merge(Setting(PROFILER_SETTING, '1' if profiler.enabled else '0'))
+            db.session().commit()
+        return redirect(url_for('admin_blueprint.perf'))
+
+    @admin_blueprint.route('/admin/perf/reset', methods=['POST'])
+    @login_required
+    def perf_reset():
+        """Admin tool to forget the queries recorded by this web worker.
+
+        Returns:
+            Redirection to the profile page.
+        """
+        if current_user.has_permission(constants.PERMISSION_ADMIN):
+            profiler.reset()
+        return redirect(url_for('admin_blueprint.perf'))
+
+    return admin_blueprint
@@ -1,26 +1,45 @@
-import pickle
 import logging
 
-from flask import Blueprint, current_app, request, url_for, redirect, render_template, jsonify, json
+from flask import Blueprint, current_app, request, url_for, redirect, render_template, jsonify, json, abort
 from flask_login import current_user, login_required
+from sqlalchemy import func
 
 from common.helpers import _jinja2_filter_french_date
-from common.models import db, User, QueuedPlayer, Match, Scoreboard
+from common.models import db, load_profile, User, Match, Scoreboard, Setting
 from common.job_queue import JobCreateGame
+from common.scoring import apply_match_contributions
+from common.cache import TTLCache
+from web.pagination import KeysetPagination
 import common.constants as constants
+import common.metrics as metrics
 
+# Seconds a scoreboard page is served from the cache, the ranks being refreshed by the bots and scripts
+SCOREBOARD_CACHE_TTL = 30
 
-def make_blueprint(job_queue):
+# Seconds a match page is served from the cache, the bots changing the status of matches in progress
+LIVE_MATCH_PAGE_TTL = 5
+# Seconds the page of an ended or cancelled match is served from the cache, only changed by admin tools
+FINISHED_MATCH_PAGE_TTL = 24 * 3600
+
+
+def make_blueprint(job_queue, queue_notifier, matchmaker, render_cache):
     """Factory to create the Blueprint responsible for the ladder features.
 
     Args:
         job_queue: `QueueAdapter` to send jobs to the Dota bots.
+        queue_notifier: `QueueNotifier` to push queue changes to the browsers.
+        matchmaker: `Matchmaker` holding the ladder queues.
+        render_cache: `RenderCache` of the match pages.
     Returns:
         `Blueprint` handling ladder features.
     """
 
     ladder_blueprint = Blueprint('ladder_blueprint', __name__, template_folder='templates')
 
+    # Scoreboard pages as tuple (count, data), indexed by (ladder, start, length)
+    scoreboard_cache = TTLCache(SCOREBOARD_CACHE_TTL)
+    match_pagination = KeysetPagination()
+
     @ladder_blueprint.route('/ladder/play')
     @login_required
     def ladder_play():
@@ -70,23 +89,28 @@ def make_blueprint(job_queue):
         if ladder not in [constants.LADDER_HIGH, constants.LADDER_LOW, constants.LADDER_MEDIUM]:
             ladder = constants.LADDER_HIGH
 
-        query = db.session().query(User, Scoreboard) \
-            .filter(User.id == Scoreboard.user_id) \
-            .filter(Scoreboard.ladder_name == ladder) \
-            .filter(User.nickname.isnot(None)) \
-            .order_by(Scoreboard.points.desc(), User.solo_mmr.desc())
-
-        count = query.count()
-
-        query = query.offset(start) \
-            .limit(length)
-
-        data = []
-        place = start
-        for user, scoreboard in query.all():
-            place += 1
-            data.append([user.avatar, place, user.nickname, str(user.id), scoreboard.points, user.solo_mmr,
-                         scoreboard.matches, scoreboard.win, scoreboard.loss, scoreboard.dodge, scoreboard.leave])
+        page = scoreboard_cache.get((ladder, start, length))
+        if page is None:
+            count = db.session().query(func.max(Scoreboard.rank)) \
+                .filter(Scoreboard.ladder_name == ladder) \
+                .scalar() or 0
+
+            query = db.session().query(User, Scoreboard) \
+                .filter(User.id == Scoreboard.user_id) \
+                .filter(Scoreboard.ladder_name == ladder) \
+                .filter(Scoreboard.rank > start) \
+                .filter(Scoreboard.rank <= start + length) \
+                .order_by(Scoreboard.rank)
+
+            data = []
+            for user, scoreboard in query.all():
+                data.append([user.avatar, scoreboard.rank, user.nickname, str(user.id), scoreboard.points,
+                             user.solo_mmr, scoreboard.matches, scoreboard.win, scoreboard.loss, scoreboard.dodge,
+                             scoreboard.leave])
+            page = (count, data)
+            scoreboard_cache.set((ladder, start, length), page)
+
+        count, data = page
         results = {
             "draw": draw,
             "recordsTotal": count,
@@ -99,10 +123,12 @@ def make_blueprint(job_queue):
     def ladder_matches():
         """Displays the list of all ladder matches.
 
+        Parameters:
+            section: optional ladder name to list the matches of (cf. constants).
         Returns:
             Page listing all ladder matches.
         """
-        return render_template('ladder_matches.html')
+        return render_template('ladder_matches.html', section=request.args.get('section', ''))
 
     @ladder_blueprint.route('/api/ladder/matches')
     def api_matches():
@@ -112,6 +138,7 @@ def make_blueprint(job_queue):
             draw: request identifier, returned in the answer.
             length: entries to return.
             start: offset for the entry.
+            section: optional ladder name to filter the matches (cf. constants).
         Returns:
             `JSON` containing match entries sorted with the following design
              {
@@ -124,17 +151,18 @@ def make_blueprint(job_queue):
         draw = request.args.get('draw', '1')
         length = int(request.args.get('length', '20'))
         start = int(request.args.get('start', '0'))
+        section = request.args.get('section', '')
 
-        query = Match.query \
-            .order_by(Match.created.desc())
-
-        count = query.count()
-
-        query = query.offset(start) \
-            .limit(length)
+        query = Match.query
+        if section in [constants.LADDER_HIGH, constants.LADDER_MEDIUM, constants.LADDER_LOW]:
+            query = query.filter(Match.section == section)
+        else:
+            section = ''
+        count = match_pagination.count(('matches', section), query)
 
         data = []
-        for match in query.all():
+        for match in match_pagination.page(('matches', section), query, [(Match.created, True), (Match.id, True)],
+                                           lambda match: (match.created, match.id), start, length):
             data.append([match.id, match.section, match.status, _jinja2_filter_french_date(match.created)])
         results = {
             "draw": draw,
@@ -153,8 +181,20 @@ def make_blueprint(job_queue):
         Returns:
             The page generated with the match details.
         """
-        match = db.session().query(Match).filter(Match.id == match_id).first()
-        return render_template('ladder_match.html', match=match)
+        def render():
+            match = db.session().query(Match) \
+                .options(*load_profile('match_with_players')) \
+                .filter(Match.id == match_id) \
+                .first()
+            if match is None:
+                abort(404)
+            if match.status in [constants.MATCH_STATUS_CANCELLED, constants.MATCH_STATUS_ENDED]:
+                ttl = FINISHED_MATCH_PAGE_TTL
+            else:
+                ttl = LIVE_MATCH_PAGE_TTL
+            return render_template('ladder_match.html', match=match), ttl
+
+        return render_cache.serve(('match', match_id), render)
 
     @ladder_blueprint.route('/ladder/match/cancel/<int:match_id>')
     @login_required
@@ -167,12 +207,20 @@ def make_blueprint(job_queue):
             Redirection to the match detail page.
         """
         if current_user.has_permission("admin"):
-            match_requested = Match.query.filter_by(id=match_id).first_or_404()
+            match_requested = Match.query.options(*load_profile('match_with_players')).filter_by(id=match_id) \
+                .first_or_404()
             if match_requested.status not in [constants.MATCH_STATUS_CANCELLED, constants.MATCH_STATUS_ENDED]:
+                Scoreboard.lock_ladders([match_requested.section])
                 match_requested.status = constants.MATCH_STATUS_CANCELLED
                 for player in match_requested.players:
                     player.player.current_match = None
+                scores = apply_match_contributions(match_requested)
+                scores.update_ranks()
+                scores_changed = len(scores) != 0
                 db.session.commit()
+                render_cache.invalidate(('match', match_id))
+                if scores_changed:
+                    scoreboard_cache.invalidate(lambda key: key[0] == match_requested.section)
         return redirect(url_for('ladder_blueprint.match', match_id=match_id))
 
     @ladder_blueprint.route('/ladder/match/outcome/<int:match_id>/<string:outcome>')
@@ -187,15 +235,37 @@ def make_blueprint(job_queue):
             Redirection to the match detail page.
         """
         if current_user.has_permission("admin"):
-            match_requested = Match.query.filter_by(id=match_id).first_or_404()
+            match_requested = Match.query.options(*load_profile('match_with_players')).filter_by(id=match_id) \
+                .first_or_404()
             if match_requested.status in [constants.MATCH_STATUS_CANCELLED, constants.MATCH_STATUS_ENDED]:
+                Scoreboard.lock_ladders([match_requested.section])
                 match_requested.status = constants.MATCH_STATUS_ENDED
-                radiant_win = outcome == 'Radiant'
-                match_requested.radiant_win = radiant_win
+                match_requested.radiant_win = outcome == 'Radiant'
+                apply_match_contributions(match_requested).update_ranks()
                 db.session.commit()
+                render_cache.invalidate(('match', match_id))
+                scoreboard_cache.invalidate(lambda key: key[0] == match_requested.section)
 
         return redirect(url_for('ladder_blueprint.match', match_id=match_id))
 
+    def queue_counts():
+        """Count the players in each ladder queue.
+
+        Returns:
+            `dict` of the number of players queued (capped at 10), indexed by ladder name.
+        """
+        if current_app.config['VIP_LADDER_OPEN']:
+            return matchmaker.counts()
+        return {
+            constants.LADDER_HIGH: 0,
+            constants.LADDER_LOW: 0,
+            constants.LADDER_MEDIUM: 0
+        }
+
+    def publish_queue_status():
+        """Push the new queue status to the browsers listening to the queue."""
+        queue_notifier.publish_queue_status(current_app.config['VIP_LADDER_OPEN'], queue_counts())
+
     @ladder_blueprint.route('/api/ladder/queue/details', methods=['GET'])
     def queue_details():
         payload = {'is_open': current_app.config['VIP_LADDER_OPEN'],
@@ -212,11 +282,10 @@ def make_blueprint(job_queue):
             payload['user']['game'] = current_user.current_match
 
         if payload['is_open']:
-            if current_user.is_authenticated and QueuedPlayer.query.filter_by(id=current_user.id).first() is not None:
+            if current_user.is_authenticated and matchmaker.is_queued(current_user.id):
                 payload['user']['in_queue'] = True
 
-            for key, value in payload['queues'].items():
-                payload['queues'][key] = QueuedPlayer.query.filter(QueuedPlayer.queue_name == key).limit(10).count()
+            payload['queues'] = queue_counts()
 
         return jsonify(payload), 200
 
@@ -226,10 +295,11 @@ def make_blueprint(job_queue):
         open_or_close = request.args.get('open', '0') == '1'
 
         if current_user.has_permission('admin'):
-            for user in QueuedPlayer.query.all():
-                db.session.delete(user)
-            db.session.commit()
+            matchmaker.clear()
             current_app.config['VIP_LADDER_OPEN'] = open_or_close
+            db.session().merge(Setting('VIP_LADDER_OPEN', '1' if open_or_close else '0'))
+            db.session().commit()
+            publish_queue_status()
 
             return queue_details()
         else:
@@ -245,34 +315,33 @@ def make_blueprint(job_queue):
         modes = data['modes']
 
         if current_user.current_match is None and current_user.section is not None:
-            remove_queue = QueuedPlayer.query.filter_by(id=current_user.id).first()
-
-            if not in_out and remove_queue is not None:
-                db.session().delete(remove_queue)
-                db.session().commit()
-            elif in_out and remove_queue is None:
-                new_queue = QueuedPlayer(current_user.id, current_user.section, modes)
-                db.session().add(new_queue)
-                db.session().commit()
-
-                query = QueuedPlayer.query.filter_by(queue_name=current_user.section) \
-                    .order_by(QueuedPlayer.added).limit(10)
-                if query.count() >= 10:
+            if not in_out:
+                matchmaker.leave(current_user.id)
+            else:
+                entries = matchmaker.join(current_user.id, current_user.section, modes)
+                if entries is not None:
                     # Create a game
-                    players = []
-                    votes = []
-                    for player in query.all():
-                        players.append(player.id)
-                        votes.append(player.mode_vote)
-                        db.session().delete(player)
-                    new_match = Match(players, current_user.section, votes)
+                    players = [entry.user_id for entry in entries]
+                    votes = [entry.mode_vote for entry in entries]
+                    users = User.query.filter(User.id.in_(players)).all()
+                    if len(users) != len(entries):
+                        # Accounts deleted meanwhile, the other players wait at the head of the queue
+                        found = set(user.id for user in users)
+                        logging.warning('Players %s not found, match not created.', set(players) - found)
+                        matchmaker.requeue([entry for entry in entries if entry.user_id in found])
+                        publish_queue_status()
+                        return queue_details()
+                    new_match = Match(users, current_user.section, votes, current_app.config['MATCH_BALANCER'])
                     db.session().add(new_match)
                     db.session().commit()
-                    for player in new_match.players:
-                        player.player.current_match = new_match.id
+                    for user in users:
+                        user.current_match = new_match.id
                     db.session.commit()
 
                     job_queue.produce(JobCreateGame(match_id=new_match.id))
+                    metrics.MATCHES_CREATED.inc(section=new_match.section)
+                    queue_notifier.publish_match_ready(new_match.id, players)
+            publish_queue_status()
 
         return queue_details()
 
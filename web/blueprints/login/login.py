@@ -1,19 +1,22 @@
+import logging
 import re
 from datetime import datetime
 
-from steam import WebAPI
-from flask import current_app, Blueprint, request, url_for, redirect, render_template
+from flask import Blueprint, request, url_for, redirect, render_template
 from flask_login import current_user, login_user, login_required, logout_user
 
-from common.models import db, User
+from common.models import User
+from common.job_queue import JobRefreshAvatars
 
 
-def make_blueprint(oid, login_manager):
+def make_blueprint(oid, login_manager, user_cache, job_queue):
     """Factory to create the Blueprint responsible for the login features.
 
     Args:
         oid: Flask OpenID module of the application.
         login_manager: Flask LoginManager module of the application.
+        user_cache: `UserCache` of the logged-in users.
+        job_queue: `QueueAdapter` to send jobs to the bot application.
     Returns:
         `Blueprint` handling login features.
     """
@@ -28,8 +31,7 @@ def make_blueprint(oid, login_manager):
         Returns:
             `User` object of the current user.
         """
-        user = User.query.filter_by(id=user_id).first()
-        return user
+        return user_cache.get(int(user_id))
 
     @login_blueprint.route('/login')
     def login():
@@ -106,13 +108,11 @@ def make_blueprint(oid, login_manager):
         steam_id = int(match.group(1))
 
         user = User.get_or_create(steam_id)
-
-        api = WebAPI(key=current_app.config['STEAM_KEY'])
-        resp=api.ISteamUser.GetPlayerSummaries_v2(steamids=steam_id)
-        user.avatar = resp['response']['players'][0]['avatar']
-        user.avatar_medium = resp['response']['players'][0]['avatarmedium']
-        user.avatar_full = resp['response']['players'][0]['avatarfull']
-        db.session.commit()
+        try:
+            job_queue.produce(JobRefreshAvatars(steam_ids=[steam_id]))
+        except Exception:
+            # The avatar is refreshed by a later login, the broker must not prevent this one
+            logging.exception('Impossible to queue the avatar refresh of %s.', steam_id)
 
         login_user(user, remember=True)
         return redirect(url_for('index'))
@@ -4,15 +4,22 @@ from flask import Blueprint, jsonify, request, url_for, redirect, render_templat
 from flask_login import current_user, login_required
 
 from common.models import db, User, UserMixDetail
+from web.pagination import KeysetPagination
 
+# Seconds a mix page is served from the cache, the edits of this process dropping it immediately
+MIX_PAGE_TTL = 300
 
-def make_blueprint():
+
+def make_blueprint(render_cache):
     """Factory to create the Blueprint responsible for the mix features.
 
+    Args:
+        render_cache: `RenderCache` of the mix pages.
     Returns:
         `Blueprint` handling mix features.
     """
     mix_blueprint = Blueprint('mix_blueprint', __name__, template_folder='templates')
+    mix_pagination = KeysetPagination()
 
     @mix_blueprint.route('/mix/users')
     def mix_users():
@@ -32,8 +39,11 @@ def make_blueprint():
         Returns:
             The page with the details of the mix.
         """
-        mix_requested = UserMixDetail.query.filter_by(id=mix_id).first_or_404()
-        return render_template('mix_details.html', mix=mix_requested)
+        def render():
+            mix_requested = UserMixDetail.query.filter_by(id=mix_id).first_or_404()
+            return render_template('mix_details.html', mix=mix_requested), MIX_PAGE_TTL
+
+        return render_cache.serve(('mix', mix_id), render)
 
     @mix_blueprint.route('/mix/edit', methods=['GET', 'POST'])
     @login_required
@@ -72,6 +82,7 @@ def make_blueprint():
             mix_requested.refresh_date = datetime.utcnow()
 
             db.session().commit()
+            render_cache.invalidate(('mix', current_user.id))
 
             if mix_requested.enabled:
                 return redirect(url_for('mix_blueprint.mix', mix_id=current_user.id))
@@ -99,21 +110,21 @@ def make_blueprint():
         length = int(request.args.get('length', '20'))
         start = int(request.args.get('start', '0'))
 
-        date_limit = datetime.utcnow() - timedelta(days=7)
+        # Window moving by the minute, the cursors and the count being cached for this window only
+        date_limit = datetime.utcnow().replace(second=0, microsecond=0) - timedelta(days=7)
+        listing = ('mixs', date_limit)
 
         query = db.session().query(User, UserMixDetail)\
             .filter(UserMixDetail.id == User.id)\
             .filter(UserMixDetail.refresh_date > date_limit.isoformat())\
-            .filter(UserMixDetail.enabled)\
-            .order_by(UserMixDetail.refresh_date.desc())\
-
-        count = query.count()
+            .filter(UserMixDetail.enabled)
 
-        query = query.offset(start)\
-            .limit(length)
+        count = mix_pagination.count(listing, query)
 
         data = []
-        for user, mix_details in query.all():
+        for user, mix_details in mix_pagination.page(listing, query,
+                                                     [(UserMixDetail.refresh_date, True), (UserMixDetail.id, True)],
+                                                     lambda row: (row[1].refresh_date, row[1].id), start, length):
             data.append([str(user.id), user.avatar, user.nickname, mix_details.title, mix_details.goal, mix_details.level])
         results = {
             "draw": draw,
@@ -1,25 +1,32 @@
 import logging
-import pickle
 from datetime import datetime, timedelta
 
 from flask import Blueprint, request, current_app, url_for, abort, redirect, render_template, jsonify
 from flask_login import current_user, login_required
 
-from common.models import db, User, ProfileScanInfo, Scoreboard
+from common.models import db, load_profile, User, ProfileScanInfo, Scoreboard, Match, PlayerInMatch
 from common.job_queue import JobScan
-from common.helpers import validate_nickname
+from common.helpers import validate_nickname, _jinja2_filter_french_date
+from web.pagination import KeysetPagination
+from web.search import search_users
 import common.constants as constants
 
+# Seconds a user page is served from the cache, the bots scanning profiles in another process
+USER_PAGE_TTL = 30
 
-def make_blueprint(job_queue):
+
+def make_blueprint(job_queue, render_cache):
     """Factory to create the Blueprint responsible for the user features.
 
     Args:
         job_queue: `QueueAdapter` to send jobs to the Dota bots.
+        render_cache: `RenderCache` of the user pages, dropped by the application when a user changes.
     Returns:
         `Blueprint` handling user features.
     """
     user_blueprint = Blueprint('user_blueprint', __name__, template_folder='templates')
+    user_pagination = KeysetPagination()
+    history_pagination = KeysetPagination()
 
     @user_blueprint.route('/nickname', methods=['GET'])
     @login_required
@@ -55,7 +62,11 @@ def make_blueprint(job_queue):
             return jsonify({
                 'status': 'ko',
                 'message': 'Le pseudo est déjà utilisé.'}), 200
+        ladder_names = [scoreboard.ladder_name for scoreboard in current_user.scoreboards]
+        Scoreboard.lock_ladders(ladder_names)
         current_user.nickname = posted_nickname
+        for ladder_name in ladder_names:
+            Scoreboard.update_ranks(ladder_name, {current_user.id: 0})
         db.session().commit()
 
         return jsonify({'status': 'ok'}), 200
@@ -120,9 +131,13 @@ def make_blueprint(job_queue):
         steam_id = int(steam_id)
         target_user = db.session().query(User).filter_by(id=steam_id).first()
         if target_user is not None and current_user.has_permission(constants.PERMISSION_ADMIN):
+            ladder_names = [scoreboard.ladder_name for scoreboard in target_user.scoreboards]
+            Scoreboard.lock_ladders(ladder_names)
             target_user.nickname = None
             target_user.verified = False
             target_user.section = None
+            for ladder_name in ladder_names:
+                Scoreboard.update_ranks(ladder_name, {target_user.id: 0})
             db.session().commit()
         return redirect(url_for('user_blueprint.user', steam_id=steam_id))
 
@@ -187,24 +202,21 @@ def make_blueprint(job_queue):
             }
         """
         draw = request.args.get('draw', '1')
-        search = request.args.get('search[value]', '')
+        search = request.args.get('search[value]', '').strip()[0:20]
         length = int(request.args.get('length', '20'))
         start = int(request.args.get('start', '0'))
 
         query = db.session().query(User) \
-            .order_by(User.nickname) \
             .filter(User.nickname.isnot(None))
+        query, order, row_key = search_users(query, search)
 
-        if search != '':
-            query = query.filter(User.nickname.ilike('%' + search + '%'))
-
-        count = query.count()
+        count = user_pagination.count(('users', search), query)
 
-        query = query.offset(start) \
-            .limit(length)
+        users = [user for user, rank in user_pagination.page(('users', search), query, order, row_key, start, length)]
+        User.load_permissions(users)
 
         data = []
-        for user in query.all():
+        for user in users:
             permissions = {
                 'verified': user.verified,
                 constants.PERMISSION_ADMIN: user.has_permission(constants.PERMISSION_ADMIN)
@@ -227,18 +239,79 @@ def make_blueprint(job_queue):
         Returns:
             Page with the detailed information of the user.
         """
-        user_requested = db.session().query(User).filter_by(id=steam_id).first()
-        if user_requested is None:
-            abort(404)
-        if current_user.is_authenticated and current_user.id == user_requested.id and \
-                (current_user.profile_scan_info is None or
-                             datetime.utcnow() - current_user.profile_scan_info.last_scan_request > timedelta(
-                         minutes=5)):
-            scan_possible = True
-        else:
-            scan_possible = False
-        user_banned = user_requested.ban_date is not None and user_requested.ban_date > datetime.utcnow()
-        return render_template('user_details.html', user=user_requested, scan_possible=scan_possible, user_banned=user_banned)
+        def render():
+            user_requested = db.session().query(User) \
+                .options(*load_profile('user_with_scan_info')) \
+                .filter_by(id=steam_id) \
+                .first()
+            if user_requested is None:
+                abort(404)
+            if current_user.is_authenticated and current_user.id == user_requested.id and \
+                    (current_user.profile_scan_info is None or
+                                 datetime.utcnow() - current_user.profile_scan_info.last_scan_request > timedelta(
+                             minutes=5)):
+                scan_possible = True
+            else:
+                scan_possible = False
+            user_banned = user_requested.ban_date is not None and user_requested.ban_date > datetime.utcnow()
+            return render_template('user_details.html', user=user_requested, scan_possible=scan_possible,
+                                   user_banned=user_banned), USER_PAGE_TTL
+
+        return render_cache.serve(('user', steam_id), render)
+
+    @user_blueprint.route('/api/user/<int:steam_id>/matches')
+    def api_user_matches(steam_id):
+        """API endpoint for the datatable to request the match history of a user, latest first.
+
+        Args:
+            steam_id: user ID to return the matches of.
+        Parameters:
+            draw: request identifier, returned in the answer.
+            length: entries to return.
+            start: offset for the entry.
+        Returns:
+            `JSON` containing match entries sorted with the following design
+             {
+                "draw": <draw parameter>
+                "recordsTotal": <total entries>
+                "recordsFiltered": <total entries>
+                "data": [ entry.data ]
+            }
+        """
+        draw = request.args.get('draw', '1')
+        length = int(request.args.get('length', '20'))
+        start = int(request.args.get('start', '0'))
+
+        count = history_pagination.count(('history', steam_id),
+                                         PlayerInMatch.query.filter(PlayerInMatch.player_id == steam_id))
+
+        # Match IDs follow the creation order, the player columns are read from the history index
+        query = db.session().query(PlayerInMatch.match_id, PlayerInMatch.is_radiant, PlayerInMatch.is_leaver,
+                                   PlayerInMatch.is_dodge, Match) \
+            .join(Match, Match.id == PlayerInMatch.match_id) \
+            .filter(PlayerInMatch.player_id == steam_id)
+        data = []
+        for match_id, is_radiant, is_leaver, is_dodge, match in \
+                history_pagination.page(('history', steam_id), query, [(PlayerInMatch.match_id, True)],
+                                        lambda row: (row.match_id,), start, length):
+            if is_dodge:
+                result = 'dodge'
+            elif is_leaver:
+                result = 'leave'
+            elif match.radiant_win is None:
+                result = ''
+            elif match.radiant_win == is_radiant:
+                result = 'win'
+            else:
+                result = 'loss'
+            data.append([match.id, match.section, match.status, _jinja2_filter_french_date(match.created), result])
+        results = {
+            "draw": draw,
+            "recordsTotal": count,
+            "recordsFiltered": count,
+            "data": data
+        }
+        return jsonify(results)
 
     @user_blueprint.route('/user/profile')
     @login_required
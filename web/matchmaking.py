@@ -0,0 +1,347 @@
+from abc import ABC, abstractmethod
+from collections import OrderedDict
+from datetime import datetime
+from queue import Queue, Empty
+from threading import Lock, Thread
+from time import sleep
+import logging
+
+from sqlalchemy import func
+from sqlalchemy.exc import IntegrityError
+
+from common.models import db, User, QueuedPlayer
+import common.constants as constants
+
+# Number of players needed to start a match
+MATCH_SIZE = 10
+
+
+class QueueEntry:
+    """A player waiting in a ladder queue.
+
+    Attributes:
+        user_id: ID of the `User` queued.
+        queue_name: queue label the player is queued in (cf. constants).
+        mode_vote: modes chosen by the player, encoded as an integer.
+        added: `datetime` of the queue entrance.
+    """
+
+    def __init__(self, user_id, queue_name, mode_vote, added):
+        self.user_id = user_id
+        self.queue_name = queue_name
+        self.mode_vote = mode_vote
+        self.added = added
+
+
+class Matchmaker(ABC):
+    """Interface of the component holding the ladder queues and forming the groups of players for a match."""
+
+    @abstractmethod
+    def join(self, user_id, queue_name, modes):
+        """Add a player in a queue, forming a group if enough players are waiting.
+
+        Args:
+            user_id: ID of the `User` to queue.
+            queue_name: queue label to add the player into.
+            modes: `dict` of the modes voted by the player.
+        Returns:
+            `list` of the `QueueEntry` popped from the queue if a match should be created, None otherwise.
+        """
+
+    @abstractmethod
+    def requeue(self, entries):
+        """Put back players popped by `join` at the head of their queue, in their original order.
+
+        Args:
+            entries: `list` of the `QueueEntry` to put back.
+        """
+
+    @abstractmethod
+    def leave(self, user_id):
+        """Remove a player from the queues.
+
+        Args:
+            user_id: ID of the `User` to remove.
+        """
+
+    @abstractmethod
+    def is_queued(self, user_id):
+        """Check if a player is waiting in a queue.
+
+        Args:
+            user_id: ID of the `User` to check.
+        Returns:
+            `Boolean` True iff the player is in a queue.
+        """
+
+    @abstractmethod
+    def counts(self):
+        """Count the players waiting in each queue.
+
+        Returns:
+            `dict` of the number of players queued, indexed by ladder name.
+        """
+
+    @abstractmethod
+    def clear(self):
+        """Remove all players from all queues."""
+
+    def start(self):
+        """Start the background work of the matchmaker, if any, in the process serving the queues."""
+
+
+class DatabaseMatchmaker(Matchmaker):
+    """Matchmaker reading and writing the `QueuedPlayer` table on every call, shared by all the web workers."""
+
+    def join(self, user_id, queue_name, modes):
+        if self.is_queued(user_id):
+            return None
+
+        db.session().add(QueuedPlayer(user_id, queue_name, modes))
+        try:
+            db.session().commit()
+        except IntegrityError:
+            # Concurrent join of the same player (double click), already queued
+            db.session().rollback()
+            return None
+
+        # Lock the group, concurrent joins of other workers skip these players instead of popping them again
+        players = QueuedPlayer.query.filter_by(queue_name=queue_name) \
+            .order_by(QueuedPlayer.added) \
+            .limit(MATCH_SIZE) \
+            .with_for_update(skip_locked=True) \
+            .all()
+        if len(players) < MATCH_SIZE:
+            db.session().rollback()
+            return None
+
+        entries = []
+        for player in players:
+            entries.append(QueueEntry(player.id, player.queue_name, player.mode_vote, player.added))
+            db.session().delete(player)
+        db.session().commit()
+        return entries
+
+    def requeue(self, entries):
+        for entry in entries:
+            # Original arrival time, the queue being ordered by it
+            player = QueuedPlayer(entry.user_id, entry.queue_name, {})
+            player.mode_vote = entry.mode_vote
+            player.added = entry.added
+            db.session().merge(player)
+        db.session().commit()
+
+    def leave(self, user_id):
+        QueuedPlayer.query.filter_by(id=user_id).delete()
+        db.session().commit()
+
+    def is_queued(self, user_id):
+        return QueuedPlayer.query.filter_by(id=user_id).first() is not None
+
+    def counts(self):
+        queues = dict.fromkeys([constants.LADDER_HIGH, constants.LADDER_LOW, constants.LADDER_MEDIUM], 0)
+        for queue_name, count in db.session().query(QueuedPlayer.queue_name, func.count(QueuedPlayer.id)) \
+                .group_by(QueuedPlayer.queue_name):
+            if queue_name in queues:
+                queues[queue_name] = min(count, MATCH_SIZE)
+        return queues
+
+    def clear(self):
+        QueuedPlayer.query.delete()
+        db.session().commit()
+
+
+class MemoryMatchmaker(Matchmaker):
+    """Matchmaker holding the queues in memory, persisting the changes asynchronously in the `QueuedPlayer` table.
+
+    Each ladder queue is an `OrderedDict` in arrival order, popping a group of players is atomic under a lock.
+    The changes are pushed to a write-behind log applied by a background thread started with `start`, the table is
+    only read at the first use to recover the queues after a restart.
+
+    Attributes:
+        app: Flask application used to access the database from the writer thread.
+        queues: `dict` of `OrderedDict` of `QueueEntry` indexed by user ID, indexed by ladder name.
+        queued_users: `dict` of the queue name of each queued user ID.
+        lock: `Lock` protecting the queues.
+        loaded: `Boolean` True iff the queues were recovered from the database.
+        log: `Queue` of pending database operations, each one marked done once persisted.
+        writer: `Thread` applying the pending operations, None until started.
+    """
+
+    # Maximum number of operations persisted in one transaction
+    FLUSH_SIZE = 100
+
+    # Seconds before retrying to persist operations after a database error
+    RETRY_DELAY = 5
+
+    def __init__(self, app):
+        """Create the empty queues, the writer thread being started with `start`.
+
+        Args:
+            app: Flask application the matchmaker is linked to.
+        """
+        self.app = app
+        self.queues = {
+            constants.LADDER_HIGH: OrderedDict(),
+            constants.LADDER_LOW: OrderedDict(),
+            constants.LADDER_MEDIUM: OrderedDict()
+        }
+        self.queued_users = {}
+        self.lock = Lock()
+        self.loaded = False
+        self.log = Queue()
+        self.writer = None
+
+    def start(self):
+        """Start the writer thread persisting the queue operations, once."""
+        if self.writer is None:
+            self.writer = Thread(target=self._write_behind, name='matchmaker-writer', daemon=True)
+            self.writer.start()
+
+    def flush(self):
+        """Wait until the operations logged so far are persisted, e.g. before stopping the process."""
+        self.start()
+        self.log.join()
+
+    def _load(self):
+        """Recover the queues from the database, skipping players already in a match. Requires the lock."""
+        if self.loaded:
+            return
+        for player in QueuedPlayer.query.join(User, User.id == QueuedPlayer.id)\
+                .filter(User.current_match.is_(None))\
+                .order_by(QueuedPlayer.added).all():
+            if player.queue_name in self.queues and player.id not in self.queued_users:
+                self.queues[player.queue_name][player.id] = QueueEntry(player.id, player.queue_name,
+                                                                       player.mode_vote, player.added)
+                self.queued_users[player.id] = player.queue_name
+        self.loaded = True
+
+    def join(self, user_id, queue_name, modes):
+        with self.lock:
+            self._load()
+            if user_id in self.queued_users or queue_name not in self.queues:
+                return None
+
+            entry = QueueEntry(user_id, queue_name, QueuedPlayer.mode_vote_dic_to_integer(modes), datetime.utcnow())
+            queue = self.queues[queue_name]
+            queue[user_id] = entry
+            self.queued_users[user_id] = queue_name
+            self.log.put(('add', entry))
+
+            if len(queue) < MATCH_SIZE:
+                return None
+
+            entries = []
+            for i in range(0, MATCH_SIZE):
+                popped_id, popped_entry = queue.popitem(last=False)
+                self.queued_users.pop(popped_id)
+                entries.append(popped_entry)
+            self.log.put(('remove', [entry.user_id for entry in entries]))
+            return entries
+
+    def requeue(self, entries):
+        with self.lock:
+            self._load()
+            for queue_name, queue in self.queues.items():
+                returning = [entry for entry in entries
+                             if entry.queue_name == queue_name and entry.user_id not in self.queued_users]
+                if len(returning) == 0:
+                    continue
+                waiting = list(queue.values())
+                queue.clear()
+                for entry in returning + waiting:
+                    queue[entry.user_id] = entry
+                for entry in returning:
+                    self.queued_users[entry.user_id] = queue_name
+                    self.log.put(('add', entry))
+
+    def leave(self, user_id):
+        with self.lock:
+            self._load()
+            queue_name = self.queued_users.pop(user_id, None)
+            if queue_name is None:
+                return
+            self.queues[queue_name].pop(user_id)
+            self.log.put(('remove', [user_id]))
+
+    def is_queued(self, user_id):
+        with self.lock:
+            self._load()
+            return user_id in self.queued_users
+
+    def counts(self):
+        with self.lock:
+            self._load()
+            return {queue_name: min(len(queue), MATCH_SIZE) for queue_name, queue in self.queues.items()}
+
+    def clear(self):
+        with self.lock:
+            for queue in self.queues.values():
+                queue.clear()
+            self.queued_users.clear()
+            self.loaded = True
+            self.log.put(('clear', None))
+
+    def _write_behind(self):
+        """Main loop of the writer thread, applying the pending operations by batch, in order, until they succeed."""
+        operations = []
+        while True:
+            if len(operations) == 0:
+                operations.append(self.log.get())
+            try:
+                while len(operations) < self.FLUSH_SIZE:
+                    operations.append(self.log.get_nowait())
+            except Empty:
+                pass
+
+            with self.app.app_context():
+                try:
+                    self._apply(operations)
+                    db.session.commit()
+                    for i in range(0, len(operations)):
+                        self.log.task_done()
+                    operations = []
+                except Exception:
+                    # Kept pending, ahead of the operations logged since
+                    logging.exception('Impossible to persist %s queue operations, retrying in %ss.',
+                                      len(operations), self.RETRY_DELAY)
+                    db.session.rollback()
+                finally:
+                    db.session.remove()
+            if len(operations) != 0:
+                sleep(self.RETRY_DELAY)
+
+    @staticmethod
+    def _apply(operations):
+        """Replay a batch of queue operations into the current database session.
+
+        Args:
+            operations: `list` of operations as tuple (kind, payload).
+        """
+        for kind, payload in operations:
+            if kind == 'add':
+                player = QueuedPlayer(payload.user_id, payload.queue_name, {})
+                player.mode_vote = payload.mode_vote
+                player.added = payload.added
+                db.session.merge(player)
+            elif kind == 'remove':
+                db.session.flush()
+                QueuedPlayer.query.filter(QueuedPlayer.id.in_(payload)).delete(synchronize_session=False)
+            elif kind == 'clear':
+                db.session.flush()
+                QueuedPlayer.query.delete(synchronize_session=False)
+
+
+def make_matchmaker(app):
+    """Create the matchmaker chosen in the application configuration.
+
+    Args:
+        app: Flask application the matchmaker is linked to.
+    Returns:
+        A `MemoryMatchmaker` if MATCHMAKER is 'memory' with a single web worker, a `DatabaseMatchmaker` otherwise.
+    """
+    if app.config['MATCHMAKER'] == 'memory':
+        if app.config['WEB_WORKERS'] == 1:
+            return MemoryMatchmaker(app)
+        logging.warning('In memory matchmaker impossible with several web workers, using the database.')
+    return DatabaseMatchmaker()
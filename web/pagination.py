@@ -0,0 +1,92 @@
+from sqlalchemy import tuple_, or_, and_
+
+from common.cache import TTLCache
+
+
+class KeysetPagination:
+    """Compatibility layer serving the offset based pages of DataTables with keyset (seek) queries.
+
+    When a page is served, the sort key of its last row is remembered as the cursor of the next page offset.
+    A request for an offset with a known cursor seeks directly after it instead of skipping all previous rows,
+    so browsing page after page keeps a constant cost. Unknown offsets fall back to a classic offset query.
+    Cursors and counts expire after a delay, rows inserted meanwhile may shift the pages slightly.
+
+    Attributes:
+        cursors: `TTLCache` of the sort key preceding an offset, indexed by (listing name, offset).
+        counts: `TTLCache` of the number of rows, indexed by listing name.
+    """
+
+    def __init__(self, ttl=60, max_size=4096):
+        """Create an empty pagination state.
+
+        Args:
+            ttl: seconds cursors and counts are kept.
+            max_size: maximum number of cursors kept.
+        """
+        self.cursors = TTLCache(ttl, max_size)
+        self.counts = TTLCache(ttl, max_size)
+
+    def count(self, name, query):
+        """Count the rows of a listing, computed at most once per cache delay.
+
+        Args:
+            name: hashable identifier of the listing, including its filters.
+            query: `Query` of the listing.
+        Returns:
+            `int` number of rows.
+        """
+        count = self.counts.get(name)
+        if count is None:
+            count = query.order_by(None).count()
+            self.counts.set(name, count)
+        return count
+
+    def page(self, name, query, order, row_key, start, length):
+        """Fetch a page of a listing.
+
+        Args:
+            name: hashable identifier of the listing, including its filters.
+            query: `Query` of the listing, without ordering.
+            order: `list` of tuple (column, descending) sorting the rows, the last columns making it unique.
+            row_key: function returning the values of the order columns for a row of the query.
+            start: offset of the first row requested.
+            length: maximum number of rows.
+        Returns:
+            `list` of the rows of the page.
+        """
+        query = query.order_by(*[column.desc() if descending else column.asc() for column, descending in order])
+
+        cursor = self.cursors.get((name, start)) if start > 0 else None
+        if cursor is not None:
+            query = query.filter(seek_after(order, cursor))
+        else:
+            query = query.offset(start)
+        rows = query.limit(length).all()
+
+        if len(rows) != 0:
+            self.cursors.set((name, start + len(rows)), tuple(row_key(rows[-1])))
+        return rows
+
+
+def seek_after(order, cursor):
+    """Build the condition selecting the rows sorted after a cursor.
+
+    Args:
+        order: `list` of tuple (column, descending) sorting the rows.
+        cursor: `tuple` of the column values of the last row already served.
+    Returns:
+        The SQL condition.
+    """
+    directions = set(descending for column, descending in order)
+    if len(directions) == 1:
+        # Same direction on all columns, a row comparison that the database can match with an index range
+        columns = tuple_(*[column for column, descending in order])
+        values = tuple_(*cursor)
+        return columns < values if directions.pop() else columns > values
+
+    clauses = []
+    for index, (column, descending) in enumerate(order):
+        equalities = [order[previous][0] == cursor[previous] for previous in range(0, index)]
+        beyond = column < cursor[index] if descending else column > cursor[index]
+        clauses.append(and_(*(equalities + [beyond])))
+    return or_(*clauses)
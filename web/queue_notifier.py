@@ -0,0 +1,182 @@
+import json
+import logging
+
+from flask import session
+from tornado.websocket import WebSocketHandler, WebSocketClosedError
+
+
+class QueueNotifier:
+    """Push channel broadcasting the ladder queue status to the connected browsers.
+
+    Events are only emitted when the queue state changes (queue in/out, ladder open/close, match creation), so the
+    database load does not grow with the number of idle viewers. With several web workers, each worker also pushes
+    the state read periodically from the database, the changes being made by the other workers.
+
+    Attributes:
+        app: The flask application, used to decode the session of the connected users.
+        io_loop: Tornado IO_LOOP the sockets are served on, None when the push channel is not started.
+        sockets: `set` of all connected `QueueSocketHandler`.
+        sockets_by_user: `dict` of `set` of `QueueSocketHandler` indexed by user ID.
+        last_status: last queue status broadcasted, sent to new sockets on connection.
+        notified_matches: `dict` of the match ID last sent by `publish_current_matches`, indexed by user ID.
+    """
+
+    def __init__(self, app):
+        """Create a notifier without any connected socket.
+
+        Args:
+            app: Flask application the notifier is linked to.
+        """
+        self.app = app
+        self.io_loop = None
+        self.sockets = set()
+        self.sockets_by_user = {}
+        self.last_status = None
+        self.notified_matches = {}
+
+    def attach(self, io_loop):
+        """Start the push channel on a Tornado IO_LOOP.
+
+        Args:
+            io_loop: Tornado IO_LOOP serving the sockets.
+        """
+        self.io_loop = io_loop
+
+    def user_id_from_cookie(self, cookie):
+        """Find the logged user from the Flask session cookie of a socket request.
+
+        Args:
+            cookie: `str` Cookie header of the socket request.
+        Returns:
+            The user ID as `int` if the user is logged in, None otherwise.
+        """
+        with self.app.test_request_context('/', headers={'Cookie': cookie or ''}):
+            user_id = session.get('_user_id', session.get('user_id'))
+        if user_id is None:
+            return None
+        return int(user_id)
+
+    def register(self, socket):
+        """Add a socket to the broadcast list.
+
+        Args:
+            socket: `QueueSocketHandler` connected.
+        """
+        self.sockets.add(socket)
+        if socket.user_id is not None:
+            self.sockets_by_user.setdefault(socket.user_id, set()).add(socket)
+        if self.last_status is not None:
+            socket.send(self.last_status)
+
+    def unregister(self, socket):
+        """Remove a socket from the broadcast list.
+
+        Args:
+            socket: `QueueSocketHandler` closed.
+        """
+        self.sockets.discard(socket)
+        if socket.user_id in self.sockets_by_user:
+            self.sockets_by_user[socket.user_id].discard(socket)
+            if len(self.sockets_by_user[socket.user_id]) == 0:
+                self.sockets_by_user.pop(socket.user_id)
+
+    def publish_queue_status(self, is_open, queues):
+        """Broadcast the new queue status to all connected sockets.
+
+        Args:
+            is_open: `Boolean` True iff the ladder is open.
+            queues: `dict` of the number of players queued, indexed by ladder name.
+        """
+        status = json.dumps({'type': 'queue', 'is_open': is_open, 'queues': queues}, sort_keys=True)
+        if status == self.last_status:
+            return
+        self.last_status = status
+        self._schedule(self._broadcast, self.last_status)
+
+    def publish_match_ready(self, match_id, players):
+        """Inform the players of a new match that their game is ready.
+
+        Args:
+            match_id: ID of the `Match` created.
+            players: `list` of user IDs playing the match.
+        """
+        message = json.dumps({'type': 'match', 'game': match_id})
+        self._schedule(self._send_to_users, players, message)
+
+    def publish_current_matches(self, current_matches):
+        """Inform the connected players of their current match, possibly created by another web worker.
+
+        Each match is sent once to a player.
+
+        Args:
+            current_matches: `dict` of match ID indexed by user ID, for the users connected to this notifier.
+        """
+        for user_id, match_id in current_matches.items():
+            if self.notified_matches.get(user_id) != match_id:
+                self.publish_match_ready(match_id, [user_id])
+        self.notified_matches = dict(current_matches)
+
+    def connected_users(self):
+        """List the users with a socket connected to this notifier.
+
+        Returns:
+            `list` of user IDs.
+        """
+        return list(self.sockets_by_user)
+
+    def _schedule(self, callback, *args):
+        """Run a callback on the IO_LOOP thread, does nothing if the push channel is not started."""
+        if self.io_loop is not None:
+            self.io_loop.add_callback(callback, *args)
+
+    def _broadcast(self, message):
+        for socket in list(self.sockets):
+            socket.send(message)
+
+    def _send_to_users(self, users, message):
+        for user_id in users:
+            for socket in list(self.sockets_by_user.get(user_id, [])):
+                socket.send(message)
+
+
+class QueueSocketHandler(WebSocketHandler):
+    """WebSocket endpoint pushing queue events to a browser.
+
+    Attributes:
+        notifier: `QueueNotifier` the socket is registered into.
+        user_id: ID of the logged user owning the socket, None if anonymous.
+    """
+
+    def initialize(self, notifier):
+        """Link the handler to the notifier.
+
+        Args:
+            notifier: `QueueNotifier` broadcasting the events.
+        """
+        self.notifier = notifier
+        self.user_id = None
+
+    def open(self):
+        """Register the socket with the user identity found in the session cookie."""
+        self.user_id = self.notifier.user_id_from_cookie(self.request.headers.get('Cookie'))
+        self.notifier.register(self)
+
+    def on_close(self):
+        """Unregister the socket."""
+        self.notifier.unregister(self)
+
+    def on_message(self, message):
+        """Browsers are not supposed to talk on this channel."""
+        pass
+
+    def send(self, message):
+        """Write a message to the socket, dropping it if the socket is already closed.
+
+        Args:
+            message: `str` JSON message to send.
+        """
+        try:
+            self.write_message(message)
+        except WebSocketClosedError:
+            logging.info('Queue socket of user %s closed during write.', self.user_id)
+            self.notifier.unregister(self)
@@ -0,0 +1,65 @@
+from datetime import datetime
+from hashlib import md5
+
+from flask import request, make_response
+from flask_login import current_user
+
+from common.cache import TTLCache
+
+
+class RenderCache:
+    """Cache of rendered pages, answering conditional requests with their ETag and Last-Modified headers.
+
+    Pages are cached per viewer since the layout depends on the logged-in user. A cached page answers a request,
+    or a 304 when the browser already has it, without any query once the viewer is loaded. A page not in the cache
+    is rendered to compute its ETag, a 304 then only sparing the transfer.
+    Browsers are asked to revalidate every time, so an invalidated page is fetched again on the next visit.
+
+    Attributes:
+        enabled: `Boolean` False to render every request, still answering conditional requests.
+        pages: `TTLCache` of tuple (etag, last_modified, body) indexed by (page key, viewer ID).
+    """
+
+    def __init__(self, enabled=True, max_size=1024):
+        """Create an empty cache.
+
+        Args:
+            enabled: `Boolean` False to render every request, when invalidations would not reach other processes.
+            max_size: maximum number of pages kept.
+        """
+        self.enabled = enabled
+        self.pages = TTLCache(0, max_size)
+
+    def serve(self, key, render):
+        """Answer a request with a page, rendered only if it is not in the cache.
+
+        Args:
+            key: hashable identifier of the page.
+            render: function returning a tuple (body, ttl) with the rendered page and the seconds to keep it,
+                0 to not cache it.
+        Returns:
+            The `Response`, 304 if the browser copy is still valid.
+        """
+        cache_key = (key, current_user.get_id() if current_user.is_authenticated else None)
+        entry = self.pages.get(cache_key)
+        if entry is None:
+            body, ttl = render()
+            entry = (md5(body.encode('utf-8')).hexdigest(), datetime.utcnow().replace(microsecond=0), body)
+            if self.enabled and ttl > 0:
+                self.pages.set(cache_key, entry, ttl)
+
+        etag, last_modified, body = entry
+        response = make_response(body)
+        response.set_etag(etag)
+        response.last_modified = last_modified
+        response.cache_control.private = True
+        response.cache_control.no_cache = True
+        return response.make_conditional(request)
+
+    def invalidate(self, key):
+        """Drop a page from the cache, for all viewers.
+
+        Args:
+            key: hashable identifier of the page.
+        """
+        self.pages.invalidate(lambda cache_key: cache_key[0] == key)
@@ -0,0 +1,39 @@
+from sqlalchemy import case, literal
+
+from common.models import User
+
+
+def escape_like(text):
+    """Escape the wildcards of a text to match it literally in a LIKE pattern, with '\\' as escape character.
+
+    Args:
+        text: `str` to escape.
+    Returns:
+        The escaped `str`.
+    """
+    return text.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_')
+
+
+def search_users(query, search):
+    """Filter users by a part of their nickname, the nicknames starting with the search being ranked first.
+
+    On Postgres the filter is served by the trigram index of the nicknames, other databases scan the table.
+    The rank is computed by the database with the same case folding as the filter, and selected with each user so
+    that the pagination cursors are taken from the rows.
+
+    Args:
+        query: `Query` of `User` to filter.
+        search: `str` searched, case insensitive.
+    Returns:
+        A tuple (query, order, row_key) to paginate the results (cf. `KeysetPagination.page`), the rows of the
+        query being tuples (user, rank).
+    """
+    if search == '':
+        query = query.add_columns(literal(0).label('rank'))
+        return query, [(User.nickname, False), (User.id, False)], lambda row: (row[0].nickname, row[0].id)
+
+    pattern = escape_like(search)
+    rank = case([(User.nickname.ilike(pattern + '%', escape='\\'), 0)], else_=1)
+    query = query.filter(User.nickname.ilike('%' + pattern + '%', escape='\\')).add_columns(rank.label('rank'))
+    order = [(rank, False), (User.nickname, False), (User.id, False)]
+    return query, order, lambda row: (row[1], row[0].nickname, row[0].id)
@@ -29,7 +29,7 @@ dazzarApp.controller('NicknameController', ['$scope', '$http', '$window', functi
     }
 }]);
 
-dazzarApp.controller('QueueController', ['$scope', '$http', '$interval', '$window', function ($scope, $http, $interval, $window) {
+dazzarApp.controller('QueueController', ['$scope', '$http', '$interval', '$timeout', '$window', function ($scope, $http, $interval, $timeout, $window) {
     $scope.queue_details = {
         is_open: false,
         user: {
@@ -99,6 +99,51 @@ dazzarApp.controller('QueueController', ['$scope', '$http', '$interval', '$windo
         }
     }
 
+    // Queue events pushed by the server, the polling is only a fallback when the socket is closed.
+    $scope.socket_open = false;
+
+    $scope.connect_queue_socket = function() {
+        if (!('WebSocket' in $window)) {
+            return;
+        }
+        var protocol = $window.location.protocol == 'https:' ? 'wss://' : 'ws://';
+        var socket = new WebSocket(protocol + $window.location.host + '/ws/ladder/queue');
+
+        socket.onopen = function() {
+            $scope.$apply(function() {
+                $scope.socket_open = true;
+            });
+        };
+        socket.onmessage = function(event) {
+            var message = JSON.parse(event.data);
+            $scope.$apply(function() {
+                if (message.type == 'queue') {
+                    if (!message.is_open) {
+                        $scope.queue_details.user.in_queue = false;
+                    }
+                    $scope.queue_details.is_open = message.is_open;
+                    $scope.queue_details.queues = message.queues;
+                } else if (message.type == 'match') {
+                    $scope.queue_details.user.game = message.game;
+                    $scope.redirect_if_game();
+                }
+            });
+        };
+        socket.onclose = function() {
+            $scope.$apply(function() {
+                $scope.socket_open = false;
+            });
+            $timeout($scope.connect_queue_socket, 15000);
+        };
+    };
+
+    $scope.poll_queue_details = function() {
+        if (!$scope.socket_open) {
+            $scope.refresh_queue_details();
+        }
+    };
+
     $scope.refresh_queue_details()
-    $interval($scope.refresh_queue_details, 15000);
+    $scope.connect_queue_socket()
+    $interval($scope.poll_queue_details, 15000);
 }]);
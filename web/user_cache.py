@@ -0,0 +1,63 @@
+from sqlalchemy import event
+
+from common.cache import TTLCache
+from common.models import db, load_profile, User, ProfileScanInfo
+
+
+class UserCache:
+    """Short lived identity cache of the logged-in users, sparing the user loading queries of every request.
+
+    Users are cached detached from any session, with their scan info and permissions, and merged without query into
+    the session of each request. An entry is dropped as soon as this process flushes a change of the user.
+    Changes made by other processes, like the bots ending a match, are visible after the cache delay.
+
+    Attributes:
+        users: `TTLCache` of detached `User` indexed by user ID.
+    """
+
+    def __init__(self, ttl):
+        """Create an empty cache, listening to the user changes.
+
+        Args:
+            ttl: seconds a user is kept.
+        """
+        self.users = TTLCache(ttl)
+        event.listen(User, 'after_update', self._user_changed)
+        event.listen(User, 'after_delete', self._user_changed)
+        event.listen(ProfileScanInfo, 'after_insert', self._user_changed)
+        event.listen(ProfileScanInfo, 'after_update', self._user_changed)
+
+    def get(self, user_id):
+        """Obtain a user attached to the current session.
+
+        Args:
+            user_id: Unique `User` identifier.
+        Returns:
+            The `User`, None if it does not exist.
+        """
+        user = self.users.get(user_id)
+        if user is None:
+            user = User.query.options(*load_profile('user_with_scan_info')).filter_by(id=user_id).first()
+            if user is None:
+                return None
+            User.load_permissions([user])
+            db.session().expunge(user)
+            if user.profile_scan_info is not None:
+                db.session().expunge(user.profile_scan_info)
+            self.users.set(user_id, user)
+
+        attached = db.session().merge(user, load=False)
+        attached._permission_names = user._permission_names
+        return attached
+
+    def forget(self, user_id):
+        """Drop a user from the cache.
+
+        Args:
+            user_id: Unique `User` identifier.
+        """
+        self.users.pop(user_id)
+
+    def _user_changed(self, mapper, connection, target):
+        """Mapper event dropping the user changed, `User` and `ProfileScanInfo` sharing the user ID."""
+        self.forget(target.id)
@@ -3,32 +3,57 @@
 #####################
 
 import locale
+from time import perf_counter
 
 locale.setlocale(locale.LC_ALL, 'fr_FR.utf8')
 
-from flask import Flask, render_template
+from flask import Flask, g, render_template, request
 from flask_login import LoginManager
 from flask_migrate import Migrate
 from flask_openid import OpenID
 from flaskext.markdown import Markdown
+from sqlalchemy import event
 
 from common.cfg.configuration import load_config
-from common.job_queue import QueueAdapter
-from common.models import db
+from common.job_queue import make_job_queue
+from common.models import db, engine_options, User, ProfileScanInfo, Setting
 from common.helpers import _jinja2_filter_french_date
+from common.profiler import QueryProfiler, PROFILER_SETTING
+import common.metrics as metrics
+from web.queue_notifier import QueueNotifier, QueueSocketHandler
+from web.matchmaking import make_matchmaker
+from web.user_cache import UserCache
+from web.render_cache import RenderCache
 
 
 def create_app():
     """Factory to create the Flask application with configuration and database init."""
     app = Flask(__name__)
     load_config(app.config)
+    app.config['SQLALCHEMY_ENGINE_OPTIONS'] = engine_options(app.config)
     db.init_app(app)
     return app
 
 app = create_app()
 migrate = Migrate(app, db)
 Markdown(app)
-job_queue = QueueAdapter(app.config['RABBITMQ_LOGIN'], app.config['RABBITMQ_PASSWORD'])
+job_queue = make_job_queue(app)
+queue_notifier = QueueNotifier(app)
+matchmaker = make_matchmaker(app)
+# Other workers would not see the invalidations, the caches are only used with a single web worker
+user_cache = UserCache(app.config['USER_CACHE_TTL'] if app.config['WEB_WORKERS'] == 1 else 0)
+render_cache = RenderCache(app.config['WEB_WORKERS'] == 1)
+profiler = QueryProfiler(app, app.config['QUERY_PROFILER'], app.config['SLOW_QUERY_THRESHOLD'])
+
+
+def _user_page_changed(mapper, connection, target):
+    """Mapper event dropping the page of the user changed, `User` and `ProfileScanInfo` sharing the user ID."""
+    render_cache.invalidate(('user', target.id))
+
+event.listen(User, 'after_update', _user_page_changed)
+event.listen(User, 'after_delete', _user_page_changed)
+event.listen(ProfileScanInfo, 'after_insert', _user_page_changed)
+event.listen(ProfileScanInfo, 'after_update', _user_page_changed)
 
 oid = OpenID(app, store_factory=lambda: None)
 login_manager = LoginManager()
@@ -46,11 +71,13 @@ import web.blueprints.login.login as login_blueprint
 import web.blueprints.user.user as user_blueprint
 import web.blueprints.ladder.ladder as ladder_blueprint
 import web.blueprints.mix.mix as mix_blueprint
+import web.blueprints.admin.admin as admin_blueprint
 
-app.register_blueprint(login_blueprint.make_blueprint(oid, login_manager))
-app.register_blueprint(user_blueprint.make_blueprint(job_queue))
-app.register_blueprint(ladder_blueprint.make_blueprint(job_queue))
-app.register_blueprint(mix_blueprint.make_blueprint())
+app.register_blueprint(login_blueprint.make_blueprint(oid, login_manager, user_cache, job_queue))
+app.register_blueprint(user_blueprint.make_blueprint(job_queue, render_cache))
+app.register_blueprint(ladder_blueprint.make_blueprint(job_queue, queue_notifier, matchmaker, render_cache))
+app.register_blueprint(mix_blueprint.make_blueprint(render_cache))
+app.register_blueprint(admin_blueprint.make_blueprint(profiler))
 
 
 ##########
@@ -64,29 +91,114 @@ def index():
     return render_template('index.html')
 
 
+@app.before_request
+def start_request_timer():
+    """Remember when the request started, for its duration in the metrics."""
+    g.request_started = perf_counter()
+
+
+@app.after_request
+def record_request_metrics(response):
+    """Count the request and its duration in the metrics, by endpoint."""
+    endpoint = request.endpoint or 'none'
+    metrics.HTTP_REQUESTS.inc(endpoint=endpoint, method=request.method, status=response.status_code)
+    if 'request_started' in g:
+        metrics.HTTP_REQUEST_SECONDS.observe(perf_counter() - g.request_started, endpoint=endpoint)
+    return response
+
+
 ############################
 # Start Tornado Web Server #
 ############################
 
+# Seconds between two synchronizations of a web worker with the state shared in the database
+WORKER_SYNC_INTERVAL = 5
+
+
 def refresh_rabbitmq(io_loop):
-    """Ping the rabbitmq to avoid TCP connection closing.
+    """Ping the rabbitmq to avoid TCP connection closing, and read the depth of the job queue for the metrics.
 
     Args:
         io_loop: Tornado IO_LOOP the rabbitmq ping process is linked to.
     """
-    global job_queue
-    job_queue.refresh()
+    try:
+        job_queue.refresh()
+        depth = job_queue.depth()
+        if depth is not None:
+            metrics.JOB_QUEUE_DEPTH.set(depth)
+    finally:
+        io_loop.call_later(60, refresh_rabbitmq, io_loop)
 
-    loop.call_later(60, refresh_rabbitmq, io_loop)
+
+def sync_worker(io_loop):
+    """Reload the state changed by the other web workers, and push it to the browsers connected to this worker.
+
+    Args:
+        io_loop: Tornado IO_LOOP the synchronization process is linked to.
+    """
+    try:
+        with app.app_context():
+            settings = dict(db.session().query(Setting.name, Setting.value)
+                            .filter(Setting.name.in_(['VIP_LADDER_OPEN', PROFILER_SETTING]))
+                            .all())
+            if 'VIP_LADDER_OPEN' in settings:
+                app.config['VIP_LADDER_OPEN'] = settings['VIP_LADDER_OPEN'] == '1'
+            if PROFILER_SETTING in settings:
+                profiler.enabled = settings[PROFILER_SETTING] == '1'
+            queues = matchmaker.counts()
+
+            users = queue_notifier.connected_users()
+            current_matches = {}
+            if len(users) != 0:
+                current_matches = dict(db.session().query(User.id, User.current_match)
+                                       .filter(User.id.in_(users))
+                                       .filter(User.current_match.isnot(None))
+                                       .all())
+            db.session.remove()
+
+        queue_notifier.publish_queue_status(app.config['VIP_LADDER_OPEN'], queues)
+        queue_notifier.publish_current_matches(current_matches)
+    finally:
+        io_loop.call_later(WORKER_SYNC_INTERVAL, sync_worker, io_loop)
 
 
 if __name__ == "__main__":
     from tornado.wsgi import WSGIContainer
+    from tornado.web import Application, FallbackHandler
     from tornado.httpserver import HTTPServer
     from tornado.ioloop import IOLoop
-
-    http_server = HTTPServer(WSGIContainer(app))
-    http_server.listen(8000)
-    loop = IOLoop.instance()
+    from tornado.netutil import bind_sockets
+
+    tornado_app = Application([
+        (r'/ws/ladder/queue', QueueSocketHandler, dict(notifier=queue_notifier)),
+        (r'.*', FallbackHandler, dict(fallback=WSGIContainer(app)))
+    ])
+    http_server = HTTPServer(tornado_app)
+    http_server.bind(8000)
+    # Metrics on their own port, not published with the site
+    metrics_port = app.config['WEB_METRICS_PORT']
+    metrics_sockets = bind_sockets(metrics_port, app.config['WEB_METRICS_HOST']) if metrics_port != 0 else []
+
+    # Fork the workers (one per CPU if 0), each one serving the requests on its own IO_LOOP
+    workers = app.config['WEB_WORKERS']
+    http_server.start(workers)
+    if workers != 1:
+        # Connections opened before the fork can not be shared between processes
+        with app.app_context():
+            db.engine.dispose()
+        job_queue.reset()
+
+    if len(metrics_sockets) != 0:
+        metrics_app = Application([(r'.*', FallbackHandler, dict(fallback=WSGIContainer(metrics.metrics_application)))])
+        HTTPServer(metrics_app).add_sockets(metrics_sockets)
+
+    # Gauges of the data held by the web process, read when the metrics are rendered
+    metrics.LADDER_QUEUE_PLAYERS.function = lambda: {(name,): count for name, count in matchmaker.counts().items()}
+
+    loop = IOLoop.current()
+    matchmaker.start()
+    queue_notifier.attach(loop)
     refresh_rabbitmq(loop)
+    if workers != 1:
+        sync_worker(loop)
     loop.start()